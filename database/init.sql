@@ -76,6 +76,7 @@ CREATE INDEX idx_watchlist_symbol ON user_watchlist(symbol);
 CREATE TABLE stock_data (
     time TIMESTAMPTZ NOT NULL,
     symbol VARCHAR(20) NOT NULL,
+    interval VARCHAR(8) NOT NULL DEFAULT '1d',
     open NUMERIC(12,4) NOT NULL,
     high NUMERIC(12,4) NOT NULL,
     low NUMERIC(12,4) NOT NULL,
@@ -84,7 +85,10 @@ CREATE TABLE stock_data (
     adjusted_close NUMERIC(12,4),
     dividend_amount NUMERIC(12,4) DEFAULT 0,
     split_coefficient NUMERIC(8,4) DEFAULT 1,
+    -- native: barra do provider; rollup: agregada de um intervalo mais fino
+    source VARCHAR(10) NOT NULL DEFAULT 'native',
     
+    CONSTRAINT valid_source CHECK (source IN ('native', 'rollup')),
     CONSTRAINT valid_prices CHECK (
         open > 0 AND high > 0 AND low > 0 AND 
         close > 0 AND volume >= 0
@@ -100,13 +104,14 @@ CREATE TABLE stock_data (
 SELECT create_hypertable('stock_data', 'time', if_not_exists => TRUE);
 
 -- Índices
-CREATE INDEX idx_stock_data_symbol_time ON stock_data (symbol, time DESC);
+-- Único: chave do upsert (INSERT ... ON CONFLICT (symbol, interval, time))
+CREATE UNIQUE INDEX idx_stock_data_symbol_interval_time ON stock_data (symbol, interval, time DESC);
 CREATE INDEX idx_stock_data_time ON stock_data (time DESC);
 
 -- Compressão (dados > 7 dias)
 ALTER TABLE stock_data SET (
     timescaledb.compress,
-    timescaledb.compress_segmentby = 'symbol'
+    timescaledb.compress_segmentby = 'symbol, interval'
 );
 
 SELECT add_compression_policy('stock_data', INTERVAL '7 days', if_not_exists => TRUE);
@@ -140,6 +145,14 @@ CREATE TABLE technical_indicators (
 SELECT create_hypertable('technical_indicators', 'time', if_not_exists => TRUE);
 CREATE INDEX idx_tech_indicators_symbol_time ON technical_indicators (symbol, time DESC);
 
+-- Estado incremental dos indicadores (sementes das EMAs, janela de fechos, OBV)
+CREATE TABLE indicator_state (
+    symbol VARCHAR(20) PRIMARY KEY,
+    last_time TIMESTAMPTZ NOT NULL,
+    state JSONB NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
 -- ============================================
 -- 6. PREDICTIONS
 -- ============================================
@@ -212,6 +225,87 @@ CREATE TABLE data_collection_logs (
 CREATE INDEX idx_collection_logs_date ON data_collection_logs(completed_at DESC);
 CREATE INDEX idx_collection_logs_status ON data_collection_logs(status);
 
+-- ============================================
+-- 9. COLLECTION WATERMARKS (coleta incremental)
+-- ============================================
+CREATE TABLE collection_watermarks (
+    symbol VARCHAR(20) NOT NULL,
+    interval VARCHAR(8) NOT NULL,
+    last_time TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (symbol, interval)
+);
+
+-- ============================================
+-- 10. MARKET SNAPSHOT / SECTOR AGGREGATES (materializados após coleta)
+-- ============================================
+CREATE TABLE market_snapshot (
+    symbol VARCHAR(20) PRIMARY KEY,
+    sector VARCHAR(100),
+    time TIMESTAMPTZ NOT NULL,
+    close NUMERIC(12,4) NOT NULL,
+    prev_close NUMERIC(12,4),
+    change NUMERIC(12,4),
+    change_percent NUMERIC(10,4),
+    volume BIGINT,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX idx_market_snapshot_change ON market_snapshot (change_percent DESC NULLS LAST);
+CREATE INDEX idx_market_snapshot_volume ON market_snapshot (volume DESC NULLS LAST);
+CREATE INDEX idx_market_snapshot_sector ON market_snapshot (sector);
+
+CREATE TABLE sector_aggregates (
+    sector VARCHAR(100) PRIMARY KEY,
+    symbols INTEGER NOT NULL,
+    avg_change_percent NUMERIC(10,4),
+    total_volume BIGINT,
+    gainers INTEGER,
+    losers INTEGER,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- ============================================
+-- 11. ROLLING STATS (mantidas incrementalmente a cada escrita)
+-- ============================================
+-- window_days = 0 representa todo o histórico
+CREATE TABLE rolling_stats (
+    symbol VARCHAR(20) NOT NULL,
+    window_days INTEGER NOT NULL,
+    data_points INTEGER NOT NULL,
+    average_price NUMERIC(14,6),
+    min_price NUMERIC(12,4),
+    max_price NUMERIC(12,4),
+    average_volume NUMERIC(20,2),
+    volatility NUMERIC(14,6),
+    first_time TIMESTAMPTZ,
+    last_time TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (symbol, window_days)
+);
+
+-- ============================================
+-- 12. SCHEDULER JOB RUNS (histórico do scheduler)
+-- ============================================
+CREATE TABLE scheduler_job_runs (
+    id BIGSERIAL PRIMARY KEY,
+    job_name VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    scheduled_at TIMESTAMPTZ NOT NULL,
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    duration_seconds NUMERIC(10,3),
+    jitter_seconds NUMERIC(8,3),
+    symbols INTEGER,
+    rows_inserted INTEGER,
+    rows_updated INTEGER,
+    errors INTEGER,
+    error_message TEXT,
+    details JSONB
+);
+
+CREATE INDEX idx_scheduler_job_runs_name ON scheduler_job_runs (job_name, scheduled_at DESC);
+
 -- ============================================
 -- VIEWS
 -- ============================================
@@ -225,6 +319,7 @@ SELECT DISTINCT ON (symbol)
     close,
     volume
 FROM stock_data
+WHERE interval = '1d'
 ORDER BY symbol, time DESC;
 
 CREATE OR REPLACE VIEW daily_stock_stats AS
@@ -238,6 +333,7 @@ SELECT
     SUM(volume) as volume,
     COUNT(*) as data_points
 FROM stock_data
+WHERE interval = '1d'
 GROUP BY symbol, DATE(time)
 ORDER BY symbol, date DESC;
 
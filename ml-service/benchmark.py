@@ -0,0 +1,286 @@
+# ml-service/benchmark.py
+# Benchmarks de performance do ml-service (correr manualmente)
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from bulk_writer import BulkUpsertWriter
+from database import get_engine
+from providers import FaultInjectingProvider, FixtureProvider
+from resilience import CircuitOpenError, ResilientProvider
+
+
+def generate_fixtures(
+    directory: str,
+    symbols: int = 50,
+    days: int = 365,
+    interval: str = "1d",
+    seed: int = 42
+) -> list:
+    """
+    Gera fixtures OHLCV sintéticas (random walk) para benchmarks
+
+    Returns:
+        Lista de símbolos gerados
+    """
+    rng = np.random.default_rng(seed)
+    freq = '1h' if interval == '1h' else '1D'
+    periods = days * 7 if interval == '1h' else days
+    times = pd.date_range(end=pd.Timestamp.now(tz='UTC').floor('D'), periods=periods, freq=freq)
+
+    names = [f"SYM{i:03d}" for i in range(symbols)]
+    for symbol in names:
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(times))))
+        open_ = close * (1 + rng.normal(0, 0.002, len(times)))
+        high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.01, len(times)))
+        low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.01, len(times)))
+        volume = rng.integers(1_000_000, 50_000_000, len(times))
+
+        pd.DataFrame({
+            'time': times,
+            'open': open_,
+            'high': high,
+            'low': low,
+            'close': close,
+            'volume': volume
+        }).to_csv(os.path.join(directory, f"{symbol}_{interval}.csv"), index=False)
+
+    return names
+
+
+def bench_fetch(args):
+    """Compara pedidos por símbolo vs pedidos em bulk"""
+    with tempfile.TemporaryDirectory() as directory:
+        symbols = generate_fixtures(directory, args.symbols)
+
+        provider = FixtureProvider(directory, latency=args.latency)
+        start = time.perf_counter()
+        for symbol in symbols:
+            provider.history(symbol, period="5d")
+        single = time.perf_counter() - start
+        single_requests = provider.requests
+
+        provider = FixtureProvider(directory, latency=args.latency)
+        start = time.perf_counter()
+        provider.history_bulk(symbols, period="5d")
+        bulk = time.perf_counter() - start
+
+        print(f"Per-symbol: {single_requests} requests in {single:.2f}s")
+        print(f"Bulk:       {provider.requests} requests in {bulk:.2f}s")
+
+
+def bench_resilience(args):
+    """Coleta por símbolo durante uma falha do provider, sem e com a camada resiliente"""
+    with tempfile.TemporaryDirectory() as directory:
+        symbols = generate_fixtures(directory, args.symbols)
+        delisted = [f"GONE{i}" for i in range(5)]
+
+        for label in ('plain', 'resilient'):
+            faulty = FaultInjectingProvider(
+                FixtureProvider(directory),
+                failure_latency=args.latency,
+                empty_symbols=delisted,
+                seed=1
+            )
+            provider = faulty
+            if label == 'resilient':
+                provider = ResilientProvider(faulty)
+                provider.retry.base_delay = 0.05
+                provider.breaker.reset_timeout = 1.0
+
+            # Outage a meio da coleta; símbolos deslistados pedidos duas vezes
+            faulty.outage(args.outage)
+            start = time.perf_counter()
+            fetched = errors = 0
+            for symbol in symbols + delisted + delisted:
+                try:
+                    if provider.history(symbol, period="5d") is not None:
+                        fetched += 1
+                except (CircuitOpenError, Exception):
+                    errors += 1
+            elapsed = time.perf_counter() - start
+
+            print(
+                f"{label:10s} {fetched} fetched, {errors} failed, "
+                f"{faulty.requests} upstream requests in {elapsed:.2f}s"
+            )
+            if label == 'resilient':
+                print(provider.stats())
+
+
+def synthetic_bars(rows: int, symbols: int = 100, seed: int = 7) -> pd.DataFrame:
+    """Barras OHLCV sintéticas válidas (high >= open/close >= low)"""
+    rng = np.random.default_rng(seed)
+    per_symbol = rows // symbols
+    times = pd.date_range(end=pd.Timestamp.now(tz='UTC').floor('h'), periods=per_symbol, freq='1h')
+
+    frames = []
+    for i in range(symbols):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, per_symbol)))
+        open_ = close * (1 + rng.normal(0, 0.001, per_symbol))
+        frames.append(pd.DataFrame({
+            'time': times,
+            'symbol': f"BENCH{i:03d}",
+            'open': open_.round(4),
+            'high': (np.maximum(open_, close) * 1.002).round(4),
+            'low': (np.minimum(open_, close) * 0.998).round(4),
+            'close': close.round(4),
+            'volume': rng.integers(1_000, 1_000_000, per_symbol)
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def legacy_save(engine, df: pd.DataFrame, table: str):
+    """Caminho antigo: DELETE por intervalo + to_sql(method='multi')"""
+    for symbol, group in df.groupby('symbol'):
+        with engine.connect() as conn:
+            conn.execute(
+                text(f"""
+                    DELETE FROM {table}
+                    WHERE symbol = :symbol
+                    AND time BETWEEN :min_date AND :max_date
+                """),
+                {
+                    'symbol': symbol,
+                    'min_date': group['time'].min(),
+                    'max_date': group['time'].max()
+                }
+            )
+            conn.commit()
+
+        group.to_sql(
+            table,
+            engine,
+            if_exists='append',
+            index=False,
+            method='multi',
+            chunksize=1000
+        )
+
+
+def bench_writer(args):
+    """Compara DELETE + to_sql com COPY + upsert numa tabela de benchmark"""
+    engine = get_engine()
+    table = 'bench_stock_data'
+    df = synthetic_bars(args.rows)
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        conn.execute(text(f"CREATE TABLE {table} (LIKE stock_data INCLUDING ALL)"))
+
+    try:
+        writer = BulkUpsertWriter(engine)
+        for label, save in (
+            ('legacy insert', lambda: legacy_save(engine, df, table)),
+            ('legacy rewrite', lambda: legacy_save(engine, df, table)),
+        ):
+            start = time.perf_counter()
+            save()
+            print(f"{label:16s} {len(df):,} rows in {time.perf_counter() - start:.2f}s")
+
+        with engine.begin() as conn:
+            conn.execute(text(f"TRUNCATE {table}"))
+
+        for label in ('copy insert', 'copy rewrite'):
+            start = time.perf_counter()
+            result = writer.upsert_stock_data(df, table)
+            print(
+                f"{label:16s} {len(df):,} rows in {time.perf_counter() - start:.2f}s "
+                f"{result}"
+            )
+
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+
+async def _load_test(url: str, clients: int, requests: int) -> tuple:
+    """Dispara `requests` pedidos GET com `clients` clientes concorrentes"""
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(url)
+
+    async def worker(client):
+        nonlocal errors
+        while not queue.empty():
+            target = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.get(target)
+                if response.status_code >= 500:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=clients)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        await asyncio.gather(*(worker(client) for _ in range(clients)))
+
+    return latencies, errors
+
+
+def bench_api(args):
+    """Latência p50/p99 de um endpoint com muitos clientes concorrentes"""
+    url = args.url.rstrip('/') + args.path
+    start = time.perf_counter()
+    latencies, errors = asyncio.run(_load_test(url, args.clients, args.requests))
+    elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000
+    print(f"{url} - {args.clients} clients, {len(ms)} requests, {errors} errors")
+    print(f"Throughput: {len(ms) / elapsed:.1f} req/s")
+    print(
+        f"p50={np.percentile(ms, 50):.1f}ms "
+        f"p90={np.percentile(ms, 90):.1f}ms "
+        f"p99={np.percentile(ms, 99):.1f}ms "
+        f"max={ms.max():.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='BullEye ML Service benchmarks')
+    parser.add_argument(
+        '--mode',
+        choices=['fetch', 'writer', 'api', 'resilience'],
+        default='fetch',
+        help='Benchmark a executar'
+    )
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument(
+        '--outage',
+        type=float,
+        default=2.0,
+        help='Duração (segundos) da falha injetada no modo resilience'
+    )
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--path', default='/stocks/AAPL/latest')
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=0.3,
+        help='Latência simulada por pedido ao provider (segundos)'
+    )
+
+    args = parser.parse_args()
+
+    if args.mode == 'fetch':
+        bench_fetch(args)
+    elif args.mode == 'writer':
+        bench_writer(args)
+    elif args.mode == 'api':
+        bench_api(args)
+    elif args.mode == 'resilience':
+        bench_resilience(args)
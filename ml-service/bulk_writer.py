@@ -0,0 +1,145 @@
+# ml-service/bulk_writer.py
+# Escrita em massa via COPY + INSERT ... ON CONFLICT numa única transação
+import io
+import logging
+import uuid
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+STOCK_DATA_COLUMNS = ['time', 'symbol', 'interval', 'open', 'high', 'low', 'close', 'volume', 'source']
+STOCK_DATA_KEY = ['symbol', 'interval', 'time']
+
+
+class BulkUpsertWriter:
+    """
+    Upsert em massa para PostgreSQL
+
+    As linhas são enviadas por COPY para uma tabela temporária e depois
+    fundidas na tabela de destino com INSERT ... ON CONFLICT DO UPDATE.
+    Tudo corre numa só transação: uma falha não deixa buracos nos dados.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def upsert(
+        self,
+        df: pd.DataFrame,
+        table: str,
+        columns: List[str],
+        conflict_columns: List[str],
+        update_columns: Optional[List[str]] = None,
+        update_where: Optional[str] = None
+    ) -> Dict[str, int]:
+        """
+        Insere ou atualiza as linhas do DataFrame
+
+        Args:
+            df: DataFrame com pelo menos `columns`
+            table: Tabela de destino
+            columns: Colunas a escrever
+            conflict_columns: Colunas do índice único usado no ON CONFLICT
+            update_columns: Colunas atualizadas em conflito (default: restantes)
+            update_where: Condição extra sobre a linha existente para a atualizar
+
+        Returns:
+            Dicionário com linhas inserted, updated e unchanged
+        """
+        if df is None or df.empty:
+            return {'inserted': 0, 'updated': 0, 'unchanged': 0}
+
+        if update_columns is None:
+            update_columns = [c for c in columns if c not in conflict_columns]
+
+        # Linhas duplicadas no mesmo lote fazem o ON CONFLICT falhar
+        rows = df[columns].drop_duplicates(subset=conflict_columns, keep='last')
+
+        buffer = io.StringIO()
+        rows.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+
+        staging = f"staging_{table.replace('.', '_')}_{uuid.uuid4().hex[:8]}"
+        cols = ', '.join(columns)
+        conflict = ', '.join(conflict_columns)
+
+        if update_columns:
+            assignments = ', '.join(f"{c} = EXCLUDED.{c}" for c in update_columns)
+            target = ', '.join(f"{table}.{c}" for c in update_columns)
+            excluded = ', '.join(f"EXCLUDED.{c}" for c in update_columns)
+            on_conflict = (
+                f"DO UPDATE SET {assignments} "
+                # Não reescrever linhas iguais (menos WAL)
+                f"WHERE ({target}) IS DISTINCT FROM ({excluded})"
+            )
+            if update_where:
+                on_conflict += f" AND {update_where}"
+        else:
+            on_conflict = "DO NOTHING"
+
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+
+            cursor.execute(
+                f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+                f"SELECT {cols} FROM {table} WITH NO DATA"
+            )
+            cursor.copy_expert(
+                f"COPY {staging} ({cols}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+            cursor.execute(f"""
+                WITH upserted AS (
+                    INSERT INTO {table} ({cols})
+                    SELECT {cols} FROM {staging}
+                    ON CONFLICT ({conflict}) {on_conflict}
+                    RETURNING (xmax = 0) AS inserted
+                )
+                SELECT
+                    COUNT(*) FILTER (WHERE inserted),
+                    COUNT(*) FILTER (WHERE NOT inserted)
+                FROM upserted
+            """)
+            inserted, updated = cursor.fetchone()
+
+            raw.commit()
+            cursor.close()
+
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+        result = {
+            'inserted': inserted,
+            'updated': updated,
+            'unchanged': len(rows) - inserted - updated
+        }
+        logger.debug(f"Upsert into {table}: {result}")
+        return result
+
+    def upsert_stock_data(
+        self,
+        df: pd.DataFrame,
+        table: str = 'stock_data',
+        interval: str = '1d',
+        source: str = 'native'
+    ) -> Dict[str, int]:
+        """
+        Upsert de barras OHLCV (chave symbol, interval, time)
+
+        Barras agregadas (source='rollup') nunca substituem barras do
+        provider; as do provider substituem sempre as agregadas.
+        """
+        rows = df.assign(interval=interval, source=source)[STOCK_DATA_COLUMNS].copy()
+        rows['time'] = pd.to_datetime(rows['time'])
+        rows['volume'] = rows['volume'].fillna(0).astype('int64')
+
+        update_where = f"{table}.source = 'rollup'" if source == 'rollup' else None
+        return self.upsert(
+            rows, table, STOCK_DATA_COLUMNS, STOCK_DATA_KEY, update_where=update_where
+        )
@@ -0,0 +1,295 @@
+# ml-service/cache.py
+# Cache read-through em dois níveis: LRU em memória (TTL) + Redis
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'bulleye'
+INVALIDATION_CHANNEL = f'{KEY_PREFIX}:cache:invalidate'
+
+
+def symbol_prefix(symbol: str) -> str:
+    return f"{KEY_PREFIX}:stock:{symbol}:"
+
+
+def namespace_prefix(namespace: str) -> str:
+    return f"{KEY_PREFIX}:{namespace}:"
+
+
+def latest_key(symbol: str, interval: str = '1d') -> str:
+    return f"{symbol_prefix(symbol)}latest:{interval}"
+
+
+def data_key(
+    symbol: str,
+    start_date: Optional[str],
+    end_date: Optional[str],
+    limit: int,
+    interval: str = '1d'
+) -> str:
+    return f"{symbol_prefix(symbol)}data:{interval}:{start_date or '-'}:{end_date or '-'}:{limit}"
+
+
+class LRUTTLCache:
+    """LRU em memória com TTL por entrada (thread-safe)"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Devolve (encontrado, valor)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return False, None
+
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete_prefix(self, prefix: str) -> int:
+        with self._lock:
+            keys = [k for k in self._data if k.startswith(prefix)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TwoTierCache:
+    """
+    Cache local (LRU + TTL) à frente do Redis
+
+    Sem REDIS_URL (ou com o Redis em baixo) funciona só com o nível local.
+    As chaves de cada símbolo ficam registadas num set no Redis para que
+    a invalidação apague exatamente as chaves desse símbolo; os outros
+    processos limpam o nível local via pub/sub.
+
+    Args:
+        redis_client: Cliente Redis (ou fakeredis) - default a partir de REDIS_URL
+        local_maxsize: Máximo de entradas em memória
+        local_ttl: TTL do nível local (segundos)
+        redis_ttl: TTL no Redis (segundos)
+    """
+
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis] = None,
+        local_maxsize: int = 1024,
+        local_ttl: float = 30.0,
+        redis_ttl: int = 300
+    ):
+        self.local = LRUTTLCache(local_maxsize, local_ttl)
+        self.redis = redis_client
+        self.redis_ttl = redis_ttl
+
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+        self.counters = {
+            'local_hits': 0,
+            'redis_hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'invalidations': 0,
+            'redis_errors': 0
+        }
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get_local(self, key: str):
+        """Consulta só o nível local (barato, pode correr no event loop)"""
+        found, value = self.local.get(key)
+        if found:
+            self._count('local_hits')
+        return found, value
+
+    def get(self, key: str):
+        """Devolve (encontrado, valor) consultando memória e depois Redis"""
+        found, value = self.get_local(key)
+        if found:
+            return found, value
+
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(key)
+                if raw is not None:
+                    value = json.loads(raw)
+                    self.local.set(key, value)
+                    self._count('redis_hits')
+                    return True, value
+            except redis.RedisError as e:
+                self._count('redis_errors')
+                logger.warning(f"Cache get error: {str(e)}")
+
+        self._count('misses')
+        return False, None
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        symbol: Optional[str] = None,
+        prefix: Optional[str] = None
+    ):
+        """
+        Guarda nos dois níveis
+
+        `symbol` (ou `prefix`) regista a chave no grupo a invalidar em conjunto
+        """
+        self.local.set(key, value)
+        self._count('sets')
+
+        if symbol:
+            prefix = symbol_prefix(symbol)
+
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline()
+                pipe.setex(key, self.redis_ttl, json.dumps(value))
+                if prefix:
+                    index = f"{prefix}keys"
+                    pipe.sadd(index, key)
+                    pipe.expire(index, self.redis_ttl)
+                pipe.execute()
+            except redis.RedisError as e:
+                self._count('redis_errors')
+                logger.warning(f"Cache set error: {str(e)}")
+
+    def get_or_load(
+        self,
+        key: str,
+        loader: Callable,
+        *args,
+        symbol: Optional[str] = None,
+        prefix: Optional[str] = None
+    ):
+        """Read-through: devolve o valor em cache ou chama loader(*args)"""
+        found, value = self.get(key)
+        if found:
+            return value
+
+        value = loader(*args)
+        # Não guardar respostas vazias (404)
+        if value:
+            self.set(key, value, symbol=symbol, prefix=prefix)
+        return value
+
+    def invalidate_symbol(self, symbol: str):
+        """Apaga todas as chaves de um símbolo (chamado após novas barras)"""
+        self.invalidate_prefix(symbol_prefix(symbol))
+
+    def invalidate_prefix(self, prefix: str):
+        """Apaga todas as chaves registadas sob um prefixo"""
+        self.local.delete_prefix(prefix)
+        self._count('invalidations')
+
+        if self.redis is not None:
+            try:
+                index = f"{prefix}keys"
+                keys = self.redis.smembers(index)
+                pipe = self.redis.pipeline()
+                if keys:
+                    pipe.delete(*keys)
+                pipe.delete(index)
+                pipe.publish(INVALIDATION_CHANNEL, prefix)
+                pipe.execute()
+            except redis.RedisError as e:
+                self._count('redis_errors')
+                logger.warning(f"Cache invalidation error: {str(e)}")
+
+    def start_invalidation_listener(self):
+        """Limpa o nível local quando outro processo invalida um prefixo"""
+        if self.redis is None or self._listener is not None:
+            return
+
+        def listen():
+            while True:
+                try:
+                    pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(INVALIDATION_CHANNEL)
+                    while True:
+                        message = pubsub.get_message(timeout=1.0)
+                        if not message:
+                            continue
+                        data = message.get('data')
+                        if isinstance(data, bytes):
+                            data = data.decode()
+                        self.local.delete_prefix(data)
+                except redis.RedisError as e:
+                    logger.warning(f"Cache listener error: {str(e)}")
+                    time.sleep(5)
+
+        self._listener = threading.Thread(
+            target=listen,
+            name='cache-invalidation',
+            daemon=True
+        )
+        self._listener.start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+
+        lookups = counters['local_hits'] + counters['redis_hits'] + counters['misses']
+        hits = counters['local_hits'] + counters['redis_hits']
+        return {
+            **counters,
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+            'local_entries': len(self.local),
+            'redis_enabled': self.redis is not None
+        }
+
+
+_cache: Optional[TwoTierCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TwoTierCache:
+    """Cache partilhada do processo (configurada por variáveis de ambiente)"""
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                client = None
+                redis_url = os.getenv('REDIS_URL')
+                if redis_url:
+                    client = redis.Redis.from_url(
+                        redis_url,
+                        socket_timeout=float(os.getenv('CACHE_REDIS_TIMEOUT', '0.25'))
+                    )
+
+                _cache = TwoTierCache(
+                    redis_client=client,
+                    local_maxsize=int(os.getenv('CACHE_LOCAL_MAXSIZE', '1024')),
+                    local_ttl=float(os.getenv('CACHE_LOCAL_TTL', '30')),
+                    redis_ttl=int(os.getenv('CACHE_REDIS_TTL', '300'))
+                )
+
+    return _cache
@@ -0,0 +1,232 @@
+# ml-service/collection_jobs.py
+# Jobs de coleta em background: IDs, progresso por símbolo, deduplicação e limite global
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from data_collector import StockDataCollector
+
+logger = logging.getLogger(__name__)
+
+# Modos de coleta: período fixo ou a partir da watermark de cada símbolo
+PERIOD = 'period'
+INCREMENTAL = 'incremental'
+
+
+class CollectionJob:
+    """Estado de um job de coleta (progresso atualizado pelas threads do collector)"""
+
+    def __init__(self, symbols: List[str], period: str, interval: str,
+                 mode: str = PERIOD, source: str = 'api'):
+        self.id = uuid.uuid4().hex
+        self.symbols = symbols
+        self.period = period
+        self.interval = interval
+        self.mode = mode
+        self.source = source
+        self.status = 'queued'
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.progress: Dict[str, Dict] = {symbol: {'status': 'pending'} for symbol in symbols}
+        self.coalesced: Dict[str, str] = {}
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.future: Optional[Future] = None
+        self._lock = threading.Lock()
+
+    def record(self, symbol: str, result: Dict):
+        """Callback on_symbol_done do collector"""
+        with self._lock:
+            self.progress[symbol] = {
+                key: value for key, value in result.items() if key != 'timings'
+            }
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('completed', 'failed', 'coalesced')
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            progress = dict(self.progress)
+
+        finished = sum(1 for p in progress.values() if p['status'] != 'pending')
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'source': self.source,
+            'mode': self.mode,
+            'symbols': self.symbols,
+            'period': self.period,
+            'interval': self.interval,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'completed_symbols': finished,
+            'total_symbols': len(self.symbols),
+            'progress': progress,
+            'coalesced': self.coalesced,
+            'result': self.result,
+            'error': self.error
+        }
+
+
+class CollectionJobManager:
+    """
+    Executa coletas em background com um limite global de concorrência
+
+    Pedidos para um (símbolo, período, intervalo) já em curso não geram
+    nova coleta: o símbolo fica associado ao job existente (campo
+    `coalesced`). No máximo `max_concurrent` jobs correm ao mesmo tempo;
+    os restantes esperam em fila no executor.
+    """
+
+    def __init__(
+        self,
+        collector: StockDataCollector,
+        max_concurrent: Optional[int] = None,
+        history: Optional[int] = None
+    ):
+        self.collector = collector
+        self.max_concurrent = max_concurrent or int(
+            os.getenv('COLLECT_MAX_CONCURRENT_JOBS', '2')
+        )
+        self.history = history or int(os.getenv('COLLECT_JOB_HISTORY', '100'))
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent,
+            thread_name_prefix='collect-job'
+        )
+        self._jobs: "OrderedDict[str, CollectionJob]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str, str], str] = {}
+        self._lock = threading.Lock()
+        self.coalesced_count = 0
+
+    @staticmethod
+    def _key(symbol: str, period: str, interval: str, mode: str) -> Tuple[str, str, str]:
+        return (symbol, INCREMENTAL if mode == INCREMENTAL else period, interval)
+
+    def submit(
+        self,
+        symbols: List[str],
+        period: str = "1y",
+        interval: str = "1d",
+        mode: str = PERIOD,
+        source: str = 'api'
+    ) -> CollectionJob:
+        """
+        Cria um job para os símbolos que ainda não estão a ser coletados
+
+        Returns:
+            O job criado; se todos os símbolos já estavam em curso, o job
+            fica com estado 'coalesced' e não é executado.
+        """
+        symbols = list(dict.fromkeys(s.upper() for s in symbols))
+
+        with self._lock:
+            own, coalesced = [], {}
+            for symbol in symbols:
+                existing = self._inflight.get(self._key(symbol, period, interval, mode))
+                if existing:
+                    coalesced[symbol] = existing
+                else:
+                    own.append(symbol)
+
+            job = CollectionJob(own, period, interval, mode, source)
+            job.coalesced = coalesced
+            self.coalesced_count += len(coalesced)
+
+            for symbol in own:
+                self._inflight[self._key(symbol, period, interval, mode)] = job.id
+
+            self._jobs[job.id] = job
+            self._trim()
+
+            if not own:
+                job.status = 'coalesced'
+                job.finished_at = datetime.now()
+            else:
+                job.future = self.executor.submit(self._run, job)
+
+        if coalesced:
+            logger.info(
+                f"Collection job {job.id}: {len(coalesced)} symbols already in flight"
+            )
+        return job
+
+    def _run(self, job: CollectionJob):
+        job.status = 'running'
+        job.started_at = datetime.now()
+        started = time.perf_counter()
+
+        try:
+            if job.mode == INCREMENTAL:
+                job.result = self.collector.collect_incremental(
+                    job.symbols,
+                    interval=job.interval,
+                    default_period=job.period,
+                    on_symbol_done=job.record
+                )
+            else:
+                job.result = self.collector.collect_multiple_stocks(
+                    job.symbols,
+                    job.period,
+                    job.interval,
+                    on_symbol_done=job.record
+                )
+            # Progresso por símbolo já está em job.progress
+            job.result.pop('timings', None)
+            job.status = 'completed'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            logger.error(f"Collection job {job.id} failed: {str(e)}")
+        finally:
+            job.finished_at = datetime.now()
+            with self._lock:
+                for symbol in job.symbols:
+                    key = self._key(symbol, job.period, job.interval, job.mode)
+                    if self._inflight.get(key) == job.id:
+                        del self._inflight[key]
+
+            logger.info(
+                f"Collection job {job.id} {job.status} in "
+                f"{time.perf_counter() - started:.1f}s"
+            )
+        return job.result
+
+    def _trim(self):
+        """Mantém só os últimos `history` jobs terminados"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[CollectionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        with self._lock:
+            jobs = list(reversed(self._jobs.values()))
+        return [
+            job.to_dict() for job in jobs
+            if status is None or job.status == status
+        ][:limit]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+            inflight = len(self._inflight)
+
+        return {
+            'max_concurrent': self.max_concurrent,
+            'running': sum(1 for job in jobs if job.status == 'running'),
+            'queued': sum(1 for job in jobs if job.status == 'queued'),
+            'symbols_in_flight': inflight,
+            'coalesced_symbols': self.coalesced_count
+        }
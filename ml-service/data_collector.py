@@ -1,12 +1,26 @@
 # ml-service/data_collector.py
-import yfinance as yf
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
-from sqlalchemy import create_engine, text
+import time
 import os
 from dotenv import load_dotenv
+from database import get_engine
+from rate_limiter import TokenBucketRateLimiter, create_rate_limiter
+from providers import DataProvider, get_provider
+from resilience import CircuitOpenError, ResilientProvider
+from data_lake import LakeCachedProvider, ParquetLake
+from watermarks import WatermarkStore
+from market_calendar import CollectionPlanner
+from bulk_writer import BulkUpsertWriter
+from rollups import ROLLUPS, RollupEngine
+from cache import TwoTierCache, get_cache
+from market_movers import MarketMovers
+from indicators import IndicatorStore
+from rolling_stats import RollingStatsEngine
+from symbol_metadata import SymbolMetadataCache
 
 load_dotenv()
 
@@ -15,17 +29,89 @@ logger = logging.getLogger(__name__)
 
 
 class StockDataCollector:
-    """Coleta dados de ações do Yahoo Finance"""
+    """Coleta dados de ações do Yahoo Finance (ou outro provider)"""
     
-    def __init__(self):
-        self.db_url = os.getenv('DATABASE_URL')
-        self.engine = create_engine(self.db_url)
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        rate_limiter: Optional[TokenBucketRateLimiter] = None,
+        provider: Optional[DataProvider] = None,
+        engine=None,
+        cache: Optional[TwoTierCache] = None
+    ):
+        # Engine/pool partilhado do processo
+        self.engine = engine or get_engine()
+        
+        # Cache de leitura da API (invalidada quando há barras novas)
+        self.cache = cache or get_cache()
+        
+        # Etapas executadas após cada coleta: hook(símbolos escritos, intervalo)
+        self.market_movers = MarketMovers(self.engine, self.cache)
+        self.post_collection_hooks = [self.market_movers.refresh]
+        
+        # Escrita via COPY + upsert
+        self.writer = BulkUpsertWriter(self.engine)
+        
+        # Barras de 1h/1d agregadas das mais finas a cada escrita
+        self.rollups = RollupEngine(self.engine, self.writer)
+        
+        # Indicadores técnicos atualizados a cada escrita de barras diárias
+        self.indicators = IndicatorStore(self.engine, self.writer)
+        
+        # Estatísticas rolantes (7/30/90/365 dias) lidas por /stocks/{symbol}/stats
+        self.rolling_stats = RollingStatsEngine(self.engine)
+        
+        # Última barra coletada por (símbolo, intervalo)
+        self.watermarks = WatermarkStore(self.engine)
+        
+        # Metadados (ticker.info) só re-coletados depois do TTL
+        self.metadata = SymbolMetadataCache(self.engine)
+        
+        # Calendário das bolsas: evita pedidos com o mercado fechado
+        self.planner = CollectionPlanner(self.engine, self.watermarks)
+        
+        # Máximo de símbolos por pedido em bulk
+        self.bulk_chunk_size = int(os.getenv('COLLECTOR_BULK_CHUNK_SIZE', '50'))
+        
+        # Número de símbolos processados em paralelo
+        self.max_workers = max_workers or int(
+            os.getenv('COLLECTOR_MAX_WORKERS', '4')
+        )
+        
+        # Rate limit partilhado por todas as threads e, com Redis, por todos
+        # os processos (API, scheduler, workers) - pedidos/segundo no total
+        self.rate_limiter = rate_limiter or create_rate_limiter(
+            rate=float(os.getenv('COLLECTOR_RATE_LIMIT', '1.0')),
+            capacity=int(os.getenv('COLLECTOR_RATE_BURST', '2')),
+            redis_client=self.cache.redis
+        )
+        
+        # Fonte de dados (yahoo por defeito, fixtures em testes/benchmarks)
+        # com retries, circuit breaker e cache negativa; o rate limiter é
+        # aplicado a cada tentativa real
+        self.resilient = ResilientProvider(
+            provider or get_provider(),
+            before_call=self.rate_limiter.acquire
+        )
+        
+        # Data lake Parquet: histórico servido do disco, só a cauda vai à rede
+        # (fresh_provider: recuos explícitos vão sempre à rede, mas o
+        # resultado continua a atualizar o lake)
+        self.lake = None
+        self.provider = self.resilient
+        self.fresh_provider = self.resilient
+        if os.getenv('DATA_LAKE_ENABLED', 'true').lower() == 'true':
+            self.lake = ParquetLake()
+            self.provider = LakeCachedProvider(self.resilient, self.lake)
+            self.fresh_provider = LakeCachedProvider(self.resilient, self.lake, write_only=True)
         
     def fetch_stock_data(
         self, 
         symbol: str, 
         period: str = "1y",
-        interval: str = "1d"
+        interval: str = "1d",
+        start: Optional[datetime] = None,
+        fresh: bool = False
     ) -> Optional[pd.DataFrame]:
         """
         Busca dados históricos de uma ação
@@ -34,49 +120,31 @@ class StockDataCollector:
             symbol: Símbolo da ação (ex: AAPL, MSFT)
             period: Período de dados (1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max)
             interval: Intervalo (1m, 2m, 5m, 15m, 30m, 60m, 90m, 1h, 1d, 5d, 1wk, 1mo, 3mo)
+            start: Data inicial (substitui period na coleta incremental)
+            fresh: Ignorar o data lake (recuo explícito para apanhar revisões)
         
         Returns:
             DataFrame com dados históricos
         """
         try:
-            import time
             logger.info(f"Fetching data for {symbol}...")
             
-            # Headers para evitar bloqueio
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            # Delay para evitar rate limit
-            time.sleep(2)
-            
-            ticker = yf.Ticker(symbol)
-            
-            # Buscar dados históricos
-            df = ticker.history(period=period, interval=interval)
+            # Buscar dados históricos (já normalizados pelo provider)
+            provider = self.fresh_provider if fresh else self.provider
+            df = provider.history(
+                symbol, period=period, interval=interval, start=start
+            )
             
-            if df.empty:
+            if df is None:
                 logger.warning(f"No data found for {symbol}")
                 return None
             
-            # Adicionar símbolo ao DataFrame
-            df['symbol'] = symbol
-            
-            # Resetar index para ter time como coluna
-            df.reset_index(inplace=True)
-            
-            # Renomear colunas para minúsculas
-            df.columns = [col.lower().replace(' ', '_') for col in df.columns]
-            
-            # Garantir que temos a coluna 'date' ou 'datetime'
-            if 'date' in df.columns:
-                df.rename(columns={'date': 'time'}, inplace=True)
-            elif 'datetime' in df.columns:
-                df.rename(columns={'datetime': 'time'}, inplace=True)
-            
             logger.info(f"Successfully fetched {len(df)} records for {symbol}")
             return df
             
+        except CircuitOpenError as e:
+            logger.warning(f"Skipping fetch for {symbol}: {str(e)}")
+            return None
         except Exception as e:
             logger.error(f"Error fetching data for {symbol}: {str(e)}")
             return None
@@ -92,8 +160,11 @@ class StockDataCollector:
             Dicionário com informações da ação
         """
         try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
+            info = self.provider.info(symbol)
+            if not info:
+                # Não sobrescrever metadados existentes com valores por defeito
+                logger.warning(f"No info found for {symbol}")
+                return None
             
             return {
                 'symbol': symbol,
@@ -105,151 +176,391 @@ class StockDataCollector:
                 'currency': info.get('currency', 'USD')
             }
             
+        except CircuitOpenError as e:
+            logger.warning(f"Skipping info for {symbol}: {str(e)}")
+            return None
         except Exception as e:
             logger.error(f"Error fetching info for {symbol}: {str(e)}")
             return None
     
-    def save_to_database(self, df: pd.DataFrame, table: str = 'stock_data'):
+    def fetch_bulk_stock_data(
+        self,
+        symbols: List[str],
+        period: str = "1y",
+        interval: str = "1d",
+        start: Optional[datetime] = None,
+        fresh: bool = False
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Busca dados históricos de vários símbolos com um pedido por lote
+        
+        Args:
+            symbols: Lista de símbolos
+            period: Período de dados
+            interval: Intervalo
+            start: Data inicial (substitui period na coleta incremental)
+            fresh: Ignorar o data lake (ver fetch_stock_data)
+        
+        Returns:
+            Dicionário {símbolo: DataFrame ou None (sem dados)}; os símbolos
+            de lotes que falharam são omitidos (buscados um a um depois)
+        """
+        provider = self.fresh_provider if fresh else self.provider
+        frames = {}
+        
+        for i in range(0, len(symbols), self.bulk_chunk_size):
+            chunk = symbols[i:i + self.bulk_chunk_size]
+            try:
+                logger.info(f"Fetching bulk data for {len(chunk)} symbols...")
+                
+                # Um token por tentativa em bulk (aplicado pelo provider)
+                data = provider.history_bulk(
+                    chunk, period=period, interval=interval, start=start
+                )
+                frames.update({symbol: data.get(symbol) for symbol in chunk})
+                
+            except CircuitOpenError as e:
+                logger.warning(f"Skipping bulk fetch for {len(chunk)} symbols: {str(e)}")
+            except Exception as e:
+                logger.error(f"Error fetching bulk data for {chunk}: {str(e)}")
+        
+        fetched = sum(df is not None for df in frames.values())
+        logger.info(
+            f"Successfully fetched bulk data for {fetched}/{len(symbols)} symbols"
+        )
+        return frames
+    
+    def save_to_database(
+        self,
+        df: pd.DataFrame,
+        table: str = 'stock_data',
+        interval: str = '1d'
+    ) -> Dict[str, int]:
         """
-        Salva dados no banco de dados
+        Salva dados no banco de dados (upsert por symbol, interval, time)
         
         Args:
             df: DataFrame com dados
             table: Nome da tabela
+            interval: Intervalo das barras
+        
+        Returns:
+            Dicionário com linhas inserted, updated e unchanged
         """
         try:
-            # Preparar dados para inserção
-            df_to_save = df[[
-                'time', 'symbol', 'open', 'high', 
-                'low', 'close', 'volume'
-            ]].copy()
+            result = self.writer.upsert_stock_data(df, table, interval)
             
-            # Converter time para timestamp
-            df_to_save['time'] = pd.to_datetime(df_to_save['time'])
+            # Só propagar quando a escrita mudou alguma barra
+            if result['inserted'] or result['updated']:
+                self._after_save(df, result, interval)
             
-            # Inserir dados (substituir duplicados)
-            with self.engine.connect() as conn:
-                # Deletar dados existentes para esse símbolo e período
-                symbol = df_to_save['symbol'].iloc[0]
-                min_date = df_to_save['time'].min()
-                max_date = df_to_save['time'].max()
-                
-                delete_query = text("""
-                    DELETE FROM stock_data 
-                    WHERE symbol = :symbol 
-                    AND time BETWEEN :min_date AND :max_date
-                """)
-                
-                conn.execute(
-                    delete_query,
-                    {
-                        'symbol': symbol,
-                        'min_date': min_date,
-                        'max_date': max_date
-                    }
-                )
-                conn.commit()
-            
-            # Inserir novos dados
-            df_to_save.to_sql(
-                table,
-                self.engine,
-                if_exists='append',
-                index=False,
-                method='multi',
-                chunksize=1000
+            logger.info(
+                f"Saved {len(df)} records to database "
+                f"({result['inserted']} inserted, {result['updated']} updated)"
             )
-            
-            logger.info(f"Saved {len(df_to_save)} records to database")
+            return result
             
         except Exception as e:
             logger.error(f"Error saving to database: {str(e)}")
             raise
     
+    def _after_save(self, df: pd.DataFrame, result: Dict[str, int], interval: str):
+        """Invalida a cache e atualiza dados derivados das barras escritas"""
+        for symbol, bars in df.groupby('symbol'):
+            self.cache.invalidate_symbol(symbol)
+            
+            if interval != '1d':
+                continue
+            
+            try:
+                # Barras existentes revistas obrigam a recalcular os indicadores
+                self.indicators.update(symbol, bars, revised=result['updated'] > 0)
+            except Exception as e:
+                logger.error(f"Error updating indicators for {symbol}: {str(e)}")
+            
+            try:
+                self.rolling_stats.update(symbol, bars)
+            except Exception as e:
+                logger.error(f"Error updating rolling stats for {symbol}: {str(e)}")
+        
+        self._roll_up(df, interval)
+    
+    def _roll_up(self, df: pd.DataFrame, interval: str):
+        """Agrega as barras escritas no intervalo seguinte (1m -> 1h -> 1d)"""
+        try:
+            rolled, result = self.rollups.roll_up(df, interval)
+        except Exception as e:
+            logger.error(f"Error rolling up {interval} bars: {str(e)}")
+            return
+        
+        # Barras agregadas são barras como as outras: cache, indicadores
+        # e estatísticas (1d) e o nível seguinte da agregação
+        if rolled is not None and (result['inserted'] or result['updated']):
+            self._after_save(rolled, result, ROLLUPS[interval])
+    
     def save_stock_info(self, info: Dict):
         """Salva informações da ação no banco"""
+        self.save_stock_infos([info])
+    
+    def save_stock_infos(self, infos: List[Dict]):
+        """Salva as informações de várias ações num único upsert"""
         try:
-            with self.engine.connect() as conn:
-                # Verificar se já existe
-                check_query = text(
-                    "SELECT id FROM stock_symbols WHERE symbol = :symbol"
-                )
-                result = conn.execute(
-                    check_query, 
-                    {'symbol': info['symbol']}
-                ).fetchone()
-                
-                if result:
-                    # Atualizar
-                    update_query = text("""
-                        UPDATE stock_symbols 
-                        SET name = :name, 
-                            exchange = :exchange, 
-                            sector = :sector
-                        WHERE symbol = :symbol
-                    """)
-                    conn.execute(update_query, info)
-                else:
-                    # Inserir
-                    insert_query = text("""
-                        INSERT INTO stock_symbols (symbol, name, exchange, sector)
-                        VALUES (:symbol, :name, :exchange, :sector)
-                    """)
-                    conn.execute(insert_query, info)
-                
-                conn.commit()
-                logger.info(f"Saved info for {info['symbol']}")
-                
+            self.metadata.save_many(infos)
         except Exception as e:
             logger.error(f"Error saving stock info: {str(e)}")
     
+    def _collect_symbol(
+        self,
+        symbol: str,
+        period: str,
+        interval: str,
+        prefetched: Optional[Dict[str, pd.DataFrame]] = None,
+        start: Optional[datetime] = None,
+        fetch_info: bool = True,
+        fresh: bool = False
+    ) -> Dict:
+        """
+        Coleta e guarda dados de um único símbolo
+        
+        Args:
+            prefetched: Dados já obtidos em bulk (evita novo pedido; símbolos
+                        ausentes, de lotes que falharam, são buscados aqui)
+            fetch_info: Buscar ticker.info (metadados expirados); a escrita
+                        é feita em lote por collect_multiple_stocks
+            fresh: Ignorar o data lake (ver fetch_stock_data)
+        
+        Returns:
+            Dicionário com estado, tempos (segundos) de cada etapa e info
+        """
+        timings = {}
+        started = time.perf_counter()
+        
+        # Buscar e salvar dados históricos (pedido próprio se o lote falhou)
+        if prefetched is not None and symbol in prefetched:
+            df = prefetched[symbol]
+        else:
+            df = self.fetch_stock_data(symbol, period, interval, start, fresh)
+            timings['fetch'] = time.perf_counter() - started
+        
+        saved = False
+        rows = {'inserted': 0, 'updated': 0}
+        if df is not None:
+            step = time.perf_counter()
+            rows = self.save_to_database(df, interval=interval)
+            self.watermarks.update(
+                symbol, interval, pd.to_datetime(df['time']).max().to_pydatetime()
+            )
+            timings['save'] = time.perf_counter() - step
+            saved = True
+        
+        # Buscar informações da ação (só com metadados expirados)
+        info = None
+        if fetch_info:
+            step = time.perf_counter()
+            info = self.fetch_stock_info(symbol)
+            timings['info'] = time.perf_counter() - step
+        
+        timings['total'] = time.perf_counter() - started
+        
+        return {
+            'status': 'success' if saved else 'no_data',
+            'rows_inserted': rows['inserted'],
+            'rows_updated': rows['updated'],
+            'info': info,
+            'timings': {k: round(v, 3) for k, v in timings.items()}
+        }
+    
     def collect_multiple_stocks(
         self, 
         symbols: List[str], 
         period: str = "1y",
-        interval: str = "1d"
+        interval: str = "1d",
+        max_workers: Optional[int] = None,
+        bulk: bool = False,
+        start: Optional[datetime] = None,
+        on_symbol_done: Optional[Callable[[str, Dict], None]] = None,
+        fresh: bool = False
     ):
         """
-        Coleta dados de múltiplas ações
+        Coleta dados de múltiplas ações em paralelo
+        
+        Os símbolos são distribuídos por um pool de threads limitado e
+        todas as chamadas ao Yahoo passam pelo rate limiter partilhado.
         
         Args:
             symbols: Lista de símbolos
             period: Período de dados
             interval: Intervalo
+            max_workers: Número de threads (default: self.max_workers)
+            bulk: Buscar o histórico de todos os símbolos em lotes
+            start: Data inicial (substitui period na coleta incremental)
+            on_symbol_done: Chamado com (símbolo, resultado) quando cada
+                            símbolo termina (progresso dos jobs de coleta)
+            fresh: Ignorar o data lake (ver fetch_stock_data)
         """
-        logger.info(f"Starting collection for {len(symbols)} stocks...")
+        workers = max(1, min(max_workers or self.max_workers, len(symbols) or 1))
+        logger.info(
+            f"Starting collection for {len(symbols)} stocks "
+            f"({workers} workers)..."
+        )
         
         success_count = 0
         error_count = 0
+        rows_inserted = 0
+        rows_updated = 0
+        written = []
+        timings = {}
+        started = time.perf_counter()
         
-        for symbol in symbols:
-            try:
-                # Buscar e salvar dados históricos
-                df = self.fetch_stock_data(symbol, period, interval)
-                if df is not None:
-                    self.save_to_database(df)
-                    success_count += 1
+        prefetched = None
+        if bulk:
+            prefetched = self.fetch_bulk_stock_data(symbols, period, interval, start, fresh)
+        
+        # ticker.info só para símbolos com metadados expirados
+        stale_info = set(self.metadata.stale(symbols))
+        infos = []
+        
+        with ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='collector'
+        ) as executor:
+            futures = {
+                executor.submit(
+                    self._collect_symbol,
+                    symbol, period, interval, prefetched, start,
+                    symbol in stale_info, fresh
+                ): symbol
+                for symbol in symbols
+            }
+            
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    result = future.result()
+                    info = result.pop('info', None)
+                    if info:
+                        infos.append(info)
+                    timings[symbol] = result['timings']
+                    rows_inserted += result['rows_inserted']
+                    rows_updated += result['rows_updated']
+                    if result['status'] == 'success':
+                        success_count += 1
+                    if result['rows_inserted'] or result['rows_updated']:
+                        written.append(symbol)
+                        
+                except Exception as e:
+                    logger.error(f"Error processing {symbol}: {str(e)}")
+                    timings[symbol] = {'error': str(e)}
+                    error_count += 1
+                    result = {'status': 'error', 'error': str(e)}
                 
-                # Buscar e salvar informações da ação
-                info = self.fetch_stock_info(symbol)
-                if info:
-                    self.save_stock_info(info)
-                    
-            except Exception as e:
-                logger.error(f"Error processing {symbol}: {str(e)}")
-                error_count += 1
-                continue
+                if on_symbol_done is not None:
+                    on_symbol_done(symbol, result)
         
+        # Metadados de todos os símbolos numa só escrita
+        if infos:
+            self.save_stock_infos(infos)
+        
+        self._run_post_collection_hooks(written, interval)
+        
+        duration = time.perf_counter() - started
         logger.info(
             f"Collection completed: {success_count} successful, "
-            f"{error_count} errors"
+            f"{error_count} errors in {duration:.1f}s"
         )
         
         return {
             'success': success_count,
             'errors': error_count,
-            'total': len(symbols)
+            'total': len(symbols),
+            'rows_inserted': rows_inserted,
+            'rows_updated': rows_updated,
+            'duration': round(duration, 3),
+            'timings': timings
         }
+    
+    def _run_post_collection_hooks(self, symbols: List[str], interval: str):
+        """Executa as etapas pós-coleta apenas para os símbolos escritos"""
+        if not symbols:
+            return
+        
+        for hook in self.post_collection_hooks:
+            try:
+                hook(symbols, interval)
+            except Exception as e:
+                logger.error(f"Error in post-collection hook {hook}: {str(e)}")
+    
+    def collect_incremental(
+        self,
+        symbols: List[str],
+        interval: str = "1d",
+        default_period: str = "1y",
+        overlap: Optional[timedelta] = None,
+        bulk: bool = True,
+        on_symbol_done: Optional[Callable[[str, Dict], None]] = None
+    ):
+        """
+        Coleta apenas as barras em falta de cada símbolo
+        
+        O CollectionPlanner descarta os símbolos já em dia segundo o
+        calendário da bolsa (fins de semana, feriados, fora de sessão) e
+        agrupa os restantes pela data inicial do primeiro dado em falta,
+        para que cada grupo use um único pedido em bulk. Símbolos sem
+        watermark são coletados com `default_period`.
+        
+        Args:
+            symbols: Lista de símbolos
+            interval: Intervalo
+            default_period: Período para símbolos ainda sem dados
+            overlap: Recuo fixo para apanhar revisões (desativa o calendário
+                     e o data lake: o recuo inteiro vai à rede)
+            bulk: Buscar o histórico em lotes
+            on_symbol_done: Ver collect_multiple_stocks
+        """
+        groups, up_to_date = self.planner.plan(symbols, interval, overlap)
+        
+        logger.info(
+            f"Incremental collection ({interval}): "
+            f"{len(symbols) - len(groups.get(None, [])) - len(up_to_date)} with gaps, "
+            f"{len(groups.get(None, []))} full, {len(up_to_date)} up to date, "
+            f"{len(groups)} fetch groups"
+        )
+        
+        if on_symbol_done is not None:
+            for symbol in up_to_date:
+                on_symbol_done(symbol, {
+                    'status': 'up_to_date', 'rows_inserted': 0, 'rows_updated': 0
+                })
+        
+        summary = {
+            'success': 0,
+            'errors': 0,
+            'total': len(symbols),
+            'rows_inserted': 0,
+            'rows_updated': 0,
+            'up_to_date': len(up_to_date),
+            'duration': 0.0,
+            'timings': {}
+        }
+        for start, group in groups.items():
+            result = self.collect_multiple_stocks(
+                group,
+                period=default_period,
+                interval=interval,
+                bulk=bulk,
+                start=start,
+                on_symbol_done=on_symbol_done,
+                fresh=overlap is not None
+            )
+            summary['success'] += result['success']
+            summary['errors'] += result['errors']
+            summary['rows_inserted'] += result['rows_inserted']
+            summary['rows_updated'] += result['rows_updated']
+            summary['duration'] += result['duration']
+            summary['timings'].update(result['timings'])
+        
+        summary['duration'] = round(summary['duration'], 3)
+        return summary
 
 
 # Função de teste
@@ -0,0 +1,482 @@
+# ml-service/data_lake.py
+# Data lake local em Parquet (símbolo/intervalo/ano): cache de replay das barras coletadas
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from file_lock import file_lock
+from providers import OHLCV_COLUMNS, DataProvider, period_to_start
+
+logger = logging.getLogger(__name__)
+
+COVERAGE_FILE = '_coverage.json'
+
+
+def lake_dir() -> str:
+    return os.getenv(
+        'DATA_LAKE_DIR',
+        os.path.join(os.path.dirname(__file__), 'data', 'lake')
+    )
+
+
+def _utc(value) -> Optional[pd.Timestamp]:
+    if value is None:
+        return None
+    ts = pd.Timestamp(value)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+
+class ParquetLake:
+    """
+    Barras tal como vieram do provider, em {símbolo}/{intervalo}/{ano}.parquet
+
+    Cada (símbolo, intervalo) tem um _coverage.json com o início do pedido
+    mais antigo (`covered_from`, None = histórico completo) e a última
+    barra gravada: entre os dois o lake tem tudo o que o provider tinha.
+    Um pedido que começa depois da última barra deixaria um buraco, por
+    isso reinicia a cobertura.
+
+    API e scheduler escrevem os mesmos ficheiros: cada (símbolo, intervalo)
+    é protegido por um flock ({símbolo}/{intervalo}.lock), exclusivo nas
+    escritas e partilhado nas leituras.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or lake_dir()
+        self._locks: Dict[Tuple[str, str], threading.Lock] = defaultdict(threading.Lock)
+        self._locks_guard = threading.Lock()
+
+    def _lock(self, symbol: str, interval: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks[(symbol, interval)]
+
+    @contextmanager
+    def _exclusive(self, symbol: str, interval: str):
+        with self._lock(symbol, interval), file_lock(self._dir(symbol, interval)):
+            yield
+
+    def _dir(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.directory, symbol, interval)
+
+    def coverage(self, symbol: str, interval: str) -> Optional[Dict]:
+        path = os.path.join(self._dir(symbol, interval), COVERAGE_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            coverage = json.load(f)
+        return {
+            'covered_from': _utc(coverage['covered_from']),
+            'last_time': _utc(coverage['last_time'])
+        }
+
+    def covers(self, symbol: str, interval: str, start) -> Optional[Dict]:
+        """Cobertura do símbolo se o lake tiver tudo desde `start` (None = max)"""
+        coverage = self.coverage(symbol, interval)
+        if coverage is None:
+            return None
+        if coverage['covered_from'] is None:
+            return coverage
+        if start is None or _utc(start) < coverage['covered_from']:
+            return None
+        return coverage
+
+    def invalidate(self, symbol: str, interval: str):
+        """Apaga barras e cobertura de (símbolo, intervalo)"""
+        with self._exclusive(symbol, interval):
+            shutil.rmtree(self._dir(symbol, interval), ignore_errors=True)
+
+    def write(self, df: Optional[pd.DataFrame], interval: str, requested_from=None) -> int:
+        """
+        Funde as barras nas partições anuais (a mesma barra fica com a versão nova)
+
+        Args:
+            requested_from: Início do pedido que produziu df (None = max)
+
+        Returns:
+            Linhas escritas
+        """
+        if df is None or df.empty:
+            return 0
+
+        df = df[OHLCV_COLUMNS].copy()
+        df['time'] = pd.to_datetime(df['time'], utc=True)
+
+        written = 0
+        for symbol, bars in df.groupby('symbol'):
+            with self._exclusive(symbol, interval):
+                directory = self._dir(symbol, interval)
+                os.makedirs(directory, exist_ok=True)
+
+                for year, part in bars.groupby(bars['time'].dt.year):
+                    path = os.path.join(directory, f"{year}.parquet")
+                    if os.path.exists(path):
+                        part = pd.concat([pd.read_parquet(path), part], ignore_index=True)
+                    part = part.drop_duplicates(subset='time', keep='last').sort_values('time')
+
+                    tmp = path + '.tmp'
+                    part.to_parquet(tmp, index=False)
+                    os.replace(tmp, path)
+                    written += len(part)
+
+                self._update_coverage(symbol, interval, bars, requested_from)
+
+        return written
+
+    def _update_coverage(self, symbol: str, interval: str, bars: pd.DataFrame, requested_from):
+        coverage = self.coverage(symbol, interval)
+        last = bars['time'].max()
+        requested_from = _utc(requested_from)
+
+        if coverage is None or (
+            requested_from is not None and requested_from > coverage['last_time']
+        ):
+            # Sem cobertura contígua: o lake só garante este pedido
+            covered_from = requested_from
+        elif coverage['covered_from'] is None or requested_from is None:
+            covered_from = None
+        else:
+            covered_from = min(coverage['covered_from'], requested_from)
+
+        last_time = max(last, coverage['last_time']) if coverage else last
+        path = os.path.join(self._dir(symbol, interval), COVERAGE_FILE)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({
+                'covered_from': covered_from.isoformat() if covered_from is not None else None,
+                'last_time': last_time.isoformat(),
+                'updated_at': datetime.now().isoformat()
+            }, f, indent=2)
+        os.replace(tmp, path)
+
+    def read(self, symbol: str, interval: str, start=None, end=None) -> Optional[pd.DataFrame]:
+        """Barras em [start, end) a partir das partições anuais necessárias"""
+        directory = self._dir(symbol, interval)
+        if not os.path.isdir(directory):
+            return None
+
+        start, end = _utc(start), _utc(end)
+        frames = []
+        with file_lock(directory, shared=True):
+            for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+                if not name.endswith('.parquet'):
+                    continue
+                year = int(name.split('.')[0])
+                if (start is not None and year < start.year) or (end is not None and year > end.year):
+                    continue
+                frames.append(pd.read_parquet(os.path.join(directory, name)))
+
+        if not frames:
+            return None
+
+        df = pd.concat(frames, ignore_index=True)
+        if start is not None:
+            df = df[df['time'] >= start]
+        if end is not None:
+            df = df[df['time'] < end]
+        if df.empty:
+            return None
+        return df[OHLCV_COLUMNS].reset_index(drop=True)
+
+    def symbols(self, interval: str) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            symbol for symbol in os.listdir(self.directory)
+            if os.path.isdir(self._dir(symbol, interval))
+        )
+
+    def iter_symbols(self, interval: str, symbols: Optional[List[str]] = None) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """(símbolo, histórico completo) de cada símbolo do lake"""
+        for symbol in symbols or self.symbols(interval):
+            df = self.read(symbol, interval)
+            if df is not None:
+                yield symbol, df
+
+
+class LakeCachedProvider(DataProvider):
+    """
+    Serve o histórico a partir do lake e pede à rede só a cauda recente
+
+    Barras anteriores a última barra do lake - DATA_LAKE_REFRESH_DAYS são
+    tidas como definitivas; a cauda é sempre re-coletada (barras do dia,
+    revisões). Tudo o que vem da rede é gravado no lake.
+
+    Os providers devolvem preços ajustados (auto_adjust): um split ou
+    dividendo reescreve todo o histórico anterior. A cauda re-coletada
+    sobrepõe-se às barras do lake; se os preços dessas barras mudaram
+    (acima de DATA_LAKE_ADJUST_TOLERANCE) o lake do símbolo é descartado
+    e o pedido inteiro vai à rede.
+
+    Com write_only=True nada é servido do lake (o pedido vai sempre à
+    rede) mas o resultado continua a ser gravado: é o modo usado quando
+    quem chama pede explicitamente para re-coletar um recuo (overlap).
+    """
+
+    def __init__(self, provider: DataProvider, lake: Optional[ParquetLake] = None,
+                 refresh: Optional[timedelta] = None, write_only: bool = False):
+        self.provider = provider
+        self.name = provider.name
+        self.lake = lake or ParquetLake()
+        self.refresh = refresh or timedelta(days=float(os.getenv('DATA_LAKE_REFRESH_DAYS', '7')))
+        self.adjust_tolerance = float(os.getenv('DATA_LAKE_ADJUST_TOLERANCE', '0.0001'))
+        self.write_only = write_only
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.lake_rows = 0
+        self.invalidations = 0
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    @staticmethod
+    def _requested_from(period, start):
+        if start is not None:
+            return start
+        try:
+            return period_to_start(period) if period else None
+        except ValueError:
+            return None
+
+    def _tail_start(self, coverage: Dict, requested_from) -> pd.Timestamp:
+        # Meia-noite UTC: símbolos com a mesma última barra partilham o pedido
+        tail = (coverage['last_time'] - self.refresh).floor('D')
+        requested_from = _utc(requested_from)
+        return max(tail, requested_from) if requested_from is not None else tail
+
+    def _write(self, df, interval, requested_from):
+        try:
+            self.lake.write(df, interval, requested_from)
+        except Exception as e:
+            logger.error(f"Error writing to data lake: {str(e)}")
+
+    @staticmethod
+    def _combine(cached: Optional[pd.DataFrame], fresh: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+        frames = [df for df in (cached, fresh) if df is not None and not df.empty]
+        if not frames:
+            return None
+        df = pd.concat(frames, ignore_index=True)
+        df['time'] = pd.to_datetime(df['time'], utc=True)
+        return df.drop_duplicates(subset='time', keep='last') \
+            .sort_values('time').reset_index(drop=True)
+
+    def _plan(self, symbol: str, interval: str, requested_from,
+              end) -> Tuple[Optional[pd.Timestamp], Optional[pd.DataFrame]]:
+        """
+        (início da cauda a pedir à rede, barras servidas pelo lake)
+
+        (None, None): o lake não cobre o pedido, tudo vai à rede
+        (None, df): o pedido termina antes da cauda, nada vai à rede
+        (tail, df): o lake serve até `tail`, a rede o resto
+        """
+        if self.write_only:
+            return None, None
+
+        coverage = self.lake.covers(symbol, interval, requested_from)
+        if coverage is None:
+            self._count(misses=1)
+            return None, None
+
+        tail = self._tail_start(coverage, requested_from)
+        lake_only = end is not None and _utc(end) <= tail
+        cached = self.lake.read(symbol, interval, requested_from, end if lake_only else tail)
+        self._count(
+            lake_rows=len(cached) if cached is not None else 0,
+            **({'hits': 1} if lake_only else {'partial_hits': 1})
+        )
+        return (None if lake_only else tail), (cached if cached is not None else pd.DataFrame())
+
+    def _adjusted(self, symbol: str, interval: str, fresh: Optional[pd.DataFrame], tail) -> bool:
+        """
+        A cauda re-coletada diverge das barras que o lake já tinha
+
+        Compara os fechos das barras em comum, excluindo a última do lake
+        (pode ser a barra do dia ainda em curso).
+        """
+        if fresh is None or fresh.empty:
+            return False
+        coverage = self.lake.coverage(symbol, interval)
+        if coverage is None:
+            return False
+        stored = self.lake.read(symbol, interval, tail, coverage['last_time'])
+        if stored is None:
+            return False
+
+        fresh = fresh.assign(time=pd.to_datetime(fresh['time'], utc=True))
+        both = stored.merge(fresh[['time', 'close']], on='time', suffixes=('_lake', ''))
+        if both.empty:
+            return False
+
+        drift = ((both['close'] - both['close_lake']).abs() / both['close_lake']).max()
+        if drift <= self.adjust_tolerance:
+            return False
+
+        logger.warning(
+            f"{symbol}/{interval}: provider history changed by {drift:.4%} "
+            f"(split/dividend adjustment), discarding lake data"
+        )
+        self.lake.invalidate(symbol, interval)
+        self._count(invalidations=1)
+        return True
+
+    def history(self, symbol, period="1y", interval="1d", start=None, end=None):
+        requested_from = self._requested_from(period, start)
+        tail, cached = self._plan(symbol, interval, requested_from, end)
+
+        if cached is None:
+            df = self.provider.history(symbol, period, interval, start, end)
+            self._write(df, interval, requested_from)
+            return df
+
+        if tail is None:
+            return cached if not cached.empty else None
+
+        fresh = self.provider.history(symbol, None, interval, tail.to_pydatetime(), end)
+        if self._adjusted(symbol, interval, fresh, tail):
+            df = self.provider.history(symbol, period, interval, start, end)
+            self._write(df, interval, requested_from)
+            return df
+
+        self._write(fresh, interval, tail)
+        return self._combine(cached, fresh)
+
+    def history_bulk(self, symbols, period="1y", interval="1d", start=None, end=None):
+        requested_from = self._requested_from(period, start)
+
+        # Agrupar pelo início da cauda: um pedido em bulk por grupo
+        groups: Dict[Optional[pd.Timestamp], List[str]] = defaultdict(list)
+        cached = {}
+        for symbol in symbols:
+            tail, df = self._plan(symbol, interval, requested_from, end)
+            if df is not None and not df.empty:
+                cached[symbol] = df
+            if df is None or tail is not None:
+                # None = sem cobertura: pedido original
+                groups[tail].append(symbol)
+
+        frames = dict(cached)
+        adjusted = []
+        for tail, group in groups.items():
+            if tail is None:
+                fresh = self.provider.history_bulk(group, period, interval, start, end)
+                from_ = requested_from
+            else:
+                fresh = self.provider.history_bulk(group, None, interval, tail.to_pydatetime(), end)
+                from_ = tail
+            for symbol, df in fresh.items():
+                if tail is not None and self._adjusted(symbol, interval, df, tail):
+                    adjusted.append(symbol)
+                    frames.pop(symbol, None)
+                    continue
+                self._write(df, interval, from_)
+                frames[symbol] = self._combine(cached.get(symbol), df)
+
+        # Histórico reajustado: o pedido original inteiro, num só bulk
+        if adjusted:
+            for symbol, df in self.provider.history_bulk(adjusted, period, interval, start, end).items():
+                self._write(df, interval, requested_from)
+                frames[symbol] = df
+
+        return {symbol: df for symbol, df in frames.items() if df is not None}
+
+    def info(self, symbol):
+        return self.provider.info(symbol)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'directory': self.lake.directory,
+                'refresh_days': self.refresh.total_seconds() / 86400,
+                'hits': self.hits,
+                'partial_hits': self.partial_hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'rows_served_from_lake': self.lake_rows
+            }
+
+
+def replay(collector, interval: str = '1d', symbols: Optional[List[str]] = None,
+           truncate: bool = False) -> Dict:
+    """
+    Reconstrói stock_data a partir do lake, sem rede
+
+    Cada símbolo é gravado de uma vez pelo caminho normal do collector
+    (COPY + upsert, watermarks, indicadores, estatísticas, caches).
+    """
+    from sqlalchemy import text
+
+    lake = collector.lake or ParquetLake()
+    if truncate:
+        query = "DELETE FROM stock_data WHERE interval = :interval"
+        params = {'interval': interval}
+        if symbols:
+            # Só os símbolos que vão ser reconstruídos
+            query += " AND symbol = ANY(:symbols)"
+            params['symbols'] = list(symbols)
+        with collector.engine.begin() as conn:
+            deleted = conn.execute(text(query), params).rowcount
+        logger.warning(
+            f"Deleted {deleted} stock_data {interval} bars for replay "
+            f"({', '.join(symbols) if symbols else 'all symbols'})"
+        )
+
+    summary = {'symbols': 0, 'rows': 0, 'rows_inserted': 0, 'rows_updated': 0}
+    written = []
+    started = datetime.now()
+
+    for symbol, df in lake.iter_symbols(interval, symbols):
+        result = collector.save_to_database(df, interval=interval)
+        collector.watermarks.update(symbol, interval, df['time'].max().to_pydatetime())
+        summary['symbols'] += 1
+        summary['rows'] += len(df)
+        summary['rows_inserted'] += result['inserted']
+        summary['rows_updated'] += result['updated']
+        if result['inserted'] or result['updated']:
+            written.append(symbol)
+        logger.info(f"Replayed {symbol}/{interval}: {len(df)} bars")
+
+    collector._run_post_collection_hooks(written, interval)
+    summary['duration'] = round((datetime.now() - started).total_seconds(), 3)
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Data lake Parquet das barras coletadas")
+    parser.add_argument('command', choices=['replay', 'stats'])
+    parser.add_argument('--interval', default='1d')
+    parser.add_argument('--symbols', nargs='+', help="Símbolos (default: todos os do lake)")
+    parser.add_argument('--truncate', action='store_true',
+                        help="Apaga as barras do intervalo (dos --symbols, se dados) antes do replay")
+    args = parser.parse_args()
+
+    if args.command == 'replay':
+        from data_collector import StockDataCollector
+
+        result = replay(
+            StockDataCollector(),
+            interval=args.interval,
+            symbols=[s.upper() for s in args.symbols] if args.symbols else None,
+            truncate=args.truncate
+        )
+        print(f"\n✅ Replay concluído: {result}")
+
+    elif args.command == 'stats':
+        lake = ParquetLake()
+        for symbol in lake.symbols(args.interval):
+            print(symbol, lake.coverage(symbol, args.interval))
@@ -0,0 +1,170 @@
+# ml-service/database.py
+# Engine/pool SQLAlchemy partilhado pela API, collector, scheduler e utils
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+    """Contadores de checkout/espera do pool de conexões"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_checkout(self, waited: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def record_checkin(self):
+        with self._lock:
+            self.checkins += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'timeouts': self.timeouts,
+                'wait_total_seconds': round(self.wait_total, 4),
+                'wait_avg_ms': round(
+                    1000 * self.wait_total / self.checkouts, 3
+                ) if self.checkouts else 0.0,
+                'wait_max_ms': round(1000 * self.wait_max, 3)
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mede o tempo de espera por uma conexão"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.record_timeout()
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - start)
+        return conn
+
+    def _do_return_conn(self, record):
+        pool_metrics.record_checkin()
+        super()._do_return_conn(record)
+
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+
+def pool_settings() -> dict:
+    """
+    Configuração do pool (variáveis de ambiente)
+
+    Cada processo (worker uvicorn, scheduler) tem o seu próprio pool, logo
+    workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) deve caber em max_connections.
+    """
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    }
+
+
+def get_engine() -> Engine:
+    """Devolve o engine do processo (criado na primeira chamada)"""
+    global _engine
+
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                settings = pool_settings()
+                _engine = create_engine(
+                    os.getenv('DATABASE_URL'),
+                    poolclass=InstrumentedQueuePool,
+                    **settings
+                )
+                logger.info(f"Database engine created: {settings}")
+
+    return _engine
+
+
+def pool_status() -> dict:
+    """Estado atual do pool + métricas de checkout/espera"""
+    engine = get_engine()
+    pool = engine.pool
+
+    return {
+        'settings': pool_settings(),
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        **pool_metrics.snapshot()
+    }
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """
+    Executor dedicado às queries síncronas da API
+
+    Por defeito tem tantas threads quantas conexões o pool permite, para
+    que nenhuma thread fique bloqueada à espera de conexão.
+    """
+    global _executor
+
+    if _executor is None:
+        with _engine_lock:
+            if _executor is None:
+                settings = pool_settings()
+                workers = int(os.getenv(
+                    'DB_EXECUTOR_WORKERS',
+                    settings['pool_size'] + settings['max_overflow']
+                ))
+                _executor = ThreadPoolExecutor(
+                    max_workers=workers,
+                    thread_name_prefix='db'
+                )
+
+    return _executor
+
+
+async def run_db(fn: Callable, *args, **kwargs):
+    """Executa uma função de acesso à BD sem bloquear o event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_db_executor(),
+        functools.partial(fn, *args, **kwargs)
+    )
@@ -0,0 +1,367 @@
+# ml-service/dataset.py
+# Dataset de treino: OHLCV por símbolo em ficheiros memory-mapped + janelas zero-copy
+import json
+import logging
+import os
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from sqlalchemy import text
+
+from database import get_engine
+from file_lock import file_lock
+from sequence_cache import FEATURE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+TARGET = 'close'
+DTYPE = np.float32
+ROW_BYTES = len(FEATURE_COLUMNS) * np.dtype(DTYPE).itemsize
+
+# Formato dos ficheiros: a versão 1 (sem intervalo) misturava barras horárias
+FORMAT_VERSION = 2
+INTERVAL = '1d'
+
+
+def datasets_dir() -> str:
+    return os.getenv(
+        'DATASET_DIR',
+        os.path.join(os.path.dirname(__file__), 'data', 'datasets')
+    )
+
+
+def make_windows(values: np.ndarray, sequence_length: int, horizon: int):
+    """
+    Janelas (N, sequence_length, F) e alvos (N,) como vistas sobre `values`
+
+    A janela i termina na barra i + sequence_length - 1 e o alvo é o fecho
+    `horizon` barras depois. Nada é copiado: sobre um memmap, só as linhas
+    efetivamente lidas são carregadas.
+    """
+    target = FEATURE_COLUMNS.index(TARGET)
+    count = len(values) - sequence_length - horizon + 1
+    if count <= 0:
+        raise ValueError(
+            f"Not enough data: {len(values)} bars for sequence_length="
+            f"{sequence_length} and horizon={horizon}"
+        )
+
+    windows = sliding_window_view(values, sequence_length, axis=0)[:count]
+    windows = windows.transpose(0, 2, 1)
+    targets = values[sequence_length + horizon - 1:, target][:count]
+    return windows, targets
+
+
+class MinMaxScaler:
+    """Escala min/max por feature, aplicada lote a lote"""
+
+    def __init__(self, minimum: np.ndarray, maximum: np.ndarray):
+        self.min = np.asarray(minimum, dtype=DTYPE)
+        self.range = np.asarray(maximum, dtype=DTYPE) - self.min
+        self.range[self.range == 0] = 1.0
+
+    @classmethod
+    def fit(cls, values: np.ndarray) -> 'MinMaxScaler':
+        return cls(values.min(axis=0), values.max(axis=0))
+
+    def transform(self, x: np.ndarray) -> np.ndarray:
+        return (x - self.min) / self.range
+
+    def transform_target(self, y: np.ndarray) -> np.ndarray:
+        target = FEATURE_COLUMNS.index(TARGET)
+        return (y - self.min[target]) / self.range[target]
+
+    def inverse_target(self, y: np.ndarray) -> np.ndarray:
+        target = FEATURE_COLUMNS.index(TARGET)
+        return y * self.range[target] + self.min[target]
+
+    def to_dict(self) -> Dict:
+        return {'min': self.min.tolist(), 'max': (self.min + self.range).tolist()}
+
+
+class DatasetStore:
+    """
+    Um ficheiro float32 (rows x FEATURE_COLUMNS) + metadados JSON por símbolo
+
+    O ficheiro guarda valores brutos: a normalização depende do split de
+    treino e é aplicada por lote, pelo que novas barras só precisam de ser
+    acrescentadas ao fim.
+    """
+
+    def __init__(self, directory: Optional[str] = None, engine=None):
+        self.directory = directory or datasets_dir()
+        self.engine = engine or get_engine()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _paths(self, symbol: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, symbol)
+        return base + '.f32', base + '.json'
+
+    def metadata(self, symbol: str) -> Optional[Dict]:
+        _, meta_path = self._paths(symbol)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def _write_metadata(self, symbol: str, metadata: Dict):
+        _, meta_path = self._paths(symbol)
+        tmp = meta_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(tmp, meta_path)
+
+    def _iter_bars(self, symbol: str, since: Optional[str], batch_size: int = 10000):
+        """Barras desde `since` (inclusive), em lotes, com cursor no servidor"""
+        query = f"""
+            SELECT time, {', '.join(FEATURE_COLUMNS)}
+            FROM stock_data
+            WHERE symbol = :symbol
+            AND interval = :interval
+        """
+        params = {'symbol': symbol, 'interval': INTERVAL}
+        if since:
+            query += " AND time >= :since"
+            params['since'] = since
+        query += " ORDER BY time"
+
+        with self.engine.connect() as conn:
+            result = conn.execution_options(
+                stream_results=True,
+                yield_per=batch_size
+            ).execute(text(query), params)
+
+            for partition in result.partitions():
+                yield partition
+
+    def _checksum(self, symbol: str, before: str) -> List[Decimal]:
+        """Contagem e somas por coluna das barras anteriores a `before` (na BD)"""
+        sums = ', '.join(f"SUM({column})" for column in FEATURE_COLUMNS)
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text(f"""
+                    SELECT COUNT(*), {sums}
+                    FROM stock_data
+                    WHERE symbol = :symbol
+                    AND interval = :interval
+                    AND time < :before
+                """),
+                {'symbol': symbol, 'interval': INTERVAL, 'before': before}
+            ).first()
+        return [Decimal(value or 0) for value in row]
+
+    def _reusable(self, symbol: str) -> Optional[Dict]:
+        """Metadados se o ficheiro puder ser atualizado só no fim; senão None"""
+        data_path, _ = self._paths(symbol)
+        metadata = self.metadata(symbol)
+        if not metadata or not os.path.exists(data_path) or metadata['rows'] <= 0:
+            return None
+
+        if metadata.get('version') != FORMAT_VERSION or metadata.get('interval') != INTERVAL:
+            reason = 'outdated format'
+        elif os.path.getsize(data_path) != metadata['rows'] * ROW_BYTES:
+            reason = 'size mismatch'
+        elif [Decimal(v) for v in metadata['checksum']] != self._checksum(symbol, metadata['last_time']):
+            # Barras antes da última foram revistas (p.ex. a sobreposição semanal)
+            reason = 'revised bars'
+        else:
+            return metadata
+
+        logger.info(f"Dataset {symbol}: {reason}, rebuilding")
+        return None
+
+    def export(self, symbol: str, rebuild: bool = False) -> Dict:
+        """
+        Exporta (ou atualiza) o ficheiro de um símbolo
+
+        Em modo incremental a última barra gravada é reescrita (pode ter sido
+        revista, p.ex. a barra do dia) e as seguintes são acrescentadas. Se as
+        anteriores mudaram na BD (checksum), o formato é antigo ou o tamanho
+        não bate certo, o ficheiro é reexportado por inteiro.
+
+        Returns:
+            Metadados (rows, first_time, last_time, appended)
+        """
+        data_path, _ = self._paths(symbol)
+        with file_lock(data_path):
+            return self._export(symbol, rebuild)
+
+    def _export(self, symbol: str, rebuild: bool) -> Dict:
+        data_path, _ = self._paths(symbol)
+        metadata = None if rebuild else self._reusable(symbol)
+
+        rows = 0
+        since = None
+        sums = [Decimal(0)] * (len(FEATURE_COLUMNS) + 1)
+        if metadata:
+            rows = metadata['rows'] - 1
+            since = metadata['last_time']
+            sums = [Decimal(v) for v in metadata['checksum']]
+
+        first_time = metadata['first_time'] if metadata else None
+        last_time = None
+        last = None
+        appended = 0
+
+        # Reexportação num ficheiro novo: os memmaps já abertos ficam com o
+        # antigo. Em modo incremental o ficheiro só cresce.
+        path = data_path if metadata else data_path + '.tmp'
+        with open(path, 'r+b' if metadata else 'wb') as f:
+            f.seek(rows * ROW_BYTES)
+
+            for batch in self._iter_bars(symbol, since):
+                values = np.asarray([row[1:] for row in batch], dtype=DTYPE)
+                f.write(values.tobytes())
+                appended += len(values)
+                first_time = first_time or batch[0][0].isoformat()
+                last_time = batch[-1][0].isoformat()
+
+                sums[0] += len(batch)
+                for i in range(1, len(sums)):
+                    sums[i] += sum(Decimal(row[i]) for row in batch)
+                last = batch[-1]
+
+            f.truncate()
+
+        if last_time is None:
+            if not metadata:
+                os.remove(path)
+                raise LookupError(f"No data found for symbol {symbol}")
+            # A última barra desapareceu (improvável): reexportar tudo
+            return self._export(symbol, rebuild=True)
+
+        if not metadata:
+            os.replace(path, data_path)
+
+        # O checksum cobre as barras antes da última (reescrita no próximo export)
+        sums[0] -= 1
+        for i in range(1, len(sums)):
+            sums[i] -= Decimal(last[i])
+
+        metadata = {
+            'symbol': symbol,
+            'version': FORMAT_VERSION,
+            'interval': INTERVAL,
+            'columns': FEATURE_COLUMNS,
+            'dtype': np.dtype(DTYPE).name,
+            'rows': rows + appended,
+            'first_time': first_time,
+            'last_time': last_time,
+            'checksum': [str(v) for v in sums],
+            'exported_at': datetime.now().isoformat()
+        }
+        self._write_metadata(symbol, metadata)
+
+        logger.info(
+            f"Dataset {symbol}: {metadata['rows']} rows "
+            f"({appended} written{', full export' if since is None else ''})"
+        )
+        return {**metadata, 'appended': appended}
+
+    def open(self, symbol: str) -> np.memmap:
+        """Array (rows, F) só de leitura mapeado do ficheiro"""
+        data_path, _ = self._paths(symbol)
+        with file_lock(data_path, shared=True):
+            metadata = self.metadata(symbol)
+            if not metadata:
+                raise LookupError(f"No dataset exported for {symbol}")
+            if metadata.get('version') != FORMAT_VERSION:
+                raise LookupError(f"Dataset for {symbol} has an outdated format, export it again")
+
+            return np.memmap(
+                data_path,
+                dtype=DTYPE,
+                mode='r',
+                shape=(metadata['rows'], len(FEATURE_COLUMNS))
+            )
+
+
+class WindowDataset:
+    """
+    Janelas de treino de um símbolo servidas em lotes
+
+    `windows` é uma vista strided sobre o memmap; cada lote é o único sítio
+    onde os dados são materializados (e normalizados).
+    """
+
+    def __init__(
+        self,
+        values: np.ndarray,
+        sequence_length: int,
+        horizon: int = 1,
+        scaler: Optional[MinMaxScaler] = None
+    ):
+        self.windows, self.targets = make_windows(values, sequence_length, horizon)
+        self.sequence_length = sequence_length
+        self.scaler = scaler
+
+    def __len__(self) -> int:
+        return len(self.windows)
+
+    def batches(
+        self,
+        start: int = 0,
+        stop: Optional[int] = None,
+        batch_size: int = 32,
+        shuffle: bool = False,
+        seed: Optional[int] = None
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Lotes (x, y) das janelas [start, stop)"""
+        stop = len(self) if stop is None else stop
+        indices = np.arange(start, stop)
+        if shuffle:
+            np.random.default_rng(seed).shuffle(indices)
+
+        for i in range(0, len(indices), batch_size):
+            idx = indices[i:i + batch_size]
+            if not shuffle:
+                # Fatia contígua: evita o gather por índices
+                idx = slice(int(idx[0]), int(idx[-1]) + 1)
+            x = np.asarray(self.windows[idx], dtype=DTYPE)
+            y = np.asarray(self.targets[idx], dtype=DTYPE)
+            if self.scaler is not None:
+                x = self.scaler.transform(x)
+                y = self.scaler.transform_target(y)
+            yield x, y
+
+    def tf_dataset(
+        self,
+        start: int = 0,
+        stop: Optional[int] = None,
+        batch_size: int = 32,
+        shuffle: bool = False
+    ):
+        """tf.data.Dataset sobre batches() (novo shuffle a cada época)"""
+        import tensorflow as tf
+
+        features = len(FEATURE_COLUMNS)
+        dataset = tf.data.Dataset.from_generator(
+            lambda: self.batches(start, stop, batch_size, shuffle),
+            output_signature=(
+                tf.TensorSpec(shape=(None, self.sequence_length, features), dtype=tf.float32),
+                tf.TensorSpec(shape=(None,), dtype=tf.float32)
+            )
+        )
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Exporta datasets de treino (memmap)")
+    parser.add_argument('symbols', nargs='+', help="Símbolos a exportar")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Reexporta tudo em vez de acrescentar barras novas")
+    args = parser.parse_args()
+
+    store = DatasetStore()
+    for symbol in args.symbols:
+        try:
+            store.export(symbol.upper(), rebuild=args.rebuild)
+        except LookupError as e:
+            logger.error(str(e))
@@ -3,21 +3,19 @@
 Utilitários para trabalhar com a base de dados do BullEye
 """
 
-from sqlalchemy import create_engine, text, inspect
+from sqlalchemy import text, inspect
 import pandas as pd
-import os
-from dotenv import load_dotenv
 from tabulate import tabulate
-
-load_dotenv()
+from database import get_engine
+from rolling_stats import ALL_HISTORY, get_rolling_stats
+from schema_manager import SchemaManager
 
 
 class DatabaseUtils:
     """Ferramentas úteis para trabalhar com a BD"""
     
     def __init__(self):
-        self.db_url = os.getenv('DATABASE_URL')
-        self.engine = create_engine(self.db_url)
+        self.engine = get_engine()
     
     def list_tables(self):
         """Lista todas as tabelas no banco"""
@@ -113,6 +111,18 @@ class DatabaseUtils:
                 text("SELECT COUNT(DISTINCT symbol) FROM stock_data")
             ).fetchone()[0]
             
+            # Barras por intervalo (coletadas e agregadas)
+            intervals = conn.execute(
+                text("""
+                    SELECT interval,
+                           COUNT(*) FILTER (WHERE source = 'native') as native,
+                           COUNT(*) FILTER (WHERE source = 'rollup') as rollup
+                    FROM stock_data
+                    GROUP BY interval
+                    ORDER BY interval
+                """)
+            ).fetchall()
+            
             # Range de datas
             date_range = conn.execute(
                 text("""
@@ -130,6 +140,8 @@ class DatabaseUtils:
             print(f"Total de símbolos cadastrados: {total_symbols}")
             print(f"Símbolos com dados históricos: {symbols_with_data}")
             print(f"Total de registros históricos: {total_data:,}")
+            for interval, native, rollup in intervals:
+                print(f"  {interval}: {native:,} coletados, {rollup:,} agregados")
             
             if date_range and date_range[0]:
                 print(f"\nRange de datas:")
@@ -141,6 +153,24 @@ class DatabaseUtils:
     
     def get_symbol_stats(self, symbol: str):
         """Estatísticas detalhadas de um símbolo"""
+        # Resumo mantido pelo collector (evita o full scan do histórico)
+        rolling = get_rolling_stats(self.engine, symbol, ALL_HISTORY)
+        if rolling:
+            print("\n" + "=" * 60)
+            print(f"📈 Estatísticas: {symbol}")
+            print("=" * 60)
+            print(f"Total de registros: {rolling['data_points']:,}")
+            print(f"Primeira data: {rolling['first_time'][:10]}")
+            print(f"Última data: {rolling['last_time'][:10]}")
+            print(f"\nPreços:")
+            print(f"  Mínimo: ${rolling['min_price']:.2f}")
+            print(f"  Máximo: ${rolling['max_price']:.2f}")
+            print(f"  Média: ${rolling['average_price']:.2f}")
+            print(f"  Volatilidade: ${rolling['volatility'] or 0:.2f}")
+            print(f"\nVolume médio: {rolling['average_volume'] or 0:,}")
+            print("=" * 60)
+            return
+        
         with self.engine.connect() as conn:
             stats = conn.execute(
                 text("""
@@ -155,6 +185,7 @@ class DatabaseUtils:
                         STDDEV(close) as price_volatility
                     FROM stock_data
                     WHERE symbol = :symbol
+                    AND interval = '1d'
                 """),
                 {'symbol': symbol}
             ).fetchone()
@@ -223,6 +254,7 @@ class DatabaseUtils:
                             LAG(time) OVER (PARTITION BY symbol ORDER BY time) as prev_time,
                             time - LAG(time) OVER (PARTITION BY symbol ORDER BY time) as gap
                         FROM stock_data
+                        WHERE interval = '1d'
                     ) t
                     WHERE gap > INTERVAL '5 days'
                     GROUP BY symbol
@@ -238,6 +270,30 @@ class DatabaseUtils:
             
         print("=" * 60)
     
+    def verify_schema(self):
+        """Verifica índices, particionamento e planos das queries do stock_data"""
+        report = SchemaManager(self.engine).verify()
+        
+        print("\n🧱 Schema do stock_data")
+        print("=" * 60)
+        print(f"Revisão: {report['revision'] or 'sem migrações aplicadas'}")
+        print(f"Particionamento: {report['partitioning'] or 'nenhum'}")
+        print(f"Linhas (estimativa): {report['estimated_rows']:,}")
+        if report['missing_indexes']:
+            print(f"⚠️  Índices em falta ou inválidos (unicidade/colunas): {', '.join(report['missing_indexes'])}")
+        
+        print(tabulate(
+            [
+                [name, '✅' if plan['ok'] else '⚠️', ', '.join(plan['indexes']) or '-',
+                 ', '.join(plan['seq_scans']) or '-', plan['relations_scanned']]
+                for name, plan in report['plans'].items()
+            ],
+            headers=['Query', 'OK', 'Índices', 'Seq scans', 'Partições lidas'],
+            tablefmt='grid'
+        ))
+        print("=" * 60)
+        return report
+    
     def reset_table(self, table_name: str):
         """CUIDADO: Apaga todos os dados de uma tabela"""
         confirm = input(f"\n⚠️  TEM CERTEZA que quer apagar '{table_name}'? (yes/no): ")
@@ -266,6 +322,7 @@ if __name__ == "__main__":
         print("  python db_utils.py summary           - Resumo geral")
         print("  python db_utils.py stats SYMBOL      - Estatísticas de um símbolo")
         print("  python db_utils.py quality           - Verificar qualidade")
+        print("  python db_utils.py schema            - Índices, partições e planos do stock_data")
         sys.exit(0)
     
     command = sys.argv[1]
@@ -292,5 +349,8 @@ if __name__ == "__main__":
     elif command == 'quality':
         db.check_data_quality()
     
+    elif command == 'schema':
+        db.verify_schema()
+    
     else:
         print("❌ Comando inválido ou faltam argumentos")
\ No newline at end of file
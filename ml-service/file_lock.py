@@ -0,0 +1,23 @@
+# ml-service/file_lock.py
+# Lock entre processos (API, scheduler, workers) sobre ficheiros partilhados em disco
+import fcntl
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False):
+    """
+    flock sobre `path`.lock enquanto o bloco corre
+
+    Args:
+        path: Recurso protegido (o lock fica num ficheiro ao lado)
+        shared: Lock partilhado (leitores); por defeito exclusivo
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.lock', 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
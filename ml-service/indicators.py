@@ -0,0 +1,320 @@
+# ml-service/indicators.py
+# Indicadores técnicos vetorizados (NumPy) com atualização incremental
+import json
+import logging
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+from sqlalchemy import text
+
+from bulk_writer import BulkUpsertWriter
+
+logger = logging.getLogger(__name__)
+
+SMA_WINDOWS = (20, 50, 200)
+EMA_FAST, EMA_SLOW, MACD_SIGNAL = 12, 26, 9
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+BB_WINDOW, BB_STD = 20, 2.0
+
+# Fechos anteriores necessários para continuar as médias móveis
+TAIL_SIZE = max(SMA_WINDOWS) - 1
+
+INDICATOR_COLUMNS = [
+    'time', 'symbol', 'sma_20', 'sma_50', 'sma_200', 'ema_12', 'ema_26',
+    'rsi', 'macd', 'macd_signal', 'macd_hist', 'bb_upper', 'bb_middle',
+    'bb_lower', 'atr', 'obv'
+]
+
+# Estado incremental (sementes das EMAs, janela de fechos, OBV), como no init.sql
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS indicator_state (
+        symbol VARCHAR(20) PRIMARY KEY,
+        last_time TIMESTAMPTZ NOT NULL,
+        state JSONB NOT NULL,
+        updated_at TIMESTAMPTZ DEFAULT NOW()
+    )
+"""
+
+
+def _ema(values: np.ndarray, alpha: float, prev: Optional[float] = None) -> np.ndarray:
+    """
+    EMA recursiva y[t] = alpha * x[t] + (1 - alpha) * y[t-1] via lfilter
+
+    Sem estado anterior a série é semeada com o primeiro valor.
+    """
+    if len(values) == 0:
+        return values
+
+    seed = values[0] if prev is None else prev
+    y, _ = lfilter([alpha], [1.0, alpha - 1.0], values, zi=[(1.0 - alpha) * seed])
+    return y
+
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Soma móvel por diferença de somas acumuladas (NaN até encher a janela)"""
+    out = np.full(len(values), np.nan)
+    if len(values) >= window:
+        csum = np.cumsum(np.insert(values, 0, 0.0))
+        out[window - 1:] = csum[window:] - csum[:-window]
+    return out
+
+
+def compute_indicators(
+    df: pd.DataFrame,
+    state: Optional[Dict] = None
+) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Calcula os indicadores de um símbolo numa única passagem vetorizada
+
+    Args:
+        df: Barras em ordem cronológica (time, symbol, high, low, close, volume)
+        state: Estado devolvido pela chamada anterior (continua as séries)
+
+    Returns:
+        (DataFrame com INDICATOR_COLUMNS, novo estado)
+    """
+    state = state or {}
+
+    close = df['close'].to_numpy(dtype=float)
+    high = df['high'].to_numpy(dtype=float)
+    low = df['low'].to_numpy(dtype=float)
+    volume = df['volume'].to_numpy(dtype=float)
+
+    prev_close = state.get('prev_close')
+    has_prev = prev_close is not None
+    prev = np.concatenate([[prev_close if has_prev else close[0]], close[:-1]])
+
+    # Médias móveis simples e Bollinger (janela continua com os fechos anteriores)
+    tail = np.asarray(state.get('tail_close', []), dtype=float)
+    extended = np.concatenate([tail, close])
+    offset = len(tail)
+
+    result = {'time': df['time'].to_numpy(), 'symbol': df['symbol'].to_numpy()}
+    for window in SMA_WINDOWS:
+        result[f'sma_{window}'] = _rolling_sum(extended, window)[offset:] / window
+
+    mean = result[f'sma_{BB_WINDOW}']
+    sq_mean = _rolling_sum(extended ** 2, BB_WINDOW)[offset:] / BB_WINDOW
+    std = np.sqrt(np.clip(sq_mean - mean ** 2, 0.0, None))
+    result['bb_middle'] = mean
+    result['bb_upper'] = mean + BB_STD * std
+    result['bb_lower'] = mean - BB_STD * std
+
+    # EMAs e MACD
+    ema_fast = _ema(close, 2.0 / (EMA_FAST + 1), state.get('ema_12'))
+    ema_slow = _ema(close, 2.0 / (EMA_SLOW + 1), state.get('ema_26'))
+    macd = ema_fast - ema_slow
+    macd_signal = _ema(macd, 2.0 / (MACD_SIGNAL + 1), state.get('macd_signal'))
+    result.update(
+        ema_12=ema_fast,
+        ema_26=ema_slow,
+        macd=macd,
+        macd_signal=macd_signal,
+        macd_hist=macd - macd_signal
+    )
+
+    # RSI (suavização de Wilder); a primeira barra sem histórico não tem variação
+    delta = close - prev
+    start = 0 if has_prev else 1
+    rsi = np.full(len(close), np.nan)
+    avg_gain = state.get('avg_gain')
+    avg_loss = state.get('avg_loss')
+    if len(close) > start:
+        gains = _ema(np.clip(delta[start:], 0.0, None), 1.0 / RSI_PERIOD, avg_gain)
+        losses = _ema(np.clip(-delta[start:], 0.0, None), 1.0 / RSI_PERIOD, avg_loss)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi[start:] = np.where(
+                losses == 0,
+                100.0,
+                100.0 - 100.0 / (1.0 + gains / losses)
+            )
+        avg_gain, avg_loss = float(gains[-1]), float(losses[-1])
+    result['rsi'] = rsi
+
+    # ATR (Wilder) sobre o true range
+    true_range = np.maximum.reduce([
+        high - low,
+        np.abs(high - prev),
+        np.abs(low - prev)
+    ])
+    atr = _ema(true_range, 1.0 / ATR_PERIOD, state.get('atr'))
+    result['atr'] = atr
+
+    # OBV
+    direction = np.sign(delta)
+    if not has_prev:
+        direction[0] = 0.0
+    obv = state.get('obv', 0.0) + np.cumsum(direction * volume)
+    result['obv'] = obv
+
+    features = pd.DataFrame(result)[INDICATOR_COLUMNS]
+
+    new_state = {
+        'last_time': pd.Timestamp(df['time'].iloc[-1]).isoformat(),
+        'prev_close': float(close[-1]),
+        'tail_close': extended[-TAIL_SIZE:].tolist(),
+        'ema_12': float(ema_fast[-1]),
+        'ema_26': float(ema_slow[-1]),
+        'macd_signal': float(macd_signal[-1]),
+        'avg_gain': avg_gain,
+        'avg_loss': avg_loss,
+        'atr': float(atr[-1]),
+        'obv': float(obv[-1])
+    }
+
+    return features, new_state
+
+
+class IndicatorStore:
+    """
+    Feature store de indicadores técnicos (tabela technical_indicators)
+
+    O estado de cada símbolo (sementes das EMAs, fechos da janela, OBV)
+    fica em indicator_state, para que novas barras sejam processadas sem
+    recalcular o histórico.
+    """
+
+    def __init__(self, engine, writer: Optional[BulkUpsertWriter] = None):
+        self.engine = engine
+        self.writer = writer or BulkUpsertWriter(engine)
+
+    def _load_state(self, symbol: str) -> Optional[Dict]:
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text("SELECT state FROM indicator_state WHERE symbol = :symbol"),
+                {'symbol': symbol}
+            ).fetchone()
+
+        if not row:
+            return None
+        return row[0] if isinstance(row[0], dict) else json.loads(row[0])
+
+    def _load_history(self, symbol: str) -> pd.DataFrame:
+        with self.engine.connect() as conn:
+            return pd.read_sql(
+                text("""
+                    SELECT time, symbol, open, high, low, close, volume
+                    FROM stock_data
+                    WHERE symbol = :symbol
+                    AND interval = '1d'
+                    ORDER BY time
+                """),
+                conn,
+                params={'symbol': symbol}
+            )
+
+    def _save(self, symbol: str, features: pd.DataFrame, state: Dict):
+        rows = features.copy()
+        numeric = [c for c in INDICATOR_COLUMNS if c not in ('time', 'symbol', 'obv')]
+        rows[numeric] = rows[numeric].round(4)
+        rows['obv'] = rows['obv'].round().astype('Int64')
+
+        self.writer.upsert(
+            rows,
+            'technical_indicators',
+            INDICATOR_COLUMNS,
+            ['time', 'symbol']
+        )
+
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO indicator_state (symbol, last_time, state, updated_at)
+                    VALUES (:symbol, :last_time, CAST(:state AS JSONB), NOW())
+                    ON CONFLICT (symbol) DO UPDATE SET
+                        last_time = EXCLUDED.last_time,
+                        state = EXCLUDED.state,
+                        updated_at = EXCLUDED.updated_at
+                """),
+                {
+                    'symbol': symbol,
+                    'last_time': state['last_time'],
+                    'state': json.dumps(state)
+                }
+            )
+
+    def rebuild(self, symbol: str, since: Optional[pd.Timestamp] = None) -> int:
+        """
+        Recalcula todo o histórico de um símbolo
+
+        Args:
+            since: Só reescrever linhas a partir desta data (as anteriores
+                   não mudam quando apenas barras recentes foram revistas)
+        """
+        history = self._load_history(symbol)
+        if history.empty:
+            return 0
+
+        features, state = compute_indicators(history)
+        if since is not None:
+            features = features[pd.to_datetime(features['time'], utc=True) >= since]
+        self._save(symbol, features, state)
+        logger.info(f"Rebuilt {len(features)} indicator rows for {symbol}")
+        return len(features)
+
+    def update(self, symbol: str, bars: pd.DataFrame, revised: bool = False) -> int:
+        """
+        Atualiza os indicadores após a escrita de novas barras
+
+        Args:
+            symbol: Símbolo
+            bars: Barras acabadas de escrever
+            revised: Barras já existentes mudaram (obriga a recalcular)
+
+        Returns:
+            Número de linhas de indicadores escritas
+        """
+        bars = bars.copy()
+        bars['time'] = pd.to_datetime(bars['time'], utc=True)
+
+        if revised:
+            return self.rebuild(symbol, since=bars['time'].min())
+
+        state = self._load_state(symbol)
+        if state is None:
+            return self.rebuild(symbol)
+        new_bars = bars[
+            bars['time'] > pd.Timestamp(state['last_time'])
+        ].sort_values('time')
+
+        if new_bars.empty:
+            return 0
+
+        features, state = compute_indicators(new_bars, state)
+        self._save(symbol, features, state)
+        return len(features)
+
+    def get_analysis(self, symbol: str, limit: int = 100) -> Optional[Dict]:
+        """Últimas `limit` linhas de indicadores (ordem cronológica)"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f"""
+                    SELECT {', '.join(INDICATOR_COLUMNS)}
+                    FROM technical_indicators
+                    WHERE symbol = :symbol
+                    ORDER BY time DESC
+                    LIMIT :limit
+                """),
+                {'symbol': symbol, 'limit': limit}
+            ).mappings().all()
+
+        if not rows:
+            return None
+
+        data = []
+        for row in reversed(rows):
+            item = {'time': row['time'].isoformat()}
+            for column in INDICATOR_COLUMNS[2:]:
+                value = row[column]
+                item[column] = float(value) if value is not None else None
+            data.append(item)
+
+        return {
+            'symbol': symbol,
+            'count': len(data),
+            'latest': data[-1],
+            'data': data
+        }
@@ -0,0 +1,158 @@
+# ml-service/job_runs.py
+# Histórico de execuções dos jobs do scheduler (duração, linhas escritas, skips)
+import json
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS scheduler_job_runs (
+        id BIGSERIAL PRIMARY KEY,
+        job_name VARCHAR(50) NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        scheduled_at TIMESTAMPTZ NOT NULL,
+        started_at TIMESTAMPTZ,
+        finished_at TIMESTAMPTZ,
+        duration_seconds NUMERIC(10,3),
+        jitter_seconds NUMERIC(8,3),
+        symbols INTEGER,
+        rows_inserted INTEGER,
+        rows_updated INTEGER,
+        errors INTEGER,
+        error_message TEXT,
+        details JSONB
+    );
+    CREATE INDEX IF NOT EXISTS idx_scheduler_job_runs_name
+        ON scheduler_job_runs (job_name, scheduled_at DESC);
+"""
+
+
+class JobRunLog:
+    """Persiste cada execução (ou skip por sobreposição) de um job agendado"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._table_ready = False
+
+    def _ensure_table(self):
+        if self._table_ready:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text(CREATE_TABLE))
+        self._table_ready = True
+
+    def record(
+        self,
+        job_name: str,
+        status: str,
+        scheduled_at: datetime,
+        started_at: Optional[datetime] = None,
+        finished_at: Optional[datetime] = None,
+        jitter: float = 0.0,
+        result: Optional[Dict] = None,
+        error: Optional[str] = None
+    ):
+        """Grava uma execução; erros de escrita só são registados no log"""
+        result = result or {}
+        duration = (finished_at - started_at).total_seconds() \
+            if started_at and finished_at else None
+
+        try:
+            self._ensure_table()
+            with self.engine.begin() as conn:
+                conn.execute(
+                    text("""
+                        INSERT INTO scheduler_job_runs (
+                            job_name, status, scheduled_at, started_at,
+                            finished_at, duration_seconds, jitter_seconds,
+                            symbols, rows_inserted, rows_updated, errors,
+                            error_message, details
+                        )
+                        VALUES (
+                            :job_name, :status, :scheduled_at, :started_at,
+                            :finished_at, :duration, :jitter,
+                            :symbols, :rows_inserted, :rows_updated, :errors,
+                            :error, CAST(:details AS JSONB)
+                        )
+                    """),
+                    {
+                        'job_name': job_name,
+                        'status': status,
+                        'scheduled_at': scheduled_at,
+                        'started_at': started_at,
+                        'finished_at': finished_at,
+                        'duration': duration,
+                        'jitter': jitter,
+                        'symbols': result.get('total'),
+                        'rows_inserted': result.get('rows_inserted'),
+                        'rows_updated': result.get('rows_updated'),
+                        'errors': result.get('errors'),
+                        'error': error,
+                        'details': json.dumps({
+                            k: v for k, v in result.items() if k != 'timings'
+                        }) if result else None
+                    }
+                )
+        except Exception as e:
+            logger.error(f"Error recording run of {job_name}: {str(e)}")
+
+    def summary(self, limit: int = 10) -> List[Dict]:
+        """
+        Por job: última execução e médias das últimas `limit`
+
+        Uma duração média a aproximar-se do intervalo entre execuções (ou
+        skips frequentes) indica que a coleta já não acompanha a watchlist.
+        """
+        self._ensure_table()
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("""
+                    WITH recent AS (
+                        SELECT *,
+                               ROW_NUMBER() OVER (
+                                   PARTITION BY job_name ORDER BY scheduled_at DESC
+                               ) AS rn
+                        FROM scheduler_job_runs
+                    )
+                    SELECT
+                        job_name,
+                        MAX(scheduled_at) AS last_scheduled_at,
+                        (ARRAY_AGG(status ORDER BY scheduled_at DESC))[1] AS last_status,
+                        (ARRAY_AGG(duration_seconds ORDER BY scheduled_at DESC)
+                            FILTER (WHERE duration_seconds IS NOT NULL))[1] AS last_duration,
+                        AVG(duration_seconds) AS avg_duration,
+                        MAX(duration_seconds) AS max_duration,
+                        AVG(rows_inserted + rows_updated) AS avg_rows_written,
+                        COUNT(*) FILTER (WHERE status = 'skipped') AS skipped,
+                        COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+                        COUNT(*) AS runs
+                    FROM recent
+                    WHERE rn <= :limit
+                    GROUP BY job_name
+                    ORDER BY job_name
+                """),
+                {'limit': limit}
+            ).mappings().all()
+
+        def _float(value):
+            return float(value) if value is not None else None
+
+        return [
+            {
+                'job_name': row['job_name'],
+                'last_scheduled_at': row['last_scheduled_at'].isoformat(),
+                'last_status': row['last_status'],
+                'last_duration_seconds': _float(row['last_duration']),
+                'avg_duration_seconds': _float(row['avg_duration']),
+                'max_duration_seconds': _float(row['max_duration']),
+                'avg_rows_written': _float(row['avg_rows_written']),
+                'skipped': row['skipped'],
+                'failed': row['failed'],
+                'runs': row['runs']
+            }
+            for row in rows
+        ]
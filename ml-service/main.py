@@ -1,17 +1,28 @@
 # ml-service/main.py
 # API FastAPI com endpoints REST (/collect, /stocks, /stocks/{symbol}/data, etc)
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime
+import asyncio
+import itertools
 import logging
 from data_collector import StockDataCollector
-from sqlalchemy import create_engine, text
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from collection_jobs import INCREMENTAL, CollectionJobManager
+from job_runs import JobRunLog
+from database import get_engine, get_db_executor, pool_status, run_db
+from cache import get_cache, data_key, latest_key, symbol_prefix
+from market_movers import MARKET_PREFIX, RANKINGS
+from rollups import INTERVALS
+import stock_queries
+import stock_formats
+from sequence_cache import SequenceCache
+from predictor import Predictor
+from model_registry import GLOBAL_MODEL, ModelRegistry
+from training_jobs import TERMINAL_STATUSES, get_job_store
+from schema_manager import SchemaManager
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,9 +42,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Database
-db_url = os.getenv('DATABASE_URL')
-engine = create_engine(db_url)
+# Database (pool partilhado do processo)
+engine = get_engine()
+
+# Migrações e verificação dos índices/particionamento do stock_data
+schema_manager = SchemaManager(engine)
+
+# Collector partilhado (mesmo engine e rate limiter para todos os pedidos)
+collector = StockDataCollector(engine=engine)
+
+# Jobs de coleta em background (deduplicados, com limite global)
+collection_jobs = CollectionJobManager(collector)
+
+# Histórico das execuções do scheduler (processo separado)
+scheduler_runs = JobRunLog(engine)
+
+# Cache de leitura (memória + Redis)
+stock_cache = get_cache()
+
+# Janelas em memória para inferência (recarregadas após cada coleta)
+sequence_cache = SequenceCache(engine)
+collector.post_collection_hooks.append(sequence_cache.refresh)
+
+# Modelos por símbolo (LRU limitada em bytes) e previsões com micro-batching
+model_registry = ModelRegistry()
+predictor = Predictor(sequence_cache, model_registry)
+
+# Fila de treino (os jobs correm no training worker, fora da API)
+training_store = get_job_store()
 
 
 # Models
@@ -59,6 +95,47 @@ class CollectionStatus(BaseModel):
     details: Optional[dict] = None
 
 
+class PredictionRequest(BaseModel):
+    symbol: str
+    days_ahead: int = 1
+
+
+class BatchPredictionRequest(BaseModel):
+    symbols: List[str]
+    days_ahead: int = 1
+
+
+class TrainRequest(BaseModel):
+    symbol: str
+    sequence_length: int = 60
+    prediction_horizon: int = 1
+    epochs: int = 100
+    validation_split: float = 0.2
+    wait: Optional[float] = None  # Segundos à espera do fim do job
+
+
+@app.on_event("startup")
+async def startup():
+    # Migrações pendentes + EXPLAIN das queries quentes, sem bloquear o arranque
+    asyncio.get_running_loop().run_in_executor(
+        get_db_executor(), schema_manager.startup
+    )
+    
+    # Invalidações feitas pelo scheduler/outros workers limpam a cache local
+    stock_cache.start_invalidation_listener()
+    
+    # Batcher no event loop do servidor; pré-carga da watchlist em background
+    predictor.batcher.start()
+    asyncio.get_running_loop().run_in_executor(
+        get_db_executor(), sequence_cache.preload
+    )
+    
+    # Modelos da watchlist carregados numa thread própria
+    model_registry.start_warm_up(
+        lambda: sequence_cache.watchlist_symbols() + [GLOBAL_MODEL]
+    )
+
+
 # Routes
 @app.get("/")
 async def root():
@@ -74,8 +151,7 @@ async def health_check():
     """Health check endpoint"""
     try:
         # Testar conexão com banco
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
+        await run_db(stock_queries.check_connection)
         
         return {
             "status": "healthy",
@@ -86,34 +162,88 @@ async def health_check():
         raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}")
 
 
+@app.get("/metrics/db-pool")
+async def db_pool_metrics():
+    """Métricas do pool de conexões (checkouts, esperas, overflow)"""
+    return pool_status()
+
+
+@app.get("/metrics/cache")
+async def cache_metrics():
+    """Hits/misses da cache de leitura"""
+    return stock_cache.stats()
+
+
+@app.get("/metrics/predictions")
+async def prediction_metrics():
+    """Tamanho dos lotes de inferência e estado da cache de janelas"""
+    return predictor.stats()
+
+
+@app.get("/metrics/models")
+async def model_metrics():
+    """Tempos de carregamento, bytes residentes e evictions dos modelos"""
+    return model_registry.stats()
+
+
+@app.get("/metrics/schema")
+async def schema_metrics(refresh: bool = False):
+    """Revisão das migrações, particionamento e planos das queries do stock_data"""
+    try:
+        if refresh or schema_manager.last_report is None:
+            return await run_db(schema_manager.verify)
+        return schema_manager.last_report
+    except Exception as e:
+        logger.error(f"Error verifying schema: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/metrics/collector")
+async def collector_metrics():
+    """Retries, circuit breaker, cache negativa, metadados e data lake do provider"""
+    return {
+        **collector.resilient.stats(),
+        'metadata': collector.metadata.stats(),
+        'data_lake': collector.provider.stats() if collector.lake else None,
+        'rate_limiter': {
+            'acquired': collector.rate_limiter.acquired,
+            'total_wait_seconds': round(collector.rate_limiter.total_wait, 3)
+        }
+    }
+
+
+@app.get("/metrics/scheduler")
+async def scheduler_metrics(limit: int = 10):
+    """Última execução, duração média e skips de cada job do scheduler"""
+    try:
+        return {"jobs": await run_db(scheduler_runs.summary, limit)}
+    except Exception as e:
+        logger.error(f"Error fetching scheduler metrics: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/collect", response_model=CollectionStatus)
-async def collect_data(
-    request: CollectionRequest,
-    background_tasks: BackgroundTasks
-):
+async def collect_data(request: CollectionRequest):
     """
     Inicia coleta de dados para os símbolos especificados
-    A coleta é feita em background
+    
+    A coleta corre em background como job (GET /collect/jobs/{job_id});
+    símbolos já em coleta com o mesmo período/intervalo não são repetidos.
     """
     try:
-        collector = StockDataCollector()
-        
-        # Executar em background
-        background_tasks.add_task(
-            collector.collect_multiple_stocks,
+        job = collection_jobs.submit(
             request.symbols,
             request.period,
             request.interval
         )
         
         return CollectionStatus(
-            status="started",
-            message=f"Data collection started for {len(request.symbols)} stocks",
-            details={
-                "symbols": request.symbols,
-                "period": request.period,
-                "interval": request.interval
-            }
+            status=job.status,
+            message=(
+                f"Data collection queued for {len(job.symbols)} stocks"
+                f" ({len(job.coalesced)} already in progress)"
+            ),
+            details=job.to_dict()
         )
         
     except Exception as e:
@@ -121,44 +251,182 @@ async def collect_data(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/collect/jobs")
+async def list_collection_jobs(status: Optional[str] = None, limit: int = 50):
+    """Jobs de coleta recentes e estado do gestor"""
+    return {
+        "jobs": collection_jobs.list(status, limit),
+        "stats": collection_jobs.stats()
+    }
+
+
+@app.get("/collect/jobs/{job_id}")
+async def get_collection_job(job_id: str):
+    """Estado e progresso por símbolo de um job de coleta"""
+    job = collection_jobs.get(job_id)
+    
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Collection job {job_id} not found")
+    
+    return job.to_dict()
+
+
 @app.get("/stocks")
 async def list_stocks():
     """Lista todas as ações disponíveis no banco"""
     try:
-        with engine.connect() as conn:
-            query = text("""
-                SELECT symbol, name, exchange, sector, created_at
-                FROM stock_symbols
-                ORDER BY symbol
-            """)
-            result = conn.execute(query)
-            
-            stocks = []
-            for row in result:
-                stocks.append({
-                    'symbol': row[0],
-                    'name': row[1],
-                    'exchange': row[2],
-                    'sector': row[3],
-                    'created_at': row[4].isoformat() if row[4] else None
-                })
-            
-            return {
-                "count": len(stocks),
-                "stocks": stocks
-            }
+        stocks = await run_db(stock_queries.list_stocks)
+        
+        return {
+            "count": len(stocks),
+            "stocks": stocks
+        }
             
     except Exception as e:
         logger.error(f"Error listing stocks: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/market/movers")
+async def get_market_movers(kind: str = "gainers", limit: int = 10):
+    """
+    Rankings pré-calculados após cada coleta
+    
+    Args:
+        kind: gainers, losers ou volume
+        limit: Número de ações
+    """
+    if kind not in RANKINGS:
+        raise HTTPException(status_code=400, detail=f"Unsupported ranking: {kind}")
+    
+    try:
+        key = f"{MARKET_PREFIX}movers:{kind}:{limit}"
+        found, movers = stock_cache.get_local(key)
+        if not found:
+            movers = await run_db(
+                stock_cache.get_or_load,
+                key,
+                collector.market_movers.get_movers,
+                kind, limit,
+                prefix=MARKET_PREFIX
+            )
+        return movers
+        
+    except Exception as e:
+        logger.error(f"Error fetching market movers: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/market/sectors")
+async def get_market_sectors():
+    """Agregados por setor pré-calculados após cada coleta"""
+    try:
+        key = f"{MARKET_PREFIX}sectors"
+        found, sectors = stock_cache.get_local(key)
+        if not found:
+            sectors = await run_db(
+                stock_cache.get_or_load,
+                key,
+                collector.market_movers.get_sectors,
+                prefix=MARKET_PREFIX
+            )
+        return sectors
+        
+    except Exception as e:
+        logger.error(f"Error fetching sector aggregates: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/stocks/summary")
+async def get_stocks_summary(
+    symbols: str = "all",
+    days: int = 30,
+    sort: str = "symbol",
+    order: str = "asc",
+    top: Optional[int] = None
+):
+    """
+    Último preço, variação diária e estatísticas de vários símbolos
+    
+    Args:
+        symbols: Lista separada por vírgulas (ex: AAPL,MSFT) ou "all"
+        days: Janela das estatísticas
+        sort: change_percent, change, volume, close, volatility ou symbol
+        order: asc ou desc
+        top: Devolver só os primeiros N (ex: top gainers)
+    """
+    try:
+        symbol_list = None
+        if symbols.lower() != "all":
+            symbol_list = [s.strip().upper() for s in symbols.split(",") if s.strip()]
+        
+        if sort not in stock_queries.SUMMARY_SORT_COLUMNS:
+            raise HTTPException(status_code=400, detail=f"Unsupported sort: {sort}")
+        
+        summary = await run_db(
+            stock_queries.get_market_summary,
+            symbol_list,
+            days,
+            sort,
+            order.lower() == "desc",
+            top
+        )
+        
+        return {
+            "count": len(summary),
+            "sort": sort,
+            "order": order.lower(),
+            "stocks": summary
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error building stocks summary: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _check_interval(interval: str):
+    if interval not in INTERVALS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported interval: {interval} (use {', '.join(INTERVALS)})"
+        )
+
+
+@app.get("/stocks/{symbol}/intervals")
+async def get_stock_intervals(symbol: str):
+    """Intervalos disponíveis de uma ação (barras coletadas e agregadas)"""
+    try:
+        symbol = symbol.upper()
+        intervals = await run_db(stock_queries.get_intervals, symbol)
+        
+        if not intervals:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No data found for symbol {symbol}"
+            )
+        
+        return {
+            "symbol": symbol,
+            "intervals": intervals
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching intervals: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/stocks/{symbol}/data")
 async def get_stock_data(
     symbol: str,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    limit: int = 100
+    limit: int = 100,
+    format: str = "json",
+    interval: str = "1d"
 ):
     """
     Retorna dados históricos de uma ação
@@ -168,56 +436,42 @@ async def get_stock_data(
         start_date: Data inicial (YYYY-MM-DD)
         end_date: Data final (YYYY-MM-DD)
         limit: Número máximo de registros
+        format: json (default), columnar, ndjson, arrow ou parquet
+        interval: 1m, 1h ou 1d (barras coletadas ou agregadas)
     """
     try:
         symbol = symbol.upper()
+        _check_interval(interval)
         
-        # Construir query
-        query_str = """
-            SELECT time, symbol, open, high, low, close, volume
-            FROM stock_data
-            WHERE symbol = :symbol
-        """
+        if format != "json":
+            return await _stock_data_response(
+                symbol, start_date, end_date, limit, format, interval
+            )
         
-        params = {'symbol': symbol}
+        key = data_key(symbol, start_date, end_date, limit, interval)
         
-        if start_date:
-            query_str += " AND time >= :start_date"
-            params['start_date'] = start_date
-            
-        if end_date:
-            query_str += " AND time <= :end_date"
-            params['end_date'] = end_date
+        found, data = stock_cache.get_local(key)
+        if not found:
+            data = await run_db(
+                stock_cache.get_or_load,
+                key,
+                stock_queries.get_stock_data,
+                symbol, start_date, end_date, limit, interval,
+                symbol=symbol
+            )
         
-        query_str += " ORDER BY time DESC LIMIT :limit"
-        params['limit'] = limit
+        if not data:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No {interval} data found for symbol {symbol}"
+            )
         
-        with engine.connect() as conn:
-            result = conn.execute(text(query_str), params)
-            
-            data = []
-            for row in result:
-                data.append({
-                    'time': row[0].isoformat(),
-                    'symbol': row[1],
-                    'open': float(row[2]),
-                    'high': float(row[3]),
-                    'low': float(row[4]),
-                    'close': float(row[5]),
-                    'volume': int(row[6])
-                })
-            
-            if not data:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"No data found for symbol {symbol}"
-                )
-            
-            return {
-                "symbol": symbol,
-                "count": len(data),
-                "data": list(reversed(data))  # Ordem cronológica
-            }
+        return {
+            "symbol": symbol,
+            "interval": interval,
+            "count": len(data),
+            "data": data
+        }
             
     except HTTPException:
         raise
@@ -226,37 +480,117 @@ async def get_stock_data(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _stock_data_response(
+    symbol: str,
+    start_date: Optional[str],
+    end_date: Optional[str],
+    limit: int,
+    format: str,
+    interval: str
+):
+    """Respostas colunar/streaming lidas com cursor no servidor"""
+    if format not in ("columnar", "ndjson", "arrow", "parquet"):
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    
+    if format in ("arrow", "parquet") and not stock_formats.arrow_available():
+        raise HTTPException(status_code=501, detail="pyarrow is not installed")
+    
+    batches = stock_queries.iter_stock_data_batches(
+        symbol, start_date, end_date, limit, interval=interval
+    )
+    
+    # Ler o primeiro lote para poder responder 404 antes de iniciar o stream
+    first = await run_db(next, batches, None)
+    if first is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No {interval} data found for symbol {symbol}"
+        )
+    batches = itertools.chain([first], batches)
+    
+    if format == "columnar":
+        return await run_db(stock_formats.columnar, symbol, batches)
+    
+    if format == "ndjson":
+        content = stock_formats.ndjson_stream(symbol, batches)
+    elif format == "arrow":
+        content = stock_formats.arrow_stream(batches)
+    else:
+        content = stock_formats.parquet_stream(batches)
+    
+    return StreamingResponse(
+        content,
+        media_type=stock_formats.MEDIA_TYPES[format],
+        headers={"X-Symbol": symbol}
+    )
+
+
+@app.get("/stocks/{symbol}/analysis")
+# Caminho usado pelo backend (ml.service.js getStockAnalysis)
+@app.get("/api/data/stocks/{symbol}/analysis")
+async def get_stock_analysis(symbol: str, limit: int = 100):
+    """
+    Indicadores técnicos (SMA, EMA, RSI, MACD, Bollinger, ATR, OBV)
+    
+    Args:
+        symbol: Símbolo da ação
+        limit: Número de barras mais recentes
+    """
+    try:
+        symbol = symbol.upper()
+        key = f"{symbol_prefix(symbol)}analysis:{limit}"
+        
+        found, analysis = stock_cache.get_local(key)
+        if not found:
+            analysis = await run_db(
+                stock_cache.get_or_load,
+                key,
+                collector.indicators.get_analysis,
+                symbol, limit,
+                symbol=symbol
+            )
+        
+        if not analysis:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No indicators found for symbol {symbol}"
+            )
+        
+        return analysis
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching analysis: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/stocks/{symbol}/latest")
-async def get_latest_price(symbol: str):
-    """Retorna o último preço disponível de uma ação"""
+async def get_latest_price(symbol: str, interval: str = "1d"):
+    """Retorna a última barra disponível de uma ação no intervalo pedido"""
     try:
         symbol = symbol.upper()
+        _check_interval(interval)
         
-        with engine.connect() as conn:
-            query = text("""
-                SELECT time, open, high, low, close, volume
-                FROM stock_data
-                WHERE symbol = :symbol
-                ORDER BY time DESC
-                LIMIT 1
-            """)
-            result = conn.execute(query, {'symbol': symbol}).fetchone()
-            
-            if not result:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"No data found for symbol {symbol}"
-                )
-            
-            return {
-                'symbol': symbol,
-                'time': result[0].isoformat(),
-                'open': float(result[1]),
-                'high': float(result[2]),
-                'low': float(result[3]),
-                'close': float(result[4]),
-                'volume': int(result[5])
-            }
+        key = latest_key(symbol, interval)
+        
+        found, latest = stock_cache.get_local(key)
+        if not found:
+            latest = await run_db(
+                stock_cache.get_or_load,
+                key,
+                stock_queries.get_latest_price,
+                symbol, interval,
+                symbol=symbol
+            )
+        
+        if not latest:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No {interval} data found for symbol {symbol}"
+            )
+        
+        return latest
             
     except HTTPException:
         raise
@@ -276,43 +610,16 @@ async def get_stock_statistics(symbol: str, days: int = 30):
     """
     try:
         symbol = symbol.upper()
-        start_date = datetime.now() - timedelta(days=days)
-        
-        with engine.connect() as conn:
-            query = text("""
-                SELECT 
-                    COUNT(*) as count,
-                    AVG(close) as avg_price,
-                    MIN(low) as min_price,
-                    MAX(high) as max_price,
-                    AVG(volume) as avg_volume,
-                    STDDEV(close) as volatility
-                FROM stock_data
-                WHERE symbol = :symbol
-                AND time >= :start_date
-            """)
-            
-            result = conn.execute(
-                query,
-                {'symbol': symbol, 'start_date': start_date}
-            ).fetchone()
-            
-            if not result or result[0] == 0:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"No data found for symbol {symbol}"
-                )
-            
-            return {
-                'symbol': symbol,
-                'period_days': days,
-                'data_points': result[0],
-                'average_price': float(result[1]) if result[1] else None,
-                'min_price': float(result[2]) if result[2] else None,
-                'max_price': float(result[3]) if result[3] else None,
-                'average_volume': int(result[4]) if result[4] else None,
-                'volatility': float(result[5]) if result[5] else None
-            }
+        
+        stats = await run_db(stock_queries.get_stock_statistics, symbol, days)
+        
+        if not stats:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No data found for symbol {symbol}"
+            )
+        
+        return stats
             
     except HTTPException:
         raise
@@ -321,11 +628,226 @@ async def get_stock_statistics(symbol: str, days: int = 30):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/predict")
+async def predict(request: PredictionRequest):
+    """
+    Previsão de preço para uma ação
+    
+    Pedidos concorrentes são agrupados pelo micro-batcher numa única
+    chamada ao modelo.
+    """
+    try:
+        return await predictor.predict(request.symbol.upper(), request.days_ahead)
+    
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error predicting {request.symbol}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/predict/batch")
+async def predict_batch(request: BatchPredictionRequest):
+    """Previsões para várias ações (erros reportados por símbolo)"""
+    try:
+        symbols = list(dict.fromkeys(s.upper() for s in request.symbols))
+        result = await predictor.predict_many(symbols, request.days_ahead)
+        
+        return {
+            "total": len(symbols),
+            "generated_at": datetime.now().isoformat(),
+            **result
+        }
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in batch prediction: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/predict/{symbol}/multi")
+async def predict_multi(symbol: str, days: int = 5):
+    """
+    Previsão para os próximos `days` dias
+    
+    Args:
+        symbol: Símbolo da ação
+        days: Número de dias (rollout recursivo do modelo)
+    """
+    try:
+        symbol = symbol.upper()
+        prediction = await predictor.predict(symbol, days)
+        
+        return {
+            "symbol": symbol,
+            "days": days,
+            "current_price": prediction['current_price'],
+            "last_data_time": prediction['last_data_time'],
+            "model": prediction['model'],
+            "model_version": prediction['model_version'],
+            "predictions": [
+                {"day": day, "predicted_price": price}
+                for day, price in enumerate(prediction['path'], start=1)
+            ],
+            "generated_at": prediction['generated_at']
+        }
+    
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error predicting {symbol}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/train")
+async def train_model(request: TrainRequest):
+    """
+    Coloca o treino de um modelo na fila
+    
+    Devolve logo o job (id + estado); com `wait` espera até esse número de
+    segundos pelo fim do treino antes de responder.
+    """
+    try:
+        if not 1 <= request.epochs <= 1000:
+            raise HTTPException(status_code=400, detail="epochs must be between 1 and 1000")
+        if not 0 < request.validation_split < 1:
+            raise HTTPException(status_code=400, detail="validation_split must be between 0 and 1")
+        if request.sequence_length < 2 or request.prediction_horizon < 1:
+            raise HTTPException(status_code=400, detail="Invalid sequence_length or prediction_horizon")
+        
+        config = request.model_dump(exclude={'symbol', 'wait'})
+        job = await run_db(training_store.enqueue, request.symbol.upper(), config)
+        
+        if request.wait:
+            deadline = asyncio.get_running_loop().time() + request.wait
+            while (
+                job['status'] not in TERMINAL_STATUSES
+                and asyncio.get_running_loop().time() < deadline
+            ):
+                await asyncio.sleep(1.0)
+                job = await run_db(training_store.get, job['id'])
+        
+        return job
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error queueing training: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/train")
+async def list_training_jobs(status: Optional[str] = None, limit: int = 50):
+    """Jobs de treino mais recentes"""
+    try:
+        jobs = await run_db(training_store.list, status, limit)
+        return {"total": len(jobs), "jobs": jobs}
+    
+    except Exception as e:
+        logger.error(f"Error listing training jobs: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/train/{job_id}")
+async def get_training_job(job_id: str):
+    """Estado, progresso (época/loss) e resultado de um job de treino"""
+    try:
+        job = await run_db(training_store.get, job_id)
+        
+        if not job:
+            raise HTTPException(status_code=404, detail=f"Training job {job_id} not found")
+        
+        return job
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching training job: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.delete("/api/train/{job_id}")
+async def cancel_training_job(job_id: str):
+    """Cancela um job (em execução, pára no fim da época atual)"""
+    try:
+        job = await run_db(training_store.cancel, job_id)
+        
+        if not job:
+            raise HTTPException(status_code=404, detail=f"Training job {job_id} not found")
+        
+        return job
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error cancelling training job: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/models")
+async def list_models():
+    """Modelos disponíveis e estado da registry (carregados, bytes, evictions)"""
+    try:
+        models = await run_db(model_registry.list_models)
+        
+        return {
+            "total": len(models),
+            "models": models,
+            "registry": model_registry.stats()
+        }
+    
+    except Exception as e:
+        logger.error(f"Error listing models: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/evaluation/{symbol}")
+async def get_model_evaluation(symbol: str, limit: int = 10):
+    """
+    Métricas de avaliação do modelo de uma ação
+    
+    Args:
+        symbol: Símbolo da ação
+        limit: Número de avaliações (mais recentes primeiro)
+    """
+    try:
+        symbol = symbol.upper()
+        
+        evaluations = await run_db(stock_queries.get_model_performance, symbol, limit)
+        
+        if not evaluations:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No evaluation found for symbol {symbol}"
+            )
+        
+        return {
+            "symbol": symbol,
+            "latest": evaluations[0],
+            "history": evaluations
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching evaluation: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/collect/scheduled")
-async def scheduled_collection():
+async def scheduled_collection(wait: Optional[float] = None):
     """
     Endpoint para coleta agendada (pode ser chamado por cron job)
     Coleta dados das principais ações
+    
+    Corre como job de coleta incremental (mesmo executor, limite de
+    concorrência e rate limiter das outras coletas) e responde logo com o
+    job; com `wait` espera até esse número de segundos pelo resultado.
     """
     try:
         # Ações principais para coleta diária
@@ -335,17 +857,27 @@ async def scheduled_collection():
             'MA', 'UNH', 'HD', 'DIS', 'NFLX'
         ]
         
-        collector = StockDataCollector()
-        result = collector.collect_multiple_stocks(
+        job = collection_jobs.submit(
             popular_stocks,
-            period="5d",  # Últimos 5 dias
-            interval="1d"
+            period="5d",  # Símbolos ainda sem watermark
+            interval="1d",
+            mode=INCREMENTAL,
+            source="scheduled"
         )
         
+        if wait and job.future is not None:
+            try:
+                await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(job.future)),
+                    timeout=wait
+                )
+            except asyncio.TimeoutError:
+                pass  # Continua em background; o estado vai no job
+        
         return {
-            "status": "completed",
+            "status": job.status,
             "timestamp": datetime.now().isoformat(),
-            "results": result
+            "job": job.to_dict()
         }
         
     except Exception as e:
@@ -0,0 +1,281 @@
+# ml-service/market_calendar.py
+# Calendário de sessões das bolsas (feriados embutidos) e planeamento de coletas sem pedidos inúteis
+import logging
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import text
+
+from watermarks import WatermarkStore
+
+logger = logging.getLogger(__name__)
+
+# Encerramentos extraordinários da NYSE/NASDAQ (não seguem regras fixas)
+SPECIAL_CLOSURES = {
+    date(2001, 9, 11), date(2001, 9, 12), date(2001, 9, 13), date(2001, 9, 14),
+    date(2004, 6, 11),   # Funeral de Ronald Reagan
+    date(2007, 1, 2),    # Funeral de Gerald Ford
+    date(2012, 10, 29), date(2012, 10, 30),  # Furacão Sandy
+    date(2018, 12, 5),   # Funeral de George H. W. Bush
+    date(2025, 1, 9),    # Funeral de Jimmy Carter
+}
+
+# Códigos de bolsa (stock_symbols.exchange / Yahoo) -> calendário
+EXCHANGE_ALIASES = {
+    'NYSE': 'XNYS', 'NYQ': 'XNYS', 'ASE': 'XNYS', 'AMEX': 'XNYS',
+    'PCX': 'XNYS', 'NYSEARCA': 'XNYS', 'BATS': 'XNYS', 'BTS': 'XNYS',
+    'NASDAQ': 'XNYS', 'NMS': 'XNYS', 'NGM': 'XNYS', 'NCM': 'XNYS', 'NAS': 'XNYS',
+}
+
+
+def _easter(year: int) -> date:
+    """Domingo de Páscoa (algoritmo gregoriano anónimo)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """n-ésimo dia da semana do mês (n = -1 para o último)"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(day: date) -> date:
+    """Sábado -> sexta anterior, domingo -> segunda seguinte"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=64)
+def nyse_holidays(year: int) -> frozenset:
+    """Feriados da NYSE de um ano (regras da Rule 7.2, sem rede)"""
+    holidays = {
+        _nth_weekday(year, 1, 0, 3),            # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),            # Washington's Birthday
+        _easter(year) - timedelta(days=2),      # Good Friday
+        _nth_weekday(year, 5, 0, -1),           # Memorial Day
+        _observed(date(year, 7, 4)),            # Independence Day
+        _nth_weekday(year, 9, 0, 1),            # Labor Day
+        _nth_weekday(year, 11, 3, 4),           # Thanksgiving
+        _observed(date(year, 12, 25)),          # Christmas
+    }
+
+    # Ano Novo ao sábado não é compensado na sexta anterior
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays.add(_observed(new_year))
+
+    if year >= 2022:
+        holidays.add(_observed(date(year, 6, 19)))  # Juneteenth
+
+    holidays.update(d for d in SPECIAL_CLOSURES if d.year == year)
+    return frozenset(holidays)
+
+
+class ExchangeCalendar:
+    """Sessões regulares de uma bolsa no seu fuso horário"""
+
+    def __init__(self, name: str, tz: str, open_time: time, close_time: time,
+                 early_close_time: time):
+        self.name = name
+        self.tz = ZoneInfo(tz)
+        self.open_time = open_time
+        self.close_time = close_time
+        self.early_close_time = early_close_time
+
+    def is_trading_day(self, day: date) -> bool:
+        return day.weekday() < 5 and day not in nyse_holidays(day.year)
+
+    def _is_early_close(self, day: date) -> bool:
+        # Véspera do 4 de julho, dia a seguir ao Thanksgiving e véspera de Natal
+        if day == _nth_weekday(day.year, 11, 3, 4) + timedelta(days=1):
+            return True
+        return (day.month, day.day) in ((7, 3), (12, 24)) and day.weekday() < 4
+
+    def session(self, day: date) -> Optional[Tuple[datetime, datetime]]:
+        """(abertura, fecho) da sessão ou None se a bolsa estiver fechada"""
+        if not self.is_trading_day(day):
+            return None
+        close = self.early_close_time if self._is_early_close(day) else self.close_time
+        return (
+            datetime.combine(day, self.open_time, self.tz),
+            datetime.combine(day, close, self.tz)
+        )
+
+    def previous_trading_day(self, day: date) -> date:
+        day -= timedelta(days=1)
+        while not self.is_trading_day(day):
+            day -= timedelta(days=1)
+        return day
+
+    def last_closed_session(self, now: datetime) -> date:
+        """Último dia cuja sessão já fechou em `now`"""
+        today = now.astimezone(self.tz).date()
+        session = self.session(today)
+        if session and now >= session[1]:
+            return today
+        return self.previous_trading_day(today)
+
+    def is_open(self, now: datetime) -> bool:
+        session = self.session(now.astimezone(self.tz).date())
+        return bool(session) and session[0] <= now < session[1]
+
+
+CALENDARS = {
+    'XNYS': ExchangeCalendar('XNYS', 'America/New_York', time(9, 30), time(16, 0), time(13, 0)),
+}
+
+
+def get_calendar(exchange: Optional[str]) -> ExchangeCalendar:
+    """Calendário da bolsa (MARKET_DEFAULT_CALENDAR para códigos desconhecidos)"""
+    key = EXCHANGE_ALIASES.get((exchange or '').strip().upper())
+    if key is None:
+        key = os.getenv('MARKET_DEFAULT_CALENDAR', 'XNYS')
+    return CALENDARS[key]
+
+
+def interval_length(interval: str) -> Optional[timedelta]:
+    """Duração de uma barra intraday (1m, 30m, 1h...) ou None"""
+    unit = interval[-1:]
+    if unit not in ('m', 'h') or not interval[:-1].isdigit():
+        return None
+    value = int(interval[:-1])
+    return timedelta(minutes=value) if unit == 'm' else timedelta(hours=value)
+
+
+class CollectionPlanner:
+    """
+    Decide que símbolos precisam de ir ao provider e a partir de quando
+
+    Um símbolo está em dia quando a watermark já cobre a última barra que
+    a bolsa pode ter produzido e foi gravada depois dessa barra fechar
+    (mais MARKET_SETTLE_MINUTES). Fins de semana, feriados e horas fora de
+    sessão não geram pedidos; os restantes símbolos são agrupados pela
+    data inicial do primeiro dado em falta, um pedido em bulk por grupo.
+    """
+
+    def __init__(self, engine, watermarks: Optional[WatermarkStore] = None):
+        self.engine = engine
+        self.watermarks = watermarks or WatermarkStore(engine)
+        self.settle = timedelta(minutes=float(os.getenv('MARKET_SETTLE_MINUTES', '15')))
+
+    def exchanges(self, symbols: List[str]) -> Dict[str, Optional[str]]:
+        """{símbolo: exchange} a partir de stock_symbols"""
+        if not symbols:
+            return {}
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT symbol, exchange
+                    FROM stock_symbols
+                    WHERE symbol = ANY(:symbols)
+                """),
+                {'symbols': list(symbols)}
+            )
+            return {row[0]: row[1] for row in rows}
+
+    def calendars(self, symbols: List[str]) -> Dict[str, ExchangeCalendar]:
+        exchanges = self.exchanges(symbols)
+        return {symbol: get_calendar(exchanges.get(symbol)) for symbol in symbols}
+
+    def _latest_bar(self, calendar: ExchangeCalendar, interval: str,
+                    now: datetime) -> Optional[Tuple[datetime, datetime]]:
+        """
+        (início, fim) da última barra que a bolsa pode ter produzido até `now`
+
+        None quando o intervalo não é diário nem intraday (sem planeamento).
+        """
+        if interval == '1d':
+            day = calendar.last_closed_session(now)
+            _, close = calendar.session(day)
+            return datetime.combine(day, time(0), calendar.tz), close
+
+        length = interval_length(interval)
+        if length is None:
+            return None
+
+        today = now.astimezone(calendar.tz).date()
+        session = calendar.session(today)
+        if not session or now < session[0]:
+            session = calendar.session(calendar.previous_trading_day(today))
+        open_, close = session
+
+        # Barras alinhadas à abertura; a última pode estar em curso
+        elapsed = min(now, close - timedelta(microseconds=1)) - open_
+        start = open_ + (elapsed // length) * length
+        return start, min(start + length, close)
+
+    def _start(self, calendar: ExchangeCalendar, interval: str,
+               last_time: datetime, overlap: Optional[timedelta]) -> datetime:
+        """Início do pedido: a última barra gravada (pode ter sido parcial)"""
+        if overlap is not None:
+            last_time = last_time - overlap
+        if interval_length(interval) is not None:
+            return last_time
+        local = last_time.astimezone(calendar.tz)
+        return datetime.combine(local.date(), time(0), calendar.tz)
+
+    def plan(
+        self,
+        symbols: List[str],
+        interval: str,
+        overlap: Optional[timedelta] = None,
+        now: Optional[datetime] = None
+    ) -> Tuple[Dict[Optional[datetime], List[str]], List[str]]:
+        """
+        Planeia a coleta incremental
+
+        Args:
+            overlap: Recuo fixo para apanhar revisões (ex: sincronização
+                     semanal); por defeito só a última barra é re-coletada
+
+        Returns:
+            ({data inicial ou None (histórico completo): símbolos}, símbolos em dia)
+        """
+        now = now or datetime.now(timezone.utc)
+        details = self.watermarks.get_details(symbols, interval)
+        calendars = self.calendars(symbols)
+
+        groups: Dict[Optional[datetime], List[str]] = {}
+        up_to_date = []
+        for symbol in symbols:
+            calendar = calendars[symbol]
+            if symbol not in details:
+                groups.setdefault(None, []).append(symbol)
+                continue
+
+            last_time, fetched_at = details[symbol]
+            latest = self._latest_bar(calendar, interval, now)
+            if overlap is None and latest is not None:
+                bar_start, bar_end = latest
+                if last_time >= bar_start and fetched_at >= bar_end + self.settle:
+                    up_to_date.append(symbol)
+                    continue
+
+            start = self._start(calendar, interval, last_time, overlap)
+            groups.setdefault(start, []).append(symbol)
+
+        if up_to_date:
+            logger.info(
+                f"Planner ({interval}): {len(up_to_date)} symbols up to date, "
+                f"no fetch needed"
+            )
+        return groups, up_to_date
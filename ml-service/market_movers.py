@@ -0,0 +1,255 @@
+# ml-service/market_movers.py
+# Rankings (gainers/losers/volume) e agregados por setor materializados
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from cache import TwoTierCache, namespace_prefix
+
+logger = logging.getLogger(__name__)
+
+MARKET_PREFIX = namespace_prefix('market')
+
+# Ordenação de cada ranking (usa os índices de market_snapshot)
+RANKINGS = {
+    'gainers': 'change_percent DESC NULLS LAST',
+    'losers': 'change_percent ASC NULLS LAST',
+    'volume': 'volume DESC NULLS LAST'
+}
+
+# Tabelas materializadas após cada coleta, como no init.sql
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS market_snapshot (
+        symbol VARCHAR(20) PRIMARY KEY,
+        sector VARCHAR(100),
+        time TIMESTAMPTZ NOT NULL,
+        close NUMERIC(12,4) NOT NULL,
+        prev_close NUMERIC(12,4),
+        change NUMERIC(12,4),
+        change_percent NUMERIC(10,4),
+        volume BIGINT,
+        updated_at TIMESTAMPTZ DEFAULT NOW()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_market_snapshot_change ON market_snapshot (change_percent DESC NULLS LAST)",
+    "CREATE INDEX IF NOT EXISTS idx_market_snapshot_volume ON market_snapshot (volume DESC NULLS LAST)",
+    "CREATE INDEX IF NOT EXISTS idx_market_snapshot_sector ON market_snapshot (sector)",
+    """
+    CREATE TABLE IF NOT EXISTS sector_aggregates (
+        sector VARCHAR(100) PRIMARY KEY,
+        symbols INTEGER NOT NULL,
+        avg_change_percent NUMERIC(10,4),
+        total_volume BIGINT,
+        gainers INTEGER,
+        losers INTEGER,
+        updated_at TIMESTAMPTZ DEFAULT NOW()
+    )
+    """
+]
+
+
+def _freshness(rows) -> Optional[str]:
+    """Momento da última atualização entre as linhas devolvidas"""
+    updated_at = max((row['updated_at'] for row in rows), default=None)
+    return updated_at.isoformat() if updated_at else None
+
+
+class MarketMovers:
+    """
+    Snapshot por símbolo e agregados por setor, atualizados após a coleta
+
+    O refresh só toca nos símbolos acabados de escrever e nos setores a
+    que pertencem; os endpoints leem as tabelas materializadas.
+    """
+
+    def __init__(self, engine, cache: Optional[TwoTierCache] = None):
+        self.engine = engine
+        self.cache = cache
+
+    def refresh(self, symbols: List[str], interval: str = "1d"):
+        """Atualiza snapshot e setores dos símbolos indicados"""
+        if not symbols or interval != "1d":
+            return
+
+        params = {'symbols': list(symbols)}
+
+        with self.engine.begin() as conn:
+            # Setores antigos (caso um símbolo tenha mudado de setor)
+            old_sectors = conn.execute(
+                text("""
+                    SELECT DISTINCT sector FROM market_snapshot
+                    WHERE symbol = ANY(:symbols)
+                """),
+                params
+            ).scalars().all()
+
+            conn.execute(
+                text("""
+                    INSERT INTO market_snapshot (
+                        symbol, sector, time, close, prev_close,
+                        change, change_percent, volume, updated_at
+                    )
+                    SELECT
+                        t.symbol,
+                        COALESCE(ss.sector, 'Unknown'),
+                        l.time,
+                        l.close,
+                        p.close,
+                        l.close - p.close,
+                        (l.close - p.close) / NULLIF(p.close, 0) * 100,
+                        l.volume,
+                        NOW()
+                    FROM unnest(CAST(:symbols AS text[])) AS t(symbol)
+                    CROSS JOIN LATERAL (
+                        SELECT time, close, volume
+                        FROM stock_data d
+                        WHERE d.symbol = t.symbol
+                        AND d.interval = '1d'
+                        ORDER BY d.time DESC
+                        LIMIT 1
+                    ) l
+                    LEFT JOIN LATERAL (
+                        SELECT close
+                        FROM stock_data d
+                        WHERE d.symbol = t.symbol
+                        AND d.interval = '1d'
+                        AND d.time < l.time
+                        ORDER BY d.time DESC
+                        LIMIT 1
+                    ) p ON TRUE
+                    LEFT JOIN stock_symbols ss ON ss.symbol = t.symbol
+                    ON CONFLICT (symbol) DO UPDATE SET
+                        sector = EXCLUDED.sector,
+                        time = EXCLUDED.time,
+                        close = EXCLUDED.close,
+                        prev_close = EXCLUDED.prev_close,
+                        change = EXCLUDED.change,
+                        change_percent = EXCLUDED.change_percent,
+                        volume = EXCLUDED.volume,
+                        updated_at = EXCLUDED.updated_at
+                """),
+                params
+            )
+
+            new_sectors = conn.execute(
+                text("""
+                    SELECT DISTINCT sector FROM market_snapshot
+                    WHERE symbol = ANY(:symbols)
+                """),
+                params
+            ).scalars().all()
+
+            sectors = sorted(set(old_sectors) | set(new_sectors))
+
+            # Setores que ficaram vazios
+            conn.execute(
+                text("""
+                    DELETE FROM sector_aggregates sa
+                    WHERE sa.sector = ANY(:sectors)
+                    AND NOT EXISTS (
+                        SELECT 1 FROM market_snapshot ms
+                        WHERE ms.sector = sa.sector
+                    )
+                """),
+                {'sectors': sectors}
+            )
+
+            conn.execute(
+                text("""
+                    INSERT INTO sector_aggregates (
+                        sector, symbols, avg_change_percent, total_volume,
+                        gainers, losers, updated_at
+                    )
+                    SELECT
+                        sector,
+                        COUNT(*),
+                        AVG(change_percent),
+                        SUM(volume),
+                        COUNT(*) FILTER (WHERE change_percent > 0),
+                        COUNT(*) FILTER (WHERE change_percent < 0),
+                        NOW()
+                    FROM market_snapshot
+                    WHERE sector = ANY(:sectors)
+                    GROUP BY sector
+                    ON CONFLICT (sector) DO UPDATE SET
+                        symbols = EXCLUDED.symbols,
+                        avg_change_percent = EXCLUDED.avg_change_percent,
+                        total_volume = EXCLUDED.total_volume,
+                        gainers = EXCLUDED.gainers,
+                        losers = EXCLUDED.losers,
+                        updated_at = EXCLUDED.updated_at
+                """),
+                {'sectors': sectors}
+            )
+
+        if self.cache is not None:
+            self.cache.invalidate_prefix(MARKET_PREFIX)
+
+        logger.info(
+            f"Market movers refreshed for {len(symbols)} symbols, "
+            f"{len(sectors)} sectors"
+        )
+
+    def get_movers(self, kind: str = 'gainers', limit: int = 10) -> Dict:
+        """Top N de um ranking, com timestamp de atualização"""
+        if kind not in RANKINGS:
+            raise ValueError(f"Unsupported ranking: {kind}")
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f"""
+                    SELECT symbol, sector, time, close, prev_close,
+                           change, change_percent, volume, updated_at
+                    FROM market_snapshot
+                    ORDER BY {RANKINGS[kind]}
+                    LIMIT :limit
+                """),
+                {'limit': limit}
+            ).mappings().all()
+
+        return {
+            'kind': kind,
+            'updated_at': _freshness(rows),
+            'stocks': [
+                {
+                    'symbol': row['symbol'],
+                    'sector': row['sector'],
+                    'time': row['time'].isoformat(),
+                    'close': float(row['close']),
+                    'prev_close': float(row['prev_close']) if row['prev_close'] is not None else None,
+                    'change': float(row['change']) if row['change'] is not None else None,
+                    'change_percent': float(row['change_percent']) if row['change_percent'] is not None else None,
+                    'volume': int(row['volume'])
+                }
+                for row in rows
+            ]
+        }
+
+    def get_sectors(self) -> Dict:
+        """Agregados por setor, com timestamp de atualização"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT sector, symbols, avg_change_percent, total_volume,
+                           gainers, losers, updated_at
+                    FROM sector_aggregates
+                    ORDER BY avg_change_percent DESC NULLS LAST
+                """)
+            ).mappings().all()
+
+        return {
+            'updated_at': _freshness(rows),
+            'sectors': [
+                {
+                    'sector': row['sector'],
+                    'symbols': row['symbols'],
+                    'avg_change_percent': float(row['avg_change_percent']) if row['avg_change_percent'] is not None else None,
+                    'total_volume': int(row['total_volume'] or 0),
+                    'gainers': row['gainers'],
+                    'losers': row['losers']
+                }
+                for row in rows
+            ]
+        }
@@ -0,0 +1,36 @@
+# ml-service/migrations/env.py
+# Ambiente do alembic: usa a conexão passada pelo SchemaManager (ou o engine partilhado)
+from alembic import context
+
+config = context.config
+
+
+def run_migrations_offline():
+    context.configure(
+        url=config.get_main_option('sqlalchemy.url'),
+        literal_binds=True
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    connection = config.attributes.get('connection')
+    if connection is not None:
+        context.configure(connection=connection)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
+    from database import get_engine
+
+    with get_engine().begin() as connection:
+        context.configure(connection=connection)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,46 @@
+"""stock_data: índice único (symbol, time) e índice por time
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+from sqlalchemy import text
+
+from schema_manager import (
+    compress_chunks, decompress_chunks, has_index, remove_duplicates, stock_data_indexes
+)
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Definições desta revisão (a chave atual do stock_data vem da 0004)
+UNIQUE_INDEX = "CREATE UNIQUE INDEX idx_stock_data_symbol_time ON stock_data (symbol, time DESC)"
+TIME_INDEX = "CREATE INDEX IF NOT EXISTS idx_stock_data_time ON stock_data (time DESC)"
+
+
+def upgrade():
+    conn = op.get_bind()
+    indexes = stock_data_indexes(conn)
+    if 'idx_stock_data_symbol_interval_time' in indexes:
+        # Base criada já com a chave (symbol, interval, time) do init.sql
+        return
+
+    # O init.sql original criava idx_stock_data_symbol_time sem UNIQUE:
+    # o nome não basta, o upsert (ON CONFLICT) precisa do índice único
+    if not has_index(indexes, True, ['symbol', 'time']):
+        chunks = decompress_chunks(conn)
+        # Bases antigas (DELETE + to_sql) podem ter barras repetidas
+        remove_duplicates(conn, ['symbol', 'time'])
+        conn.execute(text("DROP INDEX IF EXISTS idx_stock_data_symbol_time"))
+        conn.execute(text(UNIQUE_INDEX))
+        compress_chunks(conn, chunks)
+
+    conn.execute(text(TIME_INDEX))
+
+
+def downgrade():
+    # O upsert do collector (ON CONFLICT (symbol, time)) depende do índice único
+    op.execute("DROP INDEX IF EXISTS idx_stock_data_time")
@@ -0,0 +1,88 @@
+"""stock_data particionado por tempo: hypertable (TimescaleDB) ou partições mensais nativas
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+from sqlalchemy import text
+
+from schema_manager import ensure_partitions, has_timescale, partitioning
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def _dependent_views(conn):
+    """(nome, definição) das views que leem stock_data"""
+    return conn.execute(text("""
+        SELECT DISTINCT v.relname, pg_get_viewdef(v.oid)
+        FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid
+        JOIN pg_class v ON v.oid = r.ev_class
+        WHERE d.refobjid = 'stock_data'::regclass
+          AND v.relname <> 'stock_data'
+    """)).fetchall()
+
+
+def _to_native(conn):
+    """
+    Reconstrói o stock_data como tabela particionada por mês
+
+    Os dados são copiados para as partições, a tabela antiga é removida e
+    os índices e as views dependentes recriados com a mesma definição.
+    """
+    views = _dependent_views(conn)
+    for name, _ in views:
+        conn.execute(text(f"DROP VIEW {name}"))
+
+    # Os mesmos índices da tabela atual (a definição referencia stock_data)
+    indexes = conn.execute(
+        text("SELECT indexdef FROM pg_indexes WHERE tablename = 'stock_data'")
+    ).scalars().all()
+
+    first = conn.execute(text("SELECT MIN(time)::date FROM stock_data")).scalar()
+
+    conn.execute(text("ALTER TABLE stock_data RENAME TO stock_data_unpartitioned"))
+    conn.execute(text("""
+        CREATE TABLE stock_data (
+            LIKE stock_data_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+        ) PARTITION BY RANGE (time)
+    """))
+    ensure_partitions(conn, start=first)
+    # Barras fora das partições mensais (datas muito no futuro) não falham o insert
+    conn.execute(text("CREATE TABLE stock_data_default PARTITION OF stock_data DEFAULT"))
+
+    conn.execute(text("INSERT INTO stock_data SELECT * FROM stock_data_unpartitioned"))
+    conn.execute(text("DROP TABLE stock_data_unpartitioned"))
+
+    for statement in indexes:
+        conn.execute(text(statement))
+    for name, definition in views:
+        conn.execute(text(f"CREATE VIEW {name} AS {definition}"))
+
+
+def upgrade():
+    conn = op.get_bind()
+    if partitioning(conn) is not None:
+        return
+
+    if has_timescale(conn):
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS timescaledb"))
+        conn.execute(text("""
+            SELECT create_hypertable(
+                'stock_data', 'time',
+                chunk_time_interval => INTERVAL '7 days',
+                if_not_exists => TRUE,
+                migrate_data => TRUE
+            )
+        """))
+    else:
+        _to_native(conn)
+
+
+def downgrade():
+    # Desfazer o particionamento implicaria reescrever a tabela inteira
+    pass
@@ -0,0 +1,26 @@
+"""Tabelas auxiliares até aqui criadas de forma lazy pelos módulos
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+import job_runs
+import watermarks
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # As mesmas definições usadas pelo _ensure_table de cada módulo
+    op.execute(watermarks.CREATE_TABLE)
+    op.execute(job_runs.CREATE_TABLE)
+
+
+def downgrade():
+    # As tabelas podem ser anteriores à migração (init.sql/_ensure_table): não apagar
+    pass
@@ -0,0 +1,108 @@
+"""stock_data por intervalo: colunas interval e source, chave (symbol, interval, time)
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+from sqlalchemy import text
+
+from schema_manager import compress_chunks, decompress_chunks, partitioning, remove_duplicates
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+UNIQUE_INDEX = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_stock_data_symbol_interval_time "
+    "ON stock_data (symbol, interval, time DESC)"
+)
+
+# Views do init.sql, agora só sobre as barras diárias
+VIEWS = {
+    'latest_stock_prices': """
+        SELECT DISTINCT ON (symbol)
+            symbol, time, open, high, low, close, volume
+        FROM stock_data
+        WHERE interval = '1d'
+        ORDER BY symbol, time DESC
+    """,
+    'daily_stock_stats': """
+        SELECT
+            symbol,
+            DATE(time) as date,
+            FIRST(open, time) as open,
+            MAX(high) as high,
+            MIN(low) as low,
+            LAST(close, time) as close,
+            SUM(volume) as volume,
+            COUNT(*) as data_points
+        FROM stock_data
+        WHERE interval = '1d'
+        GROUP BY symbol, DATE(time)
+        ORDER BY symbol, date DESC
+    """
+}
+
+
+def _compression_enabled(conn) -> bool:
+    if partitioning(conn) != 'hypertable':
+        return False
+    return bool(conn.execute(text("""
+        SELECT compression_enabled FROM timescaledb_information.hypertables
+        WHERE hypertable_name = 'stock_data'
+    """)).scalar())
+
+
+def upgrade():
+    conn = op.get_bind()
+    # O UPDATE, a troca do índice único e o novo segmentby exigem os chunks
+    # descomprimidos; voltam a ser comprimidos no fim
+    chunks = decompress_chunks(conn)
+
+    conn.execute(text(
+        "ALTER TABLE stock_data ADD COLUMN IF NOT EXISTS interval VARCHAR(8) NOT NULL DEFAULT '1d'"
+    ))
+    conn.execute(text(
+        "ALTER TABLE stock_data ADD COLUMN IF NOT EXISTS source VARCHAR(10) NOT NULL DEFAULT 'native'"
+    ))
+    if not conn.execute(
+        text("SELECT 1 FROM pg_constraint WHERE conname = 'valid_source'")
+    ).first():
+        conn.execute(text(
+            "ALTER TABLE stock_data ADD CONSTRAINT valid_source CHECK (source IN ('native', 'rollup'))"
+        ))
+
+    # As barras diárias do Yahoo estão à meia-noite de Nova Iorque; as
+    # restantes vieram da coleta horária (até aqui sem coluna interval)
+    conn.execute(text("""
+        UPDATE stock_data SET interval = '1h'
+        WHERE interval = '1d'
+          AND (time AT TIME ZONE 'America/New_York')::time <> TIME '00:00'
+    """))
+
+    # Bases sem a chave única da 0001 podem ter barras repetidas
+    remove_duplicates(conn, ['symbol', 'interval', 'time'])
+    conn.execute(text("DROP INDEX IF EXISTS idx_stock_data_symbol_time"))
+    conn.execute(text(UNIQUE_INDEX))
+
+    if _compression_enabled(conn):
+        # Segmentos por (symbol, interval), como no init.sql
+        conn.execute(text(
+            "ALTER TABLE stock_data SET (timescaledb.compress_segmentby = 'symbol, interval')"
+        ))
+    compress_chunks(conn, chunks)
+
+    existing = set(conn.execute(
+        text("SELECT viewname FROM pg_views WHERE viewname = ANY(:names)"),
+        {'names': list(VIEWS)}
+    ).scalars())
+    for name in existing:
+        conn.execute(text(f"CREATE OR REPLACE VIEW {name} AS {VIEWS[name]}"))
+
+
+def downgrade():
+    # Voltar à chave (symbol, time) obrigaria a apagar barras intraday que
+    # partilham o instante (1m/1h): manter as colunas e o índice
+    pass
@@ -0,0 +1,29 @@
+"""Tabelas derivadas das coletas até aqui só no init.sql (indicadores, mercado, estatísticas)
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+import indicators
+import market_movers
+import rolling_stats
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # As mesmas definições do init.sql, mantidas em cada módulo
+    op.execute(indicators.CREATE_TABLE)
+    for statement in market_movers.CREATE_TABLES:
+        op.execute(statement)
+    op.execute(rolling_stats.CREATE_TABLE)
+
+
+def downgrade():
+    # As tabelas podem ser anteriores à migração (init.sql): não apagar
+    pass
@@ -0,0 +1,291 @@
+# ml-service/model_registry.py
+# Registo de modelos por símbolo: carregamento lazy, LRU limitada em bytes e warm-up
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from sequence_cache import FEATURE_COLUMNS, PRICE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Modelo partilhado usado pelos símbolos sem modelo próprio
+GLOBAL_MODEL = '_global'
+
+
+def models_dir() -> str:
+    return os.getenv('MODELS_DIR', os.path.join(os.path.dirname(__file__), 'models'))
+
+
+def model_path(key: str, directory: Optional[str] = None) -> str:
+    return os.path.join(directory or models_dir(), key, 'model.keras')
+
+
+class PredictionModel:
+    """
+    Modelo Keras + metadados (models/{SYMBOL}/model.keras e metadata.json)
+
+    metadata.json:
+        features: colunas de entrada (subconjunto de FEATURE_COLUMNS)
+        target: coluna prevista (por defeito 'close')
+        sequence_length: tamanho da janela
+        prediction_horizon: barras entre o fim da janela e o fecho previsto
+        scaling: 'minmax' (usa scaler.min/scaler.max por feature) ou
+                 'window' (preços relativos ao último fecho da janela;
+                 permite um modelo partilhado entre símbolos)
+        version: versão do modelo
+    """
+
+    def __init__(self, key: str, model, metadata: Dict):
+        self.key = key
+        self.model = model
+        self.metadata = metadata
+        self.features = metadata.get('features', ['close'])
+        self.target = metadata.get('target', 'close')
+        self.sequence_length = int(metadata.get('sequence_length', 60))
+        self.horizon = int(metadata.get('prediction_horizon', 1))
+        self.scaling = metadata.get('scaling', 'minmax')
+        self.version = str(metadata.get('version', '1'))
+
+        # Memória ocupada pelos pesos (usada pelo limite da LRU)
+        self.nbytes = int(sum(np.asarray(w).nbytes for w in model.get_weights()))
+
+        self._columns = [FEATURE_COLUMNS.index(f) for f in self.features]
+        self._target = self.features.index(self.target)
+        self._prices = [i for i, f in enumerate(self.features) if f in PRICE_COLUMNS]
+
+        if self.scaling == 'minmax':
+            scaler = metadata['scaler']
+            self._min = np.asarray(scaler['min'], dtype=np.float32)
+            self._range = np.asarray(scaler['max'], dtype=np.float32) - self._min
+            self._range[self._range == 0] = 1.0
+
+    def _scale(self, x: np.ndarray) -> np.ndarray:
+        if self.scaling == 'window':
+            x = x.copy()
+            reference = x[:, -1:, self._target:self._target + 1]
+            x[:, :, self._prices] = x[:, :, self._prices] / reference - 1.0
+            return x
+        return (x - self._min) / self._range
+
+    def _unscale(self, y: np.ndarray, x: np.ndarray) -> np.ndarray:
+        if self.scaling == 'window':
+            return (y + 1.0) * x[:, -1, self._target]
+        return y * self._range[self._target] + self._min[self._target]
+
+    def rollout(self, windows: np.ndarray, steps: int) -> np.ndarray:
+        """
+        Previsão recursiva de `steps` passos para um lote de janelas
+
+        Cada chamada ao modelo avança `prediction_horizon` barras; as barras
+        intermédias são interpoladas entre o último fecho e a previsão.
+
+        Args:
+            windows: (batch, sequence_length, len(FEATURE_COLUMNS))
+
+        Returns:
+            (batch, steps) com o preço previsto em cada passo
+        """
+        x = windows[:, :, self._columns].astype(np.float32)
+        calls = -(-steps // self.horizon)
+        out = np.empty((len(x), calls * self.horizon), dtype=np.float32)
+        fractions = np.arange(1, self.horizon + 1, dtype=np.float32) / self.horizon
+
+        for call in range(calls):
+            y = np.asarray(self.model(self._scale(x), training=False)).reshape(len(x), -1)[:, 0]
+            last = x[:, -1, self._target]
+            prices = last[:, None] + (self._unscale(y, x) - last)[:, None] * fractions
+            out[:, call * self.horizon:(call + 1) * self.horizon] = prices
+
+            if call + 1 < calls:
+                # Novas barras: preços = previsão, restantes features repetidas
+                bars = np.repeat(x[:, -1:, :], self.horizon, axis=1)
+                bars[:, :, self._prices] = prices[:, :, None]
+                x = np.concatenate([x, bars], axis=1)[:, -x.shape[1]:, :]
+
+        return out[:, :steps]
+
+
+def load_model(key: str, directory: Optional[str] = None) -> PredictionModel:
+    """
+    Lê modelo e metadados do disco (TensorFlow importado só aqui)
+
+    Raises:
+        LookupError: Não existe modelo para `key`
+    """
+    path = model_path(key, directory)
+    if not os.path.exists(path):
+        raise LookupError(f"No model found for {key}")
+
+    import tensorflow as tf
+
+    with open(os.path.join(os.path.dirname(path), 'metadata.json')) as f:
+        metadata = json.load(f)
+
+    model = tf.keras.models.load_model(path, compile=False)
+    return PredictionModel(key, model, metadata)
+
+
+class ModelRegistry:
+    """
+    Modelos carregados a pedido e mantidos numa LRU limitada em bytes
+
+    Cada acesso compara o mtime do ficheiro com o da versão carregada
+    (um modelo retreinado é recarregado sem reiniciar o serviço). Vários
+    pedidos para o mesmo modelo ainda não carregado esperam pelo mesmo load.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.directory = directory or models_dir()
+        self.max_bytes = max_bytes or int(
+            os.getenv('MODEL_CACHE_MAX_BYTES', str(512 * 1024 * 1024))
+        )
+        self._models: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (model, mtime)
+        self._loading: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_times: Dict[str, float] = {}
+        self.warming = False
+
+    def has_model(self, key: str) -> bool:
+        return os.path.exists(model_path(key, self.directory))
+
+    def _mtime(self, key: str) -> float:
+        try:
+            return os.path.getmtime(model_path(key, self.directory))
+        except OSError:
+            raise LookupError(f"No model found for {key}")
+
+    def get(self, key: str) -> PredictionModel:
+        """
+        Modelo carregado (lazy)
+
+        Raises:
+            LookupError: Não existe modelo para `key`
+        """
+        mtime = self._mtime(key)
+
+        while True:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None and entry[1] == mtime:
+                    self._models.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+
+                event = self._loading.get(key)
+                if event is None:
+                    event = self._loading[key] = threading.Event()
+                    break
+
+            # Outro pedido já está a carregar este modelo
+            event.wait()
+
+        try:
+            start = time.perf_counter()
+            model = load_model(key, self.directory)
+            elapsed = time.perf_counter() - start
+            logger.info(f"Loaded model {key} in {elapsed:.2f}s ({model.nbytes:,} bytes)")
+
+            with self._lock:
+                self.misses += 1
+                self.load_times[key] = elapsed
+                self._models[key] = (model, mtime)
+                self._models.move_to_end(key)
+                self._evict()
+            return model
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            event.set()
+
+    def _evict(self):
+        """Remove os menos usados até caber no limite (mantém o mais recente)"""
+        while len(self._models) > 1 and self.resident_bytes() > self.max_bytes:
+            key, _ = self._models.popitem(last=False)
+            self.evictions += 1
+            logger.info(f"Evicted model {key} from registry")
+
+    def resident_bytes(self) -> int:
+        return sum(model.nbytes for model, _ in self._models.values())
+
+    def warm_up(self, keys: List[str]):
+        """Carrega os modelos indicados (ignora os que não existem)"""
+        self.warming = True
+        try:
+            for key in keys:
+                if not self.has_model(key):
+                    continue
+                try:
+                    self.get(key)
+                except Exception as e:
+                    logger.error(f"Error warming up model {key}: {str(e)}")
+        finally:
+            self.warming = False
+
+    def start_warm_up(self, keys: Callable[[], List[str]]):
+        """Warm-up numa thread própria (não bloqueia o arranque nem /health)"""
+        def run():
+            try:
+                self.warm_up(keys())
+            except Exception as e:
+                logger.error(f"Error preparing model warm-up: {str(e)}")
+                self.warming = False
+
+        self.warming = True
+        threading.Thread(target=run, name='model-warm-up', daemon=True).start()
+
+    def list_models(self) -> List[Dict]:
+        """Modelos disponíveis em disco, com metadados e estado na registry"""
+        if not os.path.isdir(self.directory):
+            return []
+
+        with self._lock:
+            loaded = {key: model.nbytes for key, (model, _) in self._models.items()}
+
+        models = []
+        for key in sorted(os.listdir(self.directory)):
+            path = model_path(key, self.directory)
+            if not os.path.exists(path):
+                continue
+
+            metadata_path = os.path.join(os.path.dirname(path), 'metadata.json')
+            metadata = {}
+            if os.path.exists(metadata_path):
+                with open(metadata_path) as f:
+                    metadata = json.load(f)
+
+            models.append({
+                'symbol': key,
+                'version': str(metadata.get('version', '1')),
+                'sequence_length': metadata.get('sequence_length'),
+                'features': metadata.get('features'),
+                'trained_at': metadata.get('trained_at'),
+                'metrics': metadata.get('metrics'),
+                'file_bytes': os.path.getsize(path),
+                'modified_at': datetime.fromtimestamp(os.path.getmtime(path)).isoformat(),
+                'loaded': key in loaded,
+                'resident_bytes': loaded.get(key)
+            })
+        return models
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'loaded': list(self._models),
+                'resident_bytes': self.resident_bytes(),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'load_seconds': {key: round(t, 3) for key, t in self.load_times.items()},
+                'warming_up': self.warming
+            }
@@ -0,0 +1,250 @@
+# ml-service/predictor.py
+# Inferência LSTM com micro-batching dos pedidos concorrentes
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from model_registry import GLOBAL_MODEL, ModelRegistry
+from sequence_cache import FEATURE_COLUMNS, SequenceCache
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Junta pedidos concorrentes num único lote
+
+    Um lote é fechado quando atinge `max_batch_size` ou quando passam
+    `max_wait_ms` desde o primeiro pedido; o handler corre no executor e
+    devolve um resultado (ou exceção) por item, na mesma ordem.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List], List],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        executor: Optional[ThreadPoolExecutor] = None
+    ):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='predict'
+        )
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.requests = 0
+        self.max_seen = 0
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, item):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> List:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            items = [item for item, _ in batch]
+
+            try:
+                results = await loop.run_in_executor(self.executor, self.handler, items)
+            except Exception as e:
+                results = [e] * len(batch)
+
+            self.batches += 1
+            self.requests += len(batch)
+            self.max_seen = max(self.max_seen, len(batch))
+
+            for (_, future), result in zip(batch, results):
+                if future.done():  # Cliente desistiu
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def stats(self) -> Dict:
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'batches': self.batches,
+            'requests': self.requests,
+            'avg_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'max_batch_seen': self.max_seen,
+            'queued': self._queue.qsize() if self._queue else 0
+        }
+
+
+class Predictor:
+    """
+    Serviço de previsão: janela da SequenceCache + modelo + micro-batching
+
+    Pedidos do mesmo modelo (o do símbolo ou o partilhado) são agrupados
+    numa chamada ao modelo por lote; pedidos repetidos do mesmo símbolo
+    partilham a mesma janela.
+    """
+
+    def __init__(self, sequences: SequenceCache, registry: Optional[ModelRegistry] = None):
+        self.sequences = sequences
+        self.registry = registry or ModelRegistry()
+        self.max_days_ahead = int(os.getenv('PREDICT_MAX_DAYS_AHEAD', '30'))
+        self.batcher = MicroBatcher(
+            self._run_batch,
+            max_batch_size=int(os.getenv('PREDICT_MAX_BATCH_SIZE', '64')),
+            max_wait_ms=float(os.getenv('PREDICT_MAX_WAIT_MS', '5'))
+        )
+
+    def _model_key(self, symbol: str) -> str:
+        return symbol if self.registry.has_model(symbol) else GLOBAL_MODEL
+
+    def _run_batch(self, requests: List[Dict]) -> List:
+        """Executa um lote: uma chamada ao modelo por grupo (rollout recursivo)"""
+        results: List = [None] * len(requests)
+        groups: Dict[str, List[int]] = {}
+        for i, request in enumerate(requests):
+            groups.setdefault(self._model_key(request['symbol']), []).append(i)
+
+        for key, indices in groups.items():
+            try:
+                model = self.registry.get(key)
+            except Exception as e:
+                for i in indices:
+                    symbol = requests[i]['symbol']
+                    results[i] = LookupError(f"No model available for {symbol}") \
+                        if isinstance(e, LookupError) else e
+                continue
+
+            # Símbolos fora da cache (ou expirados) numa só query para o lote
+            symbols = [requests[i]['symbol'] for i in indices if results[i] is None]
+            try:
+                self.sequences.load(
+                    self.sequences.missing(symbols, model.sequence_length),
+                    model.sequence_length
+                )
+            except Exception as e:
+                logger.error(f"Error loading sequences for model {key}: {str(e)}")
+                for i in indices:
+                    if results[i] is None:
+                        results[i] = e
+                continue
+
+            # Uma janela por símbolo distinto
+            windows, rows, last = [], {}, {}
+            for i in indices:
+                symbol = requests[i]['symbol']
+                if symbol in rows or isinstance(results[i], Exception):
+                    continue
+                try:
+                    times, values = self.sequences.get(
+                        symbol, model.sequence_length, reload=False
+                    )
+                except LookupError as e:
+                    for j in indices:
+                        if requests[j]['symbol'] == symbol:
+                            results[j] = e
+                    continue
+                rows[symbol] = len(windows)
+                last[symbol] = (times[-1], float(values[-1, FEATURE_COLUMNS.index('close')]))
+                windows.append(values)
+
+            if not windows:
+                continue
+
+            steps = max(requests[i]['days_ahead'] for i in indices)
+            try:
+                paths = model.rollout(np.stack(windows), steps)
+            except Exception as e:
+                logger.error(f"Error running model {key}: {str(e)}")
+                for i in indices:
+                    if results[i] is None:
+                        results[i] = e
+                continue
+
+            for i in indices:
+                symbol = requests[i]['symbol']
+                if symbol not in rows:
+                    continue
+                last_time, current = last[symbol]
+                results[i] = self._format(
+                    symbol, model, last_time, current,
+                    paths[rows[symbol], :requests[i]['days_ahead']]
+                )
+
+        return results
+
+    @staticmethod
+    def _format(symbol, model, last_time, current, path) -> Dict:
+        predicted = float(path[-1])
+        return {
+            'symbol': symbol,
+            'current_price': round(current, 4),
+            'last_data_time': last_time.isoformat(),
+            'days_ahead': len(path),
+            'predicted_price': round(predicted, 4),
+            'change': round(predicted - current, 4),
+            'change_percent': round((predicted - current) / current * 100, 4) if current else None,
+            'path': [round(float(p), 4) for p in path],
+            'model': model.key,
+            'model_version': model.version,
+            'generated_at': datetime.now().isoformat()
+        }
+
+    def _validate(self, days_ahead: int):
+        if not 1 <= days_ahead <= self.max_days_ahead:
+            raise ValueError(f"days_ahead must be between 1 and {self.max_days_ahead}")
+
+    async def predict(self, symbol: str, days_ahead: int = 1) -> Dict:
+        self._validate(days_ahead)
+        return await self.batcher.submit({'symbol': symbol, 'days_ahead': days_ahead})
+
+    async def predict_many(self, symbols: List[str], days_ahead: int = 1) -> Dict:
+        """Previsões para vários símbolos (erros por símbolo não falham o lote)"""
+        self._validate(days_ahead)
+        outcomes = await asyncio.gather(
+            *(self.predict(symbol, days_ahead) for symbol in symbols),
+            return_exceptions=True
+        )
+
+        predictions, errors = [], []
+        for symbol, outcome in zip(symbols, outcomes):
+            if isinstance(outcome, Exception):
+                errors.append({'symbol': symbol, 'error': str(outcome)})
+            else:
+                predictions.append(outcome)
+        return {'predictions': predictions, 'errors': errors}
+
+    def stats(self) -> Dict:
+        return {
+            'batcher': self.batcher.stats(),
+            'sequences': self.sequences.stats(),
+            'models': self.registry.stats()
+        }
@@ -0,0 +1,473 @@
+# ml-service/providers.py
+# Providers de dados de mercado (Yahoo Finance e fixtures locais)
+import abc
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pandas as pd
+import yfinance as yf
+
+# Colunas normalizadas usadas em todo o serviço
+OHLCV_COLUMNS = ['time', 'symbol', 'open', 'high', 'low', 'close', 'volume']
+
+# Mensagens do yfinance de "sem dados" (símbolo deslistado, intervalo vazio).
+# São ambíguas: o yfinance 0.2.x engole erros de rede e throttling (429) e
+# devolve as mesmas mensagens ("No timezone found / No price data found,
+# symbol may be delisted"), pelo que só contam como vazio se confirmadas
+NO_DATA_MARKERS = ('delisted', 'no data found', 'no price data found', "data doesn't exist")
+INVALID_REQUEST_MARKERS = ('is invalid, must be one of',)
+
+# yf.download reinicia o global yf.shared._ERRORS a cada chamada: o download
+# e a leitura dos erros não podem intercalar entre threads
+_DOWNLOAD_LOCK = threading.Lock()
+
+
+class ProviderError(Exception):
+    """Falha transitória do provider (throttling, timeout, erro 5xx, resposta inválida)"""
+
+
+class InvalidRequestError(ValueError):
+    """Pedido que nunca pode ter sucesso (período/intervalo não suportado)"""
+
+
+# Duração aproximada de cada período aceite pelo Yahoo
+PERIOD_DAYS = {
+    '1d': 1, '5d': 5, '1mo': 31, '3mo': 92, '6mo': 183,
+    '1y': 366, '2y': 731, '5y': 1827, '10y': 3653
+}
+
+
+def period_to_start(period: str, end: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Converte um período do Yahoo (ex: 5d, 1y) numa data inicial
+
+    Returns:
+        Data inicial ou None para 'max'
+    """
+    end = end or datetime.now()
+
+    if period == 'ytd':
+        return datetime(end.year, 1, 1, tzinfo=end.tzinfo)
+    if period == 'max':
+        return None
+    if period not in PERIOD_DAYS:
+        raise InvalidRequestError(f"Unsupported period: {period}")
+
+    return end - timedelta(days=PERIOD_DAYS[period])
+
+
+def normalize_history(df: pd.DataFrame, symbol: str) -> Optional[pd.DataFrame]:
+    """
+    Normaliza um DataFrame de histórico para as colunas
+    time, symbol, open, high, low, close, volume
+    """
+    if df is None or df.empty:
+        return None
+
+    df = df.reset_index()
+
+    # Renomear colunas para minúsculas
+    df.columns = [str(col).lower().replace(' ', '_') for col in df.columns]
+
+    # Garantir que temos a coluna 'date' ou 'datetime'
+    if 'date' in df.columns:
+        df = df.rename(columns={'date': 'time'})
+    elif 'datetime' in df.columns:
+        df = df.rename(columns={'datetime': 'time'})
+
+    df['symbol'] = symbol
+
+    # Linhas sem preço (ex: dias sem negociação no download em bulk)
+    df = df.dropna(subset=['open', 'high', 'low', 'close'])
+    if df.empty:
+        return None
+
+    df['volume'] = df['volume'].fillna(0)
+
+    return df[OHLCV_COLUMNS].reset_index(drop=True)
+
+
+class DataProvider(abc.ABC):
+    """
+    Interface base para fontes de dados de mercado
+
+    Os métodos devolvem DataFrames já normalizados e lançam exceções
+    em caso de erro (quem chama decide como tratar).
+    """
+
+    name = 'base'
+
+    @abc.abstractmethod
+    def history(
+        self,
+        symbol: str,
+        period: Optional[str] = "1y",
+        interval: str = "1d",
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Optional[pd.DataFrame]:
+        """Histórico de um símbolo (start tem prioridade sobre period)"""
+        raise NotImplementedError
+
+    def history_bulk(
+        self,
+        symbols: List[str],
+        period: Optional[str] = "1y",
+        interval: str = "1d",
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        Histórico de vários símbolos num único pedido
+
+        A implementação por defeito faz um pedido por símbolo.
+        """
+        frames = {}
+        for symbol in symbols:
+            df = self.history(symbol, period, interval, start, end)
+            if df is not None:
+                frames[symbol] = df
+        return frames
+
+    @abc.abstractmethod
+    def info(self, symbol: str) -> Optional[Dict]:
+        """Metadados brutos do símbolo (nome, setor, ...)"""
+        raise NotImplementedError
+
+
+def is_no_data(message: str) -> bool:
+    lowered = message.lower()
+    return any(marker in lowered for marker in NO_DATA_MARKERS)
+
+
+def yahoo_error(message: str, confirmed_empty: bool = False) -> Optional[Exception]:
+    """
+    Classifica um erro do yfinance
+
+    Args:
+        confirmed_empty: O Yahoo respondeu ao pedido (ver has_chart_metadata)
+
+    Returns:
+        None quando significa "sem dados" confirmado, InvalidRequestError
+        para pedidos inválidos e ProviderError (transitório) para tudo o resto
+    """
+    if any(marker in message.lower() for marker in INVALID_REQUEST_MARKERS):
+        return InvalidRequestError(message)
+    if confirmed_empty and is_no_data(message):
+        return None
+    return ProviderError(message)
+
+
+def has_chart_metadata(ticker) -> bool:
+    """O pedido ao gráfico teve resposta válida (metadados com o fuso da bolsa)"""
+    metadata = getattr(ticker, '_history_metadata', None) or {}
+    return bool(metadata.get('exchangeTimezoneName'))
+
+
+class YahooProvider(DataProvider):
+    """
+    Provider Yahoo Finance via yfinance
+
+    O yfinance, por defeito, regista throttling e erros HTTP e devolve um
+    DataFrame vazio: aqui os erros são lançados (raise_errors=True / erros
+    por ticker do download) e convertidos em ProviderError, para que a
+    camada resiliente os repita e os conte no circuit breaker. "Sem dados"
+    (None) só quando o Yahoo respondeu com metadados e nenhuma barra.
+    """
+
+    name = 'yahoo'
+
+    def history(self, symbol, period="1y", interval="1d", start=None, end=None):
+        ticker = yf.Ticker(symbol)
+
+        try:
+            if start is not None:
+                df = ticker.history(start=start, end=end, interval=interval, raise_errors=True)
+            else:
+                df = ticker.history(period=period, interval=interval, raise_errors=True)
+        except Exception as e:
+            error = yahoo_error(str(e), confirmed_empty=has_chart_metadata(ticker))
+            if error is None:
+                return None
+            raise error from e
+
+        return normalize_history(df, symbol)
+
+    def history_bulk(self, symbols, period="1y", interval="1d", start=None, end=None):
+        if not symbols:
+            return {}
+
+        kwargs = {
+            'tickers': symbols,
+            'interval': interval,
+            'group_by': 'ticker',
+            'auto_adjust': True,
+            'actions': False,
+            'threads': False,
+            'progress': False
+        }
+        if start is not None:
+            kwargs.update(start=start, end=end)
+        else:
+            kwargs['period'] = period
+
+        # Erros por ticker ficam em yf.shared._ERRORS em vez de serem lançados
+        with _DOWNLOAD_LOCK:
+            raw = yf.download(**kwargs)
+            messages = {
+                symbol: str(message)
+                for symbol, message in (getattr(yf.shared, '_ERRORS', None) or {}).items()
+            }
+
+        # "Sem dados" não é confirmável no download: confirmados um a um
+        ambiguous = [symbol for symbol, message in messages.items() if is_no_data(message)]
+        errors = {
+            symbol: yahoo_error(message)
+            for symbol, message in messages.items() if symbol not in ambiguous
+        }
+        invalid = [e for e in errors.values() if isinstance(e, InvalidRequestError)]
+        if invalid:
+            raise invalid[0]
+        if errors:
+            raise ProviderError(
+                f"Bulk download failed for {len(errors)} symbols "
+                f"({', '.join(sorted(errors)[:5])}): {next(iter(errors.values()))}"
+            )
+
+        frames = {}
+        if raw is not None and not raw.empty:
+            # Com um único ticker o yfinance devolve colunas simples
+            if not isinstance(raw.columns, pd.MultiIndex):
+                df = normalize_history(raw, symbols[0])
+                if df is not None:
+                    frames[symbols[0]] = df
+            else:
+                available = set(raw.columns.get_level_values(0))
+                for symbol in symbols:
+                    if symbol not in available or symbol in ambiguous:
+                        continue
+                    df = normalize_history(raw[symbol], symbol)
+                    if df is not None:
+                        frames[symbol] = df
+
+        # Pedido próprio com metadados: ProviderError se não houve resposta
+        for symbol in ambiguous:
+            df = self.history(symbol, period, interval, start, end)
+            if df is not None:
+                frames[symbol] = df
+
+        return frames
+
+    def info(self, symbol):
+        try:
+            return yf.Ticker(symbol).info
+        except Exception as e:
+            # Respostas truncadas/throttling aparecem como JSONDecodeError/KeyError
+            raise ProviderError(f"{symbol}: {str(e)}") from e
+
+
+class FixtureProvider(DataProvider):
+    """
+    Provider local baseado em ficheiros CSV, para testes e benchmarks
+
+    Estrutura esperada do diretório:
+        {SYMBOL}_{interval}.csv  (ou {SYMBOL}.csv)
+        info.json                (opcional, {symbol: {...}})
+
+    Args:
+        directory: Diretório com as fixtures
+        latency: Latência simulada por pedido (segundos)
+    """
+
+    name = 'fixture'
+
+    def __init__(self, directory: str, latency: float = 0.0):
+        self.directory = directory
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._frames: Dict[tuple, pd.DataFrame] = {}
+        self._info: Optional[Dict] = None
+
+    def _load(self, symbol: str, interval: str) -> Optional[pd.DataFrame]:
+        key = (symbol, interval)
+        if key not in self._frames:
+            for name in (f"{symbol}_{interval}.csv", f"{symbol}.csv"):
+                path = os.path.join(self.directory, name)
+                if os.path.exists(path):
+                    df = pd.read_csv(path)
+                    df['time'] = pd.to_datetime(df['time'], utc=True)
+                    self._frames[key] = df.sort_values('time')
+                    break
+            else:
+                self._frames[key] = None
+        return self._frames[key]
+
+    @staticmethod
+    def _utc(value) -> pd.Timestamp:
+        ts = pd.Timestamp(value)
+        return ts.tz_localize('UTC') if ts.tzinfo is None else ts
+
+    def _slice(self, df, period, start, end):
+        if start is not None:
+            df = df[df['time'] >= self._utc(start)]
+        elif period:
+            # Períodos relativos à última barra da fixture
+            period_start = period_to_start(period, df['time'].max())
+            if period_start is not None:
+                df = df[df['time'] >= period_start]
+        if end is not None:
+            df = df[df['time'] < self._utc(end)]
+        return df
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def history(self, symbol, period="1y", interval="1d", start=None, end=None):
+        self._request()
+        df = self._load(symbol, interval)
+        if df is None:
+            return None
+        return normalize_history(
+            self._slice(df, period, start, end).set_index('time'),
+            symbol
+        )
+
+    def history_bulk(self, symbols, period="1y", interval="1d", start=None, end=None):
+        # Um único "pedido" para todos os símbolos
+        self._request()
+        frames = {}
+        for symbol in symbols:
+            df = self._load(symbol, interval)
+            if df is None:
+                continue
+            df = normalize_history(
+                self._slice(df, period, start, end).set_index('time'),
+                symbol
+            )
+            if df is not None:
+                frames[symbol] = df
+        return frames
+
+    def info(self, symbol):
+        self._request()
+        if self._info is None:
+            path = os.path.join(self.directory, 'info.json')
+            if os.path.exists(path):
+                with open(path) as f:
+                    self._info = json.load(f)
+            else:
+                self._info = {}
+        return self._info.get(symbol, {'longName': symbol})
+
+
+class FaultInjectingProvider(DataProvider):
+    """
+    Envolve outro provider injetando falhas, para testar a camada resiliente
+
+    Args:
+        provider: Provider real (normalmente FixtureProvider)
+        failure_rate: Probabilidade de cada pedido falhar
+        failure_latency: Tempo gasto por um pedido falhado (simula timeouts)
+        empty_symbols: Símbolos que devolvem sempre vazio (deslistados)
+        seed: Semente do gerador aleatório
+    """
+
+    name = 'faulty'
+
+    def __init__(
+        self,
+        provider: DataProvider,
+        failure_rate: float = 0.0,
+        failure_latency: float = 0.0,
+        empty_symbols: Optional[List[str]] = None,
+        seed: Optional[int] = None
+    ):
+        self.provider = provider
+        self.failure_rate = failure_rate
+        self.failure_latency = failure_latency
+        self.empty_symbols = set(empty_symbols or [])
+        self.requests = 0
+        self.failures = 0
+        self._outage_until = 0.0
+        self._fail_next = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def outage(self, seconds: float):
+        """Todos os pedidos falham durante `seconds`"""
+        self._outage_until = time.monotonic() + seconds
+
+    def fail_next(self, count: int):
+        """Os próximos `count` pedidos falham"""
+        with self._lock:
+            self._fail_next += count
+
+    def _maybe_fail(self):
+        with self._lock:
+            self.requests += 1
+            fail = self._fail_next > 0 or time.monotonic() < self._outage_until \
+                or self._random.random() < self.failure_rate
+            if self._fail_next > 0:
+                self._fail_next -= 1
+            if fail:
+                self.failures += 1
+
+        if fail:
+            if self.failure_latency:
+                time.sleep(self.failure_latency)
+            raise ProviderError("Injected failure: 429 Too Many Requests")
+
+    def history(self, symbol, period="1y", interval="1d", start=None, end=None):
+        self._maybe_fail()
+        if symbol in self.empty_symbols:
+            return None
+        return self.provider.history(symbol, period, interval, start, end)
+
+    def history_bulk(self, symbols, period="1y", interval="1d", start=None, end=None):
+        self._maybe_fail()
+        return self.provider.history_bulk(
+            [s for s in symbols if s not in self.empty_symbols],
+            period, interval, start, end
+        )
+
+    def info(self, symbol):
+        self._maybe_fail()
+        if symbol in self.empty_symbols:
+            return {}
+        return self.provider.info(symbol)
+
+
+def get_provider(name: Optional[str] = None) -> DataProvider:
+    """
+    Cria o provider configurado (env COLLECTOR_PROVIDER)
+
+    Providers disponíveis: yahoo (default), fixture (usa FIXTURE_DIR),
+    faulty (fixture com falhas injetadas, FAULT_RATE/FAULT_LATENCY)
+    """
+    name = name or os.getenv('COLLECTOR_PROVIDER', 'yahoo')
+
+    if name == 'yahoo':
+        return YahooProvider()
+    if name == 'fixture':
+        return FixtureProvider(
+            os.getenv('FIXTURE_DIR', './fixtures'),
+            latency=float(os.getenv('FIXTURE_LATENCY', '0'))
+        )
+
+    if name == 'faulty':
+        return FaultInjectingProvider(
+            get_provider('fixture'),
+            failure_rate=float(os.getenv('FAULT_RATE', '0.2')),
+            failure_latency=float(os.getenv('FAULT_LATENCY', '0'))
+        )
+
+    raise ValueError(f"Unknown data provider: {name}")
@@ -0,0 +1,156 @@
+# ml-service/rate_limiter.py
+# Token bucket (local ou partilhado entre processos via Redis) para limitar chamadas ao Yahoo Finance
+import logging
+import threading
+import time
+from typing import Optional
+
+import redis
+
+from cache import KEY_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# Refill + consumo atómicos no Redis (relógio do servidor); devolve a espera
+# em segundos (0 = token concedido). Lua trunca números: devolve string.
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local last = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+class TokenBucketRateLimiter:
+    """
+    Rate limiter token bucket thread-safe
+
+    Os tokens são repostos continuamente a `rate` por segundo até ao
+    máximo de `capacity`. Cada chamada ao provider consome um token.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+
+        self.rate = float(rate)
+        self.capacity = max(1, int(capacity))
+        self._tokens = float(self.capacity)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.acquired = 0
+        self.total_wait = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        if elapsed > 0:
+            self._tokens = min(
+                self.capacity,
+                self._tokens + elapsed * self.rate
+            )
+            self._last_refill = now
+
+    def acquire(self, tokens: int = 1) -> float:
+        """
+        Bloqueia até existirem tokens disponíveis
+
+        Returns:
+            Tempo (segundos) que a chamada esperou
+        """
+        start = time.monotonic()
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    waited = now - start
+                    self.acquired += tokens
+                    self.total_wait += waited
+                    return waited
+
+                # Tempo até haver tokens suficientes
+                sleep_for = (tokens - self._tokens) / self.rate
+
+            time.sleep(sleep_for)
+
+    def stats(self) -> dict:
+        """Métricas do rate limiter"""
+        with self._lock:
+            return {
+                'rate_per_second': self.rate,
+                'capacity': self.capacity,
+                'acquired': self.acquired,
+                'total_wait_seconds': round(self.total_wait, 3)
+            }
+
+
+class RedisTokenBucketRateLimiter(TokenBucketRateLimiter):
+    """
+    Token bucket guardado no Redis, partilhado por todos os processos
+
+    A API (/collect/scheduled), o scheduler e os workers de coleta consomem
+    do mesmo bucket, pelo que o ritmo combinado fica em `rate`. Com o Redis
+    em baixo cada processo recorre ao seu bucket local.
+    """
+
+    def __init__(self, client: redis.Redis, rate: float, capacity: int = 1,
+                 name: str = 'yahoo'):
+        super().__init__(rate, capacity)
+        self.key = f"{KEY_PREFIX}:ratelimit:{name}"
+        self._take = client.register_script(TAKE_SCRIPT)
+        self.fallbacks = 0
+
+    def acquire(self, tokens: int = 1) -> float:
+        start = time.monotonic()
+
+        while True:
+            try:
+                sleep_for = float(self._take(
+                    keys=[self.key], args=[self.rate, self.capacity, tokens]
+                ))
+            except redis.RedisError as e:
+                logger.warning(f"Shared rate limiter unavailable, using local bucket: {str(e)}")
+                with self._lock:
+                    self.fallbacks += 1
+                return super().acquire(tokens)
+
+            if sleep_for <= 0:
+                waited = time.monotonic() - start
+                with self._lock:
+                    self.acquired += tokens
+                    self.total_wait += waited
+                return waited
+
+            time.sleep(sleep_for)
+
+    def stats(self) -> dict:
+        with self._lock:
+            fallbacks = self.fallbacks
+        return {**super().stats(), 'shared': True, 'fallbacks': fallbacks}
+
+
+def create_rate_limiter(rate: float, capacity: int = 1,
+                        redis_client: Optional[redis.Redis] = None) -> TokenBucketRateLimiter:
+    """Bucket partilhado no Redis quando há cliente; senão local ao processo"""
+    if redis_client is not None:
+        return RedisTokenBucketRateLimiter(redis_client, rate, capacity)
+    return TokenBucketRateLimiter(rate, capacity)
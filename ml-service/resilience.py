@@ -0,0 +1,351 @@
+# ml-service/resilience.py
+# Camada de fetch resiliente: retries com backoff, circuit breaker e cache negativa
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from providers import DataProvider, InvalidRequestError
+
+logger = logging.getLogger(__name__)
+
+# Erros do próprio pedido (período/intervalo inválido): não vale a pena
+# repetir e não dizem nada sobre a saúde do provider. ValueError/KeyError/
+# TypeError genéricos ficam de fora: são o que o yfinance lança com
+# respostas truncadas ou throttling (JSONDecodeError incluído)
+PERMANENT_ERRORS = (InvalidRequestError, NotImplementedError)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Pedido rejeitado sem ir à rede: o circuit breaker está aberto"""
+
+
+class RetryPolicy:
+    """Backoff exponencial com jitter (metade fixa, metade aleatória)"""
+
+    def __init__(
+        self,
+        max_attempts: Optional[int] = None,
+        base_delay: Optional[float] = None,
+        max_delay: Optional[float] = None
+    ):
+        self.max_attempts = max(1, max_attempts or int(os.getenv('COLLECTOR_RETRY_ATTEMPTS', '3')))
+        self.base_delay = base_delay if base_delay is not None else float(
+            os.getenv('COLLECTOR_RETRY_BASE_DELAY', '1.0')
+        )
+        self.max_delay = max_delay if max_delay is not None else float(
+            os.getenv('COLLECTOR_RETRY_MAX_DELAY', '30')
+        )
+
+    def delay(self, attempt: int) -> float:
+        """Espera antes da tentativa attempt + 1 (attempt começa em 1)"""
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return cap / 2 + random.uniform(0, cap / 2)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por taxa de erro numa janela das últimas chamadas
+
+    Abre quando, com pelo menos `min_calls` na janela, a fração de falhas
+    atinge `error_rate`. Aberto, rejeita tudo durante `reset_timeout`
+    segundos; depois deixa passar uma única chamada de teste (half-open)
+    que o fecha ou o volta a abrir.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: Optional[int] = None,
+        min_calls: Optional[int] = None,
+        error_rate: Optional[float] = None,
+        reset_timeout: Optional[float] = None
+    ):
+        self.name = name
+        self.window = window or int(os.getenv('COLLECTOR_BREAKER_WINDOW', '20'))
+        self.min_calls = min_calls or int(os.getenv('COLLECTOR_BREAKER_MIN_CALLS', '5'))
+        self.error_rate = error_rate or float(os.getenv('COLLECTOR_BREAKER_ERROR_RATE', '0.5'))
+        self.reset_timeout = reset_timeout or float(
+            os.getenv('COLLECTOR_BREAKER_RESET_SECONDS', '60')
+        )
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=self.window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.trips = 0
+
+    def allow(self):
+        """Lança CircuitOpenError se a chamada não puder avançar"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError(f"Circuit {self.name} is open")
+                self.state = HALF_OPEN
+                self._probing = False
+
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError(f"Circuit {self.name} is half-open (probe in flight)")
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                logger.info(f"Circuit {self.name} closed")
+                self.state = CLOSED
+                self._outcomes.clear()
+                self._probing = False
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._open()
+                return
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if self.state == CLOSED and len(self._outcomes) >= self.min_calls \
+                    and failures / len(self._outcomes) >= self.error_rate:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probing = False
+        self.trips += 1
+        logger.warning(
+            f"Circuit {self.name} opened for {self.reset_timeout:.0f}s "
+            f"(trip #{self.trips})"
+        )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            outcomes = list(self._outcomes)
+        return {
+            'state': self.state,
+            'trips': self.trips,
+            'window_calls': len(outcomes),
+            'window_error_rate': round(outcomes.count(False) / len(outcomes), 3) if outcomes else 0.0
+        }
+
+
+class NegativeCache:
+    """Pedidos que devolveram vazio (símbolo deslistado, sem barras) com TTL curto"""
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv('COLLECTOR_NEGATIVE_TTL', '900'))
+        self._entries: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: tuple) -> bool:
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False
+            return True
+
+    def add(self, key: tuple):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+
+    def __len__(self) -> int:
+        with self._lock:
+            now = time.monotonic()
+            return sum(1 for expires in self._entries.values() if expires >= now)
+
+
+class ResilientProvider(DataProvider):
+    """
+    Envolve um provider com retries, circuit breaker e cache negativa
+
+    Cada tentativa passa pelo `before_call` (o rate limiter do collector),
+    mas só depois do breaker e da cache negativa: pedidos rejeitados ou
+    já sabidamente vazios não gastam tokens nem tempo de rede.
+
+    As métricas estimam o tempo poupado: cada rejeição do breaker vale a
+    duração média de uma chamada falhada (timeouts + backoff) e cada hit
+    da cache negativa a duração média de uma chamada vazia.
+    """
+
+    def __init__(
+        self,
+        provider: DataProvider,
+        before_call: Optional[Callable[[], object]] = None,
+        retry: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        negative_cache: Optional[NegativeCache] = None
+    ):
+        self.provider = provider
+        self.name = provider.name
+        self.before_call = before_call
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker(provider.name)
+        self.negative_cache = negative_cache or NegativeCache()
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.retry_sleep = 0.0
+        self.recovered = 0
+        self.failures = 0
+        self.breaker_rejections = 0
+        self.negative_hits = 0
+        self.empty_calls = 0
+        self.failed_seconds = 0.0
+        self.empty_seconds = 0.0
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def _call(self, operation: str, fn: Callable):
+        """Executa fn com retries; lança CircuitOpenError ou o último erro"""
+        self._count(calls=1)
+        started = time.perf_counter()
+        attempt = 0
+
+        while True:
+            attempt += 1
+            try:
+                self.breaker.allow()
+            except CircuitOpenError:
+                if attempt == 1:
+                    self._count(breaker_rejections=1)
+                else:
+                    self._count(failures=1, failed_seconds=time.perf_counter() - started)
+                raise
+
+            if self.before_call is not None:
+                self.before_call()
+
+            self._count(attempts=1)
+            try:
+                result = fn()
+            except PERMANENT_ERRORS:
+                # O breaker não conta erros do pedido, só a saúde do provider
+                self.breaker.record_success()
+                raise
+            except Exception as e:
+                self.breaker.record_failure()
+                if attempt >= self.retry.max_attempts:
+                    self._count(failures=1, failed_seconds=time.perf_counter() - started)
+                    raise
+
+                delay = self.retry.delay(attempt)
+                logger.warning(
+                    f"{self.name}.{operation} failed (attempt {attempt}/"
+                    f"{self.retry.max_attempts}), retrying in {delay:.1f}s: {str(e)}"
+                )
+                self._count(retries=1, retry_sleep=delay)
+                time.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            if attempt > 1:
+                self._count(recovered=1)
+            return result
+
+    def _empty(self, key: tuple, started: float):
+        self.negative_cache.add(key)
+        self._count(empty_calls=1, empty_seconds=time.perf_counter() - started)
+
+    @staticmethod
+    def _key(symbol, period, interval, start, end) -> tuple:
+        return ('history', symbol, interval, str(start or period), str(end))
+
+    def history(self, symbol, period="1y", interval="1d", start=None, end=None):
+        key = self._key(symbol, period, interval, start, end)
+        if key in self.negative_cache:
+            self._count(negative_hits=1)
+            return None
+
+        started = time.perf_counter()
+        try:
+            df = self._call(
+                'history',
+                lambda: self.provider.history(symbol, period, interval, start, end)
+            )
+        except PERMANENT_ERRORS:
+            self._empty(key, started)
+            raise
+
+        if df is None:
+            self._empty(key, started)
+        return df
+
+    def history_bulk(self, symbols, period="1y", interval="1d", start=None, end=None):
+        keys = {symbol: self._key(symbol, period, interval, start, end) for symbol in symbols}
+        pending: List[str] = [s for s in symbols if keys[s] not in self.negative_cache]
+        self._count(negative_hits=len(symbols) - len(pending))
+        if not pending:
+            return {}
+
+        started = time.perf_counter()
+        frames = self._call(
+            'history_bulk',
+            lambda: self.provider.history_bulk(pending, period, interval, start, end)
+        )
+
+        missing = [symbol for symbol in pending if symbol not in frames]
+        for symbol in missing:
+            self.negative_cache.add(keys[symbol])
+        if missing:
+            # Custo do pedido repartido pelos símbolos devolvidos vazios
+            self._count(
+                empty_calls=len(missing),
+                empty_seconds=(time.perf_counter() - started) * len(missing) / len(pending)
+            )
+        return frames
+
+    def info(self, symbol):
+        key = ('info', symbol)
+        if key in self.negative_cache:
+            self._count(negative_hits=1)
+            return {}
+
+        started = time.perf_counter()
+        try:
+            info = self._call('info', lambda: self.provider.info(symbol))
+        except PERMANENT_ERRORS:
+            self._empty(key, started)
+            raise
+
+        if not info:
+            self._empty(key, started)
+        return info
+
+    def stats(self) -> Dict:
+        with self._lock:
+            avg_failed = self.failed_seconds / self.failures if self.failures else 0.0
+            avg_empty = self.empty_seconds / self.empty_calls if self.empty_calls else 0.0
+            return {
+                'provider': self.name,
+                'calls': self.calls,
+                'attempts': self.attempts,
+                'retries': self.retries,
+                'retry_sleep_seconds': round(self.retry_sleep, 3),
+                'recovered_by_retry': self.recovered,
+                'failures': self.failures,
+                'avg_failed_call_seconds': round(avg_failed, 3),
+                'breaker': self.breaker.stats(),
+                'breaker_rejections': self.breaker_rejections,
+                'breaker_saved_seconds': round(self.breaker_rejections * avg_failed, 3),
+                'negative_cache_entries': len(self.negative_cache),
+                'negative_cache_hits': self.negative_hits,
+                'negative_cache_saved_seconds': round(self.negative_hits * avg_empty, 3)
+            }
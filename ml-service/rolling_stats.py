@@ -0,0 +1,432 @@
+# ml-service/rolling_stats.py
+# Estatísticas rolantes por símbolo mantidas a cada escrita de barras
+import logging
+import math
+import os
+import threading
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+# Janelas mantidas (dias); 0 = histórico completo
+WINDOWS = (7, 30, 90, 365)
+ALL_HISTORY = 0
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS rolling_stats (
+        symbol VARCHAR(20) NOT NULL,
+        window_days INTEGER NOT NULL,
+        data_points INTEGER NOT NULL,
+        average_price NUMERIC(14,6),
+        min_price NUMERIC(12,4),
+        max_price NUMERIC(12,4),
+        average_volume NUMERIC(20,2),
+        volatility NUMERIC(14,6),
+        first_time TIMESTAMPTZ,
+        last_time TIMESTAMPTZ,
+        updated_at TIMESTAMPTZ DEFAULT NOW(),
+        PRIMARY KEY (symbol, window_days)
+    )
+"""
+
+
+class Welford:
+    """Média/variância incrementais com inserção e remoção"""
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, x: float):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def remove(self, x: float):
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        old_mean = self.mean
+        self.count -= 1
+        self.mean = (old_mean * (self.count + 1) - x) / self.count
+        self.m2 = max(self.m2 - (x - old_mean) * (x - self.mean), 0.0)
+
+    @property
+    def stddev(self) -> Optional[float]:
+        # Desvio padrão amostral (igual ao STDDEV do PostgreSQL)
+        if self.count < 2:
+            return None
+        return math.sqrt(self.m2 / (self.count - 1))
+
+
+class RollingWindow:
+    """
+    Janela temporal de N dias ancorada na última barra
+
+    Mantém Welford do fecho, soma de volume e deques monotónicos para o
+    mínimo (low) e máximo (high), tudo em O(1) amortizado por barra.
+    """
+
+    def __init__(self, days: int):
+        self.days = days
+        self.bars = deque()          # (time, close, low, high, volume)
+        self.close = Welford()
+        self.volume_sum = 0.0
+        self._min_low = deque()      # (time, low) crescente
+        self._max_high = deque()     # (time, high) decrescente
+
+    def _push_extremes(self, bar):
+        time_, _, low, high, _ = bar
+        while self._min_low and self._min_low[-1][1] >= low:
+            self._min_low.pop()
+        self._min_low.append((time_, low))
+        while self._max_high and self._max_high[-1][1] <= high:
+            self._max_high.pop()
+        self._max_high.append((time_, high))
+
+    def push(self, bar):
+        self.bars.append(bar)
+        self.close.add(bar[1])
+        self.volume_sum += bar[4]
+        self._push_extremes(bar)
+        self._evict(bar[0] - timedelta(days=self.days))
+
+    def _evict(self, cutoff: datetime):
+        while self.bars and self.bars[0][0] < cutoff:
+            bar = self.bars.popleft()
+            self.close.remove(bar[1])
+            self.volume_sum -= bar[4]
+        while self._min_low and self._min_low[0][0] < cutoff:
+            self._min_low.popleft()
+        while self._max_high and self._max_high[0][0] < cutoff:
+            self._max_high.popleft()
+
+    def truncate_from(self, start: datetime) -> List[tuple]:
+        """Remove as barras com time >= start (revisões) e devolve-as"""
+        removed = []
+        while self.bars and self.bars[-1][0] >= start:
+            bar = self.bars.pop()
+            self.close.remove(bar[1])
+            self.volume_sum -= bar[4]
+            removed.append(bar)
+
+        if removed:
+            # Os deques monotónicos perderam informação: reconstruir (O(janela))
+            self._min_low.clear()
+            self._max_high.clear()
+            for bar in self.bars:
+                self._push_extremes(bar)
+        return removed
+
+    def summary(self) -> Dict:
+        count = self.close.count
+        return {
+            'data_points': count,
+            'average_price': self.close.mean if count else None,
+            'min_price': self._min_low[0][1] if self._min_low else None,
+            'max_price': self._max_high[0][1] if self._max_high else None,
+            'average_volume': self.volume_sum / count if count else None,
+            'volatility': self.close.stddev,
+            'first_time': self.bars[0][0] if self.bars else None,
+            'last_time': self.bars[-1][0] if self.bars else None
+        }
+
+
+class HistorySummary:
+    """Resumo de todo o histórico (só cresce; revisões recarregam do SQL)"""
+
+    def __init__(self, row: Optional[Dict] = None):
+        row = row or {}
+        count = row.get('count') or 0
+        variance = row.get('variance') or 0.0
+        self.close = Welford(count, float(row.get('mean') or 0.0), float(variance) * count)
+        self.min_low = float(row['min_low']) if row.get('min_low') is not None else None
+        self.max_high = float(row['max_high']) if row.get('max_high') is not None else None
+        self.volume_sum = float(row.get('volume_sum') or 0.0)
+        self.first_time = row.get('first_time')
+        self.last_time = row.get('last_time')
+
+    def push(self, bar):
+        time_, close, low, high, volume = bar
+        self.close.add(close)
+        self.volume_sum += volume
+        self.min_low = low if self.min_low is None else min(self.min_low, low)
+        self.max_high = high if self.max_high is None else max(self.max_high, high)
+        self.first_time = self.first_time or time_
+        self.last_time = time_
+
+    def summary(self) -> Dict:
+        count = self.close.count
+        return {
+            'data_points': count,
+            'average_price': self.close.mean if count else None,
+            'min_price': self.min_low,
+            'max_price': self.max_high,
+            'average_volume': self.volume_sum / count if count else None,
+            'volatility': self.close.stddev,
+            'first_time': self.first_time,
+            'last_time': self.last_time
+        }
+
+
+class SymbolStats:
+    """Janelas rolantes + histórico completo de um símbolo"""
+
+    def __init__(self, history: HistorySummary):
+        self.windows = {days: RollingWindow(days) for days in WINDOWS}
+        self.history = history
+        # updated_at da última escrita deste processo em rolling_stats
+        self.persisted_at: Optional[datetime] = None
+
+    @property
+    def last_time(self) -> Optional[datetime]:
+        return self.history.last_time
+
+
+def _bar_tuples(df: pd.DataFrame) -> List[tuple]:
+    times = pd.to_datetime(df['time'], utc=True)
+    return [
+        (t.to_pydatetime(), float(c), float(lo), float(hi), float(v))
+        for t, c, lo, hi, v in zip(
+            times, df['close'], df['low'], df['high'], df['volume']
+        )
+    ]
+
+
+class RollingStatsEngine:
+    """
+    Mantém estatísticas rolantes (7/30/90/365 dias e histórico completo)
+
+    O estado vive em memória no processo que escreve as barras (collector
+    / scheduler) e os resumos são persistidos em rolling_stats, onde a API
+    os lê com uma consulta por chave primária.
+
+    Vários processos escrevem barras (API, scheduler, replay do lake): cada
+    atualização corre sob um advisory lock por símbolo e recarrega o estado
+    da BD quando outro processo escreveu desde a última vez (updated_at de
+    rolling_stats diferente do nosso ou barras novas antes das recebidas).
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._states: Dict[str, SymbolStats] = {}
+        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._lock = threading.Lock()
+
+    def _load_history(self, symbol: str) -> HistorySummary:
+        """Agregado de todo o histórico (uma passagem pelo índice do símbolo)"""
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text("""
+                    SELECT
+                        COUNT(*) AS count,
+                        AVG(close) AS mean,
+                        VAR_POP(close) AS variance,
+                        MIN(low) AS min_low,
+                        MAX(high) AS max_high,
+                        SUM(volume) AS volume_sum,
+                        MIN(time) AS first_time,
+                        MAX(time) AS last_time
+                    FROM stock_data
+                    WHERE symbol = :symbol
+                    AND interval = '1d'
+                """),
+                {'symbol': symbol}
+            ).mappings().fetchone()
+
+        return HistorySummary(dict(row) if row else None)
+
+    def _load(self, symbol: str) -> SymbolStats:
+        """Constrói o estado a partir da BD (agregado + barras da maior janela)"""
+        stats = SymbolStats(self._load_history(symbol))
+        if stats.last_time is None:
+            return stats
+
+        with self.engine.connect() as conn:
+            bars = pd.read_sql(
+                text("""
+                    SELECT time, close, low, high, volume
+                    FROM stock_data
+                    WHERE symbol = :symbol
+                    AND interval = '1d'
+                    AND time >= :start_date
+                    ORDER BY time
+                """),
+                conn,
+                params={
+                    'symbol': symbol,
+                    'start_date': stats.last_time - timedelta(days=max(WINDOWS))
+                }
+            )
+
+        for bar in _bar_tuples(bars):
+            for window in stats.windows.values():
+                window.push(bar)
+
+        logger.info(f"Loaded rolling stats for {symbol} ({len(bars)} bars)")
+        return stats
+
+    def _is_stale(self, conn, symbol: str, stats: SymbolStats, start: datetime) -> bool:
+        """Outro processo escreveu barras ou resumos desde a nossa última atualização"""
+        row = conn.execute(
+            text("""
+                SELECT
+                    (SELECT updated_at FROM rolling_stats
+                     WHERE symbol = :symbol AND window_days = :all_history) AS persisted_at,
+                    (SELECT MAX(time) FROM stock_data
+                     WHERE symbol = :symbol AND interval = '1d'
+                     AND time < :start) AS previous
+            """),
+            {'symbol': symbol, 'all_history': ALL_HISTORY, 'start': start}
+        ).fetchone()
+        persisted_at, previous = row
+
+        if persisted_at is not None and persisted_at != stats.persisted_at:
+            return True
+        # Acréscimo puro: a barra anterior na BD tem de ser a nossa última
+        return start > stats.last_time and previous != stats.last_time
+
+    def update(self, symbol: str, bars: pd.DataFrame):
+        """Incorpora barras acabadas de escrever e persiste os resumos"""
+        if bars is None or bars.empty:
+            return
+
+        new_bars = sorted(_bar_tuples(bars))
+
+        with self._lock:
+            symbol_lock = self._locks[symbol]
+
+        with symbol_lock, self.engine.begin() as conn:
+            conn.execute(
+                text("SELECT pg_advisory_xact_lock(hashtext(:key))"),
+                {'key': f"rolling_stats:{symbol}"}
+            )
+
+            stats = self._states.get(symbol)
+            start, end = new_bars[0][0], new_bars[-1][0]
+
+            if stats is not None and stats.last_time is not None \
+                    and self._is_stale(conn, symbol, stats, start):
+                logger.info(f"Rolling stats for {symbol} changed in another process, reloading")
+                stats = None
+
+            if stats is None or stats.last_time is None or end < stats.last_time:
+                # Primeira vez (ou revisão que não chega à última barra):
+                # o estado carregado da BD já inclui as barras escritas
+                stats = self._load(symbol)
+            elif start <= stats.last_time:
+                # Barras revistas/sobrepostas: retirar e voltar a inserir
+                for window in stats.windows.values():
+                    window.truncate_from(start)
+                    for bar in new_bars:
+                        window.push(bar)
+                # O histórico completo não suporta remoção de extremos
+                stats.history = self._load_history(symbol)
+            else:
+                for bar in new_bars:
+                    for window in stats.windows.values():
+                        window.push(bar)
+                    stats.history.push(bar)
+
+            summaries = {days: w.summary() for days, w in stats.windows.items()}
+            summaries[ALL_HISTORY] = stats.history.summary()
+
+            stats.persisted_at = self._persist(conn, symbol, summaries)
+            self._states[symbol] = stats
+
+    def _persist(self, conn, symbol: str, summaries: Dict[int, Dict]) -> Optional[datetime]:
+        """Grava os resumos; devolve o updated_at escrito (None se nada)"""
+        updated_at = datetime.now(timezone.utc)
+        rows = [
+            {'symbol': symbol, 'window_days': days, 'updated_at': updated_at, **summary}
+            for days, summary in summaries.items()
+            if summary['data_points']
+        ]
+        if not rows:
+            return None
+
+        conn.execute(
+            text("""
+                INSERT INTO rolling_stats (
+                    symbol, window_days, data_points, average_price,
+                    min_price, max_price, average_volume, volatility,
+                    first_time, last_time, updated_at
+                )
+                VALUES (
+                    :symbol, :window_days, :data_points, :average_price,
+                    :min_price, :max_price, :average_volume, :volatility,
+                    :first_time, :last_time, :updated_at
+                )
+                ON CONFLICT (symbol, window_days) DO UPDATE SET
+                    data_points = EXCLUDED.data_points,
+                    average_price = EXCLUDED.average_price,
+                    min_price = EXCLUDED.min_price,
+                    max_price = EXCLUDED.max_price,
+                    average_volume = EXCLUDED.average_volume,
+                    volatility = EXCLUDED.volatility,
+                    first_time = EXCLUDED.first_time,
+                    last_time = EXCLUDED.last_time,
+                    updated_at = EXCLUDED.updated_at
+            """),
+            rows
+        )
+        return updated_at
+
+
+def get_rolling_stats(engine, symbol: str, days: int) -> Optional[Dict]:
+    """
+    Lookup O(1) de uma janela pré-calculada (mesmo formato do caminho SQL)
+
+    Devolve None (usar o caminho SQL) se a janela não for mantida, se a
+    última barra for mais antiga que ROLLING_STATS_MAX_LAG_DAYS (a janela
+    está ancorada na última barra e não no momento atual) ou se a leitura
+    falhar (p.ex. tabela rolling_stats em falta).
+    """
+    if days not in WINDOWS and days != ALL_HISTORY:
+        return None
+
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(
+                text("""
+                    SELECT data_points, average_price, min_price, max_price,
+                           average_volume, volatility, first_time, last_time
+                    FROM rolling_stats
+                    WHERE symbol = :symbol AND window_days = :days
+                """),
+                {'symbol': symbol, 'days': days}
+            ).mappings().fetchone()
+    except SQLAlchemyError as e:
+        logger.warning(f"Rolling stats lookup failed for {symbol}, using SQL aggregate: {str(e)}")
+        return None
+
+    if not row or not row['data_points']:
+        return None
+
+    max_lag = timedelta(days=float(os.getenv('ROLLING_STATS_MAX_LAG_DAYS', '4')))
+    if days != ALL_HISTORY and row['last_time'] < datetime.now(timezone.utc) - max_lag:
+        return None
+
+    def _float(value):
+        return float(value) if value is not None else None
+
+    return {
+        'symbol': symbol,
+        'period_days': days,
+        'data_points': row['data_points'],
+        'average_price': _float(row['average_price']),
+        'min_price': _float(row['min_price']),
+        'max_price': _float(row['max_price']),
+        'average_volume': int(row['average_volume']) if row['average_volume'] else None,
+        'volatility': _float(row['volatility']),
+        'first_time': row['first_time'].isoformat(),
+        'last_time': row['last_time'].isoformat()
+    }
@@ -0,0 +1,166 @@
+# ml-service/rollups.py
+# Agregação das barras para intervalos maiores (1m -> 1h -> 1d) com pandas, a cada escrita
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import text
+
+from bulk_writer import BulkUpsertWriter
+from market_calendar import ExchangeCalendar, get_calendar
+
+logger = logging.getLogger(__name__)
+
+# Intervalo coletado -> intervalo agregado a partir dele
+ROLLUPS = {'1m': '1h', '1h': '1d'}
+
+# Intervalos servidos pelos endpoints (coletados ou agregados)
+INTERVALS = ['1m', '1h', '1d']
+
+OHLCV_AGGREGATIONS = {
+    'open': ('open', 'first'),
+    'high': ('high', 'max'),
+    'low': ('low', 'min'),
+    'close': ('close', 'last'),
+    'volume': ('volume', 'sum')
+}
+
+
+class RollupEngine:
+    """
+    Mantém as barras de 1h e 1d derivadas das barras mais finas
+
+    Cada bucket afetado por uma escrita é recalculado a partir de todas as
+    barras finas que a BD tem para ele (uma coleta incremental traz só parte
+    do bucket). Os buckets seguem o calendário da bolsa: horas alinhadas à
+    abertura (9:30, 10:30...), como as barras de 1h do Yahoo, e dias à
+    meia-noite local, como as diárias.
+    """
+
+    def __init__(self, engine, writer: Optional[BulkUpsertWriter] = None,
+                 calendar: Optional[ExchangeCalendar] = None):
+        self.engine = engine
+        self.writer = writer or BulkUpsertWriter(engine)
+        self.calendar = calendar or get_calendar(None)
+
+    def buckets(self, times: pd.Series, target: str) -> pd.Series:
+        """Início (UTC) do bucket de `target` de cada instante"""
+        local = pd.to_datetime(times, utc=True).dt.tz_convert(self.calendar.tz.key)
+
+        if target == '1d':
+            starts = local.dt.normalize()
+        elif target == '1h':
+            open_ = self.calendar.open_time
+            offset = pd.Timedelta(minutes=open_.minute)
+            starts = (local - offset).dt.floor('h') + offset
+        else:
+            raise ValueError(f"Unsupported rollup interval: {target}")
+
+        return starts.dt.tz_convert('UTC')
+
+    def aggregate(self, bars: pd.DataFrame, target: str) -> pd.DataFrame:
+        """Barras OHLCV de `target` (groupby vetorizado por símbolo e bucket)"""
+        bars = bars.sort_values('time')
+        bucket = self.buckets(bars['time'], target).rename('time')
+
+        rolled = (
+            bars.groupby([bars['symbol'], bucket], sort=False)
+            .agg(**OHLCV_AGGREGATIONS)
+            .reset_index()
+        )
+        return rolled.sort_values(['symbol', 'time'], ignore_index=True)
+
+    def _bounds(self, df: pd.DataFrame, target: str) -> Tuple[datetime, datetime]:
+        starts = self.buckets(df['time'], target)
+        # Fim aberto do último bucket (1 dia cobre também as horas da sessão)
+        length = timedelta(days=1) if target == '1d' else timedelta(hours=1)
+        return starts.min().to_pydatetime(), (starts.max() + length).to_pydatetime()
+
+    def _load(self, df: pd.DataFrame, interval: str, target: str) -> pd.DataFrame:
+        """Barras de `interval` (da BD) dos buckets tocados por df"""
+        start, end = self._bounds(df, target)
+        with self.engine.connect() as conn:
+            bars = pd.read_sql(
+                text("""
+                    SELECT time, symbol, open, high, low, close, volume
+                    FROM stock_data
+                    WHERE symbol = ANY(:symbols)
+                    AND interval = :interval
+                    AND time >= :start AND time < :end
+                    ORDER BY symbol, time
+                """),
+                conn,
+                params={
+                    'symbols': df['symbol'].unique().tolist(),
+                    'interval': interval,
+                    'start': start,
+                    'end': end
+                }
+            )
+
+        if bars.empty:
+            return bars
+
+        # Só os buckets efetivamente tocados (o intervalo acima é global)
+        touched = pd.DataFrame({
+            'symbol': df['symbol'].to_numpy(),
+            'bucket': self.buckets(df['time'], target).array
+        }).drop_duplicates()
+        bars['bucket'] = self.buckets(bars['time'], target).array
+        return bars.merge(touched, on=['symbol', 'bucket']).drop(columns='bucket')
+
+    def _without_native(self, rolled: pd.DataFrame, target: str) -> pd.DataFrame:
+        """Retira os buckets que já têm barra do provider (prevalece sobre a agregada)"""
+        with self.engine.connect() as conn:
+            native = pd.read_sql(
+                text("""
+                    SELECT symbol, time
+                    FROM stock_data
+                    WHERE symbol = ANY(:symbols)
+                    AND interval = :interval
+                    AND source = 'native'
+                    AND time >= :start AND time <= :end
+                """),
+                conn,
+                params={
+                    'symbols': rolled['symbol'].unique().tolist(),
+                    'interval': target,
+                    'start': rolled['time'].min().to_pydatetime(),
+                    'end': rolled['time'].max().to_pydatetime()
+                }
+            )
+        if native.empty:
+            return rolled
+
+        native['time'] = pd.to_datetime(native['time'], utc=True)
+        merged = rolled.merge(native, on=['symbol', 'time'], how='left', indicator=True)
+        return merged[merged['_merge'] == 'left_only'].drop(columns='_merge')
+
+    def roll_up(self, df: pd.DataFrame, interval: str) -> Tuple[Optional[pd.DataFrame], Dict[str, int]]:
+        """
+        Recalcula e grava (source='rollup') os buckets afetados por df
+
+        Returns:
+            (barras agregadas, resultado do upsert); (None, {}) se o
+            intervalo não tiver agregação
+        """
+        target = ROLLUPS.get(interval)
+        if target is None or df is None or df.empty:
+            return None, {}
+
+        bars = self._load(df, interval, target)
+        if bars.empty:
+            return None, {}
+
+        rolled = self._without_native(self.aggregate(bars, target), target)
+        if rolled.empty:
+            return None, {}
+
+        result = self.writer.upsert_stock_data(rolled, interval=target, source='rollup')
+
+        logger.info(
+            f"Rolled up {len(bars)} {interval} bars into {len(rolled)} {target} bars "
+            f"({result['inserted']} inserted, {result['updated']} updated)"
+        )
+        return rolled, result
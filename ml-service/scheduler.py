@@ -3,8 +3,15 @@
 import schedule
 import time
 import logging
-from datetime import datetime
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
 from data_collector import StockDataCollector
+from job_runs import JobRunLog
+from schema_manager import ensure_partitions, partitioning
 
 logging.basicConfig(
     level=logging.INFO,
@@ -33,72 +40,153 @@ class DataCollectionScheduler:
             'V', 'MA', 'DIS', 'NFLX', 'INTC'
         ]
         
-    def daily_collection(self):
-        """Coleta diária - dados do dia anterior"""
-        try:
-            logger.info("Starting daily collection...")
-            result = self.collector.collect_multiple_stocks(
-                self.watchlist,
-                period="5d",  # Últimos 5 dias para garantir
-                interval="1d"
-            )
-            logger.info(f"Daily collection completed: {result}")
-        except Exception as e:
-            logger.error(f"Error in daily collection: {str(e)}")
+        # Dias re-coletados na sincronização semanal (revisões tardias)
+        self.weekly_overlap_days = int(os.getenv('WEEKLY_SYNC_OVERLAP_DAYS', '30'))
+        
+        # Jobs correm num pool (um job longo não atrasa os outros)
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('SCHEDULER_WORKERS', '3')),
+            thread_name_prefix='scheduler'
+        )
+        
+        # Atraso aleatório antes de cada execução (segundos)
+        self.jitter = float(os.getenv('SCHEDULER_JITTER_SECONDS', '30'))
+        
+        # Jobs em execução (uma execução de cada vez por job)
+        self._running = set()
+        self._running_lock = threading.Lock()
+        
+        # Histórico de execuções (duração, linhas escritas, skips)
+        self.runs = JobRunLog(self.collector.engine)
+        
+    def daily_collection(self) -> Dict:
+        """Coleta diária - barras desde a última coleta"""
+        return self.collector.collect_incremental(
+            self.watchlist,
+            interval="1d",
+            default_period="1y"  # Símbolos ainda sem dados
+        )
     
-    def hourly_collection(self):
+    def hourly_collection(self) -> Dict:
         """Coleta horária - para dados intraday"""
+        # Apenas algumas ações principais para coleta horária
+        main_stocks = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'TSLA']
+        
+        return self.collector.collect_incremental(
+            main_stocks,
+            interval="1h",
+            default_period="1d"
+        )
+    
+    def weekly_full_sync(self) -> Dict:
+        """Sincronização semanal - janela de revisão alargada"""
+        return self.collector.collect_incremental(
+            self.watchlist,
+            interval="1d",
+            default_period="1y",  # Último ano completo
+            overlap=timedelta(days=self.weekly_overlap_days)
+        )
+    
+    def partition_maintenance(self) -> Dict:
+        """Partições mensais futuras do stock_data (só com particionamento nativo)"""
+        with self.collector.engine.begin() as conn:
+            if partitioning(conn) != 'native':
+                return {'created': []}
+            return {'created': ensure_partitions(conn)}
+    
+    def submit(self, name: str, job: Callable[[], Dict], jitter: Optional[float] = None):
+        """
+        Envia um job para o pool, exceto se a execução anterior ainda correr
+        
+        Execuções sobrepostas do mesmo job são descartadas (e registadas
+        como 'skipped'), em vez de se acumularem.
+        """
+        scheduled_at = datetime.now()
+        
+        with self._running_lock:
+            if name in self._running:
+                logger.warning(f"Skipping {name}: previous run still in progress")
+                skipped = True
+            else:
+                self._running.add(name)
+                skipped = False
+        
+        if skipped:
+            self.runs.record(name, 'skipped', scheduled_at)
+            return None
+        
+        delay = random.uniform(0, self.jitter if jitter is None else jitter)
+        return self.executor.submit(self._execute, name, job, scheduled_at, delay)
+    
+    def _execute(self, name: str, job: Callable[[], Dict], scheduled_at: datetime, delay: float):
+        """Corre um job no pool, mede-o e grava a execução"""
+        result, error, status = None, None, 'success'
+        started_at = None
         try:
-            logger.info("Starting hourly collection...")
-            # Apenas algumas ações principais para coleta horária
-            main_stocks = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'TSLA']
+            # Jitter: evita que jobs à mesma hora arranquem todos juntos
+            time.sleep(delay)
             
-            result = self.collector.collect_multiple_stocks(
-                main_stocks,
-                period="1d",
-                interval="1h"
-            )
-            logger.info(f"Hourly collection completed: {result}")
+            started_at = datetime.now()
+            logger.info(f"Starting {name}...")
+            result = job()
+            logger.info(f"{name} completed: {result}")
         except Exception as e:
-            logger.error(f"Error in hourly collection: {str(e)}")
-    
-    def weekly_full_sync(self):
-        """Sincronização semanal completa"""
-        try:
-            logger.info("Starting weekly full sync...")
-            result = self.collector.collect_multiple_stocks(
-                self.watchlist,
-                period="1y",  # Último ano completo
-                interval="1d"
+            status, error = 'failed', str(e)
+            logger.error(f"Error in {name}: {str(e)}")
+        finally:
+            self.runs.record(
+                name, status, scheduled_at,
+                started_at=started_at,
+                finished_at=datetime.now(),
+                jitter=delay,
+                result=result,
+                error=error
             )
-            logger.info(f"Weekly sync completed: {result}")
-        except Exception as e:
-            logger.error(f"Error in weekly sync: {str(e)}")
+            with self._running_lock:
+                self._running.discard(name)
+        
+        return result
     
     def start(self):
         """Inicia o agendador"""
         logger.info("🎯 Starting BullEye Data Collection Scheduler...")
         
         # Agendar tarefas
-        # Coleta diária às 18:00 (após fechamento do mercado US)
-        schedule.every().day.at("18:00").do(self.daily_collection)
+        # Coleta diária verificada de hora a hora: o planner só pede a barra
+        # depois do fecho da sessão no fuso da bolsa (a hora local do
+        # container não conta); no resto do tempo nada é pedido
+        schedule.every().hour.at(":05").do(
+            self.submit, 'daily_collection', self.daily_collection
+        )
         
-        # Coleta horária durante horário de mercado (9h às 16h)
-        for hour in range(9, 17):
-            schedule.every().day.at(f"{hour:02d}:00").do(self.hourly_collection)
+        # Coleta horária: o planner só vai ao provider quando há barras
+        # novas na sessão da bolsa (fuso e feriados da própria bolsa, não
+        # a hora local do container)
+        schedule.every().hour.at(":05").do(
+            self.submit, 'hourly_collection', self.hourly_collection
+        )
         
         # Sincronização completa aos domingos às 00:00
-        schedule.every().sunday.at("00:00").do(self.weekly_full_sync)
+        schedule.every().sunday.at("00:00").do(
+            self.submit, 'weekly_full_sync', self.weekly_full_sync
+        )
+        
+        # Partições dos próximos meses (a API só as cria no arranque)
+        schedule.every().sunday.at("00:30").do(
+            self.submit, 'partition_maintenance', self.partition_maintenance
+        )
         
         # Executar primeira coleta imediatamente
         logger.info("Running initial collection...")
-        self.daily_collection()
+        self.submit('daily_collection', self.daily_collection, jitter=0)
+        self.submit('partition_maintenance', self.partition_maintenance, jitter=0)
         
-        # Loop principal
+        # Loop principal: só despacha, os jobs correm no pool
         logger.info("Scheduler started. Running tasks...")
         while True:
             schedule.run_pending()
-            time.sleep(60)  # Verificar a cada minuto
+            idle = schedule.idle_seconds()
+            time.sleep(min(max(idle or 1, 1), 60))
 
 
 # Script de teste manual
@@ -108,7 +196,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='BullEye Data Collection')
     parser.add_argument(
         '--mode',
-        choices=['scheduler', 'manual', 'test'],
+        choices=['scheduler', 'manual', 'test', 'status', 'plan'],
         default='test',
         help='Modo de execução'
     )
@@ -139,6 +227,24 @@ if __name__ == "__main__":
         )
         print(f"\n✅ Coleta concluída: {result}")
         
+    elif args.mode == 'status':
+        # Últimas execuções de cada job
+        from tabulate import tabulate
+        
+        collector = StockDataCollector()
+        summary = JobRunLog(collector.engine).summary()
+        print(tabulate(summary, headers='keys', tablefmt='grid'))
+        
+    elif args.mode == 'plan':
+        # Pedidos que a próxima coleta incremental faria (sem os executar)
+        scheduler = DataCollectionScheduler()
+        symbols = args.symbols or scheduler.watchlist
+        for interval in ('1d', '1h'):
+            groups, up_to_date = scheduler.collector.planner.plan(symbols, interval)
+            print(f"\n📅 {interval}: {len(up_to_date)} em dia, {len(groups)} pedidos")
+            for start, group in groups.items():
+                print(f"  desde {start or 'histórico completo'}: {', '.join(group)}")
+        
     elif args.mode == 'test':
         # Teste rápido
         print("🧪 Modo teste - coletando 3 ações...")
@@ -0,0 +1,391 @@
+# ml-service/schema_manager.py
+# Migrações (alembic) do stock_data: índice único, particionamento por tempo e verificação de planos
+import json
+import logging
+import os
+from datetime import date
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+
+# Chave do advisory lock: só um processo (API/scheduler/worker) migra de cada vez
+MIGRATION_LOCK_KEY = 7_246_530_118
+
+# Índices de que as queries quentes dependem: nome -> (único, colunas).
+# A verificação compara colunas e unicidade, não só o nome (o init.sql
+# original tinha um idx_stock_data_symbol_time não único)
+REQUIRED_INDEXES = {
+    'idx_stock_data_symbol_interval_time': (True, ['symbol', 'interval', 'time']),
+    'idx_stock_data_time': (False, ['time'])
+}
+
+# Formas das queries de main.py/stock_queries.py verificadas com EXPLAIN
+HOT_QUERIES = {
+    'latest_bar': """
+        SELECT time, close FROM stock_data
+        WHERE symbol = :symbol AND interval = '1d'
+        ORDER BY time DESC LIMIT 1
+    """,
+    'symbol_range': """
+        SELECT time, open, high, low, close, volume FROM stock_data
+        WHERE symbol = :symbol AND interval = '1h'
+        AND time >= NOW() - INTERVAL '90 days'
+        ORDER BY time
+    """,
+    'time_range': """
+        SELECT symbol, MAX(close) FROM stock_data
+        WHERE interval = '1d' AND time >= NOW() - INTERVAL '7 days'
+        GROUP BY symbol
+    """
+}
+
+
+def alembic_config(connection=None):
+    """Config do alembic construída em código (sem alembic.ini)"""
+    from alembic.config import Config
+
+    config = Config()
+    config.set_main_option('script_location', MIGRATIONS_DIR)
+    if connection is not None:
+        config.attributes['connection'] = connection
+    return config
+
+
+def has_timescale(conn) -> bool:
+    """TimescaleDB instalado ou disponível para instalar"""
+    return conn.execute(
+        text("SELECT 1 FROM pg_available_extensions WHERE name = 'timescaledb'")
+    ).first() is not None
+
+
+def partitioning(conn) -> Optional[str]:
+    """'hypertable', 'native' ou None (tabela simples)"""
+    installed = conn.execute(
+        text("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'")
+    ).first()
+    if installed and conn.execute(
+        text("""
+            SELECT 1 FROM timescaledb_information.hypertables
+            WHERE hypertable_name = 'stock_data'
+        """)
+    ).first():
+        return 'hypertable'
+
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass('stock_data')")
+    ).scalar()
+    return 'native' if relkind == 'p' else None
+
+
+def stock_data_indexes(conn) -> Dict[str, Dict]:
+    """{nome: {'unique', 'columns'}} dos índices do stock_data"""
+    rows = conn.execute(text("""
+        SELECT i.relname, x.indisunique,
+               array_agg(a.attname ORDER BY k.ord) AS columns
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        CROSS JOIN LATERAL unnest(CAST(x.indkey AS int2[])) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = k.attnum
+        WHERE x.indrelid = to_regclass('stock_data')
+        GROUP BY i.relname, x.indisunique
+    """))
+    return {row[0]: {'unique': row[1], 'columns': list(row[2])} for row in rows}
+
+
+def has_index(indexes: Dict[str, Dict], unique: bool, columns: List[str]) -> bool:
+    """Algum índice cobre exatamente `columns` (e é único, se pedido)"""
+    return any(
+        index['columns'] == columns and (index['unique'] or not unique)
+        for index in indexes.values()
+    )
+
+
+def remove_duplicates(conn, columns: List[str]) -> int:
+    """Apaga barras repetidas em `columns` (fica a última escrita fisicamente)"""
+    match = ' AND '.join(f"a.{column} = b.{column}" for column in columns)
+    removed = conn.execute(text(f"""
+        DELETE FROM stock_data a
+        USING stock_data b
+        WHERE {match}
+          AND a.tableoid = b.tableoid
+          AND a.ctid < b.ctid
+    """)).rowcount
+    if removed:
+        logger.warning(f"Removed {removed} duplicate stock_data rows on ({', '.join(columns)})")
+    return removed
+
+
+def decompress_chunks(conn) -> List[str]:
+    """
+    Descomprime os chunks comprimidos do stock_data (hypertable)
+
+    UPDATE/DELETE e a troca de índices únicos sobre chunks comprimidos
+    falham antes do TimescaleDB 2.11. Devolve os chunks para compress_chunks.
+    """
+    if partitioning(conn) != 'hypertable':
+        return []
+
+    chunks = conn.execute(text("""
+        SELECT format('%I.%I', chunk_schema, chunk_name)
+        FROM timescaledb_information.chunks
+        WHERE hypertable_name = 'stock_data' AND is_compressed
+    """)).scalars().all()
+    for chunk in chunks:
+        conn.execute(text("SELECT decompress_chunk(CAST(:chunk AS regclass))"), {'chunk': chunk})
+
+    if chunks:
+        logger.info(f"Decompressed {len(chunks)} stock_data chunks")
+    return chunks
+
+
+def compress_chunks(conn, chunks: List[str]):
+    """Volta a comprimir os chunks devolvidos por decompress_chunks"""
+    for chunk in chunks:
+        conn.execute(
+            text("SELECT compress_chunk(CAST(:chunk AS regclass), if_not_compressed => TRUE)"),
+            {'chunk': chunk}
+        )
+
+
+def _month(day: date, offset: int) -> date:
+    month = day.month - 1 + offset
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def ensure_partitions(conn, start: Optional[date] = None, months_ahead: Optional[int] = None) -> List[str]:
+    """
+    Cria as partições mensais em falta do stock_data (particionamento nativo)
+
+    Vai de `start` (default: mês atual) até `months_ahead` meses à frente,
+    para que inserts de barras novas nunca caiam na partição default. Barras
+    que já lá caíram (serviço parado para lá do horizonte) passam para a
+    partição nova: a default é desligada enquanto as partições são criadas.
+
+    Returns:
+        Nomes das partições criadas
+    """
+    months_ahead = months_ahead if months_ahead is not None else int(
+        os.getenv('STOCK_DATA_PARTITIONS_AHEAD', '3')
+    )
+    today = date.today().replace(day=1)
+    month = (start or today).replace(day=1)
+    last = _month(today, months_ahead)
+
+    partitions = conn.execute(
+        text("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT'
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'stock_data'::regclass
+        """)
+    ).fetchall()
+    existing = {name for name, _ in partitions}
+    default = next((name for name, is_default in partitions if is_default), None)
+
+    missing = []
+    while month <= last:
+        if f"stock_data_p{month:%Y%m}" not in existing:
+            missing.append(month)
+        month = _month(month, 1)
+    if not missing:
+        return []
+
+    # Com a default ligada, criar uma partição cujo intervalo tem linhas
+    # na default falha ("updated partition constraint ... violated")
+    if default:
+        conn.execute(text(f"ALTER TABLE stock_data DETACH PARTITION {default}"))
+
+    created = []
+    moved = 0
+    for month in missing:
+        name = f"stock_data_p{month:%Y%m}"
+        bounds = {
+            'start': f"{month.isoformat()} 00:00+00",
+            'end': f"{_month(month, 1).isoformat()} 00:00+00"
+        }
+        conn.execute(text(f"""
+            CREATE TABLE {name} PARTITION OF stock_data
+            FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')
+        """))
+        if default:
+            moved += conn.execute(text(f"""
+                WITH moved AS (
+                    DELETE FROM {default}
+                    WHERE time >= CAST(:start AS timestamptz) AND time < CAST(:end AS timestamptz)
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+            """), bounds).rowcount
+        created.append(name)
+
+    if default:
+        conn.execute(text(f"ALTER TABLE stock_data ATTACH PARTITION {default} DEFAULT"))
+
+    logger.info(
+        f"Created stock_data partitions: {', '.join(created)}"
+        f"{f' ({moved} rows moved from {default})' if moved else ''}"
+    )
+    return created
+
+
+def _plan_nodes(plan: Dict) -> List[Dict]:
+    nodes = [plan]
+    for child in plan.get('Plans', []):
+        nodes.extend(_plan_nodes(child))
+    return nodes
+
+
+def _is_stock_data(relation: Optional[str]) -> bool:
+    # Partições nativas (stock_data_p*) e chunks do TimescaleDB (_hyper_*)
+    return bool(relation) and (relation.startswith('stock_data') or relation.startswith('_hyper_'))
+
+
+class SchemaManager:
+    """
+    Aplica as migrações do ml-service e confirma que o stock_data está servido
+
+    Migrações em ml-service/migrations (alembic, config programática):
+    índices do stock_data, hypertable (TimescaleDB) ou particionamento
+    nativo mensal, tabelas auxiliares criadas até aqui de forma lazy e a
+    dimensão interval (chave symbol, interval, time).
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.min_rows = float(os.getenv('SCHEMA_VERIFY_MIN_ROWS', '10000'))
+        self.last_report: Optional[Dict] = None
+
+    def upgrade(self, revision: str = 'head'):
+        """Aplica as migrações pendentes (uma transação, sob advisory lock)"""
+        from alembic import command
+
+        with self.engine.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+            command.upgrade(alembic_config(conn), revision)
+
+    def current_revision(self) -> Optional[str]:
+        from alembic.runtime.migration import MigrationContext
+
+        with self.engine.connect() as conn:
+            return MigrationContext.configure(conn).get_current_revision()
+
+    def _estimated_rows(self, conn) -> float:
+        # reltuples do pai é 0 em tabelas particionadas: somar as filhas
+        return float(conn.execute(
+            text("""
+                SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)
+                FROM pg_class c
+                WHERE c.oid = to_regclass('stock_data')
+                   OR c.oid IN (
+                       SELECT inhrelid FROM pg_inherits
+                       WHERE inhparent = to_regclass('stock_data')
+                   )
+            """)
+        ).scalar())
+
+    def _explain(self, conn, query: str, params: Dict) -> Dict:
+        plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}"), params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        nodes = _plan_nodes(plan[0]['Plan'])
+
+        scans = [n for n in nodes if _is_stock_data(n.get('Relation Name'))]
+        return {
+            'seq_scans': sorted({n['Relation Name'] for n in scans if n['Node Type'] == 'Seq Scan'}),
+            'indexes': sorted({n['Index Name'] for n in scans if n.get('Index Name')}),
+            'relations_scanned': len({n['Relation Name'] for n in scans}),
+            'total_cost': plan[0]['Plan']['Total Cost']
+        }
+
+    def verify(self) -> Dict:
+        """
+        Índices, particionamento e planos das queries quentes
+
+        Seq scans só são assinalados acima de SCHEMA_VERIFY_MIN_ROWS linhas
+        estimadas: em tabelas pequenas o planner prefere-os legitimamente.
+        """
+        with self.engine.connect() as conn:
+            indexes = stock_data_indexes(conn)
+            rows = self._estimated_rows(conn)
+            symbol = conn.execute(text("SELECT symbol FROM stock_symbols LIMIT 1")).scalar() or 'AAPL'
+
+            plans = {}
+            for name, query in HOT_QUERIES.items():
+                plan = self._explain(conn, query, {'symbol': symbol})
+                plan['ok'] = not plan['seq_scans'] or rows < self.min_rows
+                plans[name] = plan
+
+            report = {
+                'revision': self.current_revision(),
+                'partitioning': partitioning(conn),
+                'estimated_rows': int(rows),
+                # Em falta, não únicos ou com outras colunas
+                'missing_indexes': sorted(
+                    name for name, (unique, columns) in REQUIRED_INDEXES.items()
+                    if not has_index(indexes, unique, columns)
+                ),
+                'plans': plans
+            }
+
+        report['ok'] = not report['missing_indexes'] and all(p['ok'] for p in plans.values())
+        self.last_report = report
+        return report
+
+    def startup(self) -> Dict:
+        """Migra (SCHEMA_AUTO_MIGRATE), garante partições futuras e verifica planos"""
+        if os.getenv('SCHEMA_AUTO_MIGRATE', 'true').lower() == 'true':
+            try:
+                self.upgrade()
+            except Exception as e:
+                logger.error(f"Schema migration failed: {str(e)}")
+
+        try:
+            with self.engine.begin() as conn:
+                if partitioning(conn) == 'native':
+                    ensure_partitions(conn)
+
+            report = self.verify()
+        except Exception as e:
+            logger.error(f"Schema verification failed: {str(e)}")
+            self.last_report = {'ok': False, 'error': str(e)}
+            return self.last_report
+
+        if report['missing_indexes']:
+            logger.warning(f"stock_data is missing (or has non-unique/mismatched) indexes: {report['missing_indexes']}")
+        for name, plan in report['plans'].items():
+            if not plan['ok']:
+                logger.warning(
+                    f"Query '{name}' scans stock_data sequentially "
+                    f"({', '.join(plan['seq_scans'])}); check indexes/partitioning"
+                )
+        logger.info(
+            f"Schema {report['revision']} ({report['partitioning'] or 'plain table'}, "
+            f"~{report['estimated_rows']:,} rows): {'ok' if report['ok'] else 'NOT OK'}"
+        )
+        return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import get_engine
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Migrações e verificação do schema do ml-service")
+    parser.add_argument('command', choices=['upgrade', 'verify', 'current'])
+    parser.add_argument('--revision', default='head')
+    args = parser.parse_args()
+
+    manager = SchemaManager(get_engine())
+    if args.command == 'upgrade':
+        manager.upgrade(args.revision)
+        print(f"✅ Schema em {manager.current_revision()}")
+    elif args.command == 'current':
+        print(manager.current_revision())
+    elif args.command == 'verify':
+        print(json.dumps(manager.verify(), indent=2, default=str))
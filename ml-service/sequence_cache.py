@@ -0,0 +1,167 @@
+# ml-service/sequence_cache.py
+# Janelas OHLCV recentes em memória (float32) para inferência sem ir ao Postgres
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Ordem das colunas em cada janela
+FEATURE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+
+
+class SequenceCache:
+    """
+    Cache das últimas `length` barras de cada símbolo
+
+    Cada entrada é um array (length, len(FEATURE_COLUMNS)) em ordem
+    cronológica. As entradas são recarregadas quando o collector escreve
+    barras novas (hook refresh) ou quando passam de `ttl` segundos, o que
+    cobre escritas feitas noutros processos (scheduler).
+    """
+
+    def __init__(self, engine, length: Optional[int] = None, ttl: Optional[float] = None):
+        self.engine = engine
+        self.length = length or int(os.getenv('PREDICT_SEQUENCE_CACHE_LENGTH', '120'))
+        self.ttl = ttl if ttl is not None else float(os.getenv('PREDICT_SEQUENCE_TTL', '300'))
+        self._entries: Dict[str, Tuple[float, np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+
+    def _query(self, symbols: List[str], length: int) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """Últimas `length` barras de vários símbolos numa só query (LATERAL)"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text(f"""
+                    SELECT t.symbol, d.time, {', '.join('d.' + c for c in FEATURE_COLUMNS)}
+                    FROM unnest(CAST(:symbols AS text[])) AS t(symbol)
+                    CROSS JOIN LATERAL (
+                        SELECT time, {', '.join(FEATURE_COLUMNS)}
+                        FROM stock_data s
+                        WHERE s.symbol = t.symbol
+                        AND s.interval = '1d'
+                        ORDER BY s.time DESC
+                        LIMIT :length
+                    ) d
+                    ORDER BY t.symbol, d.time
+                """),
+                {'symbols': list(symbols), 'length': length}
+            ).fetchall()
+
+        grouped: Dict[str, list] = {}
+        for row in rows:
+            grouped.setdefault(row[0], []).append(row[1:])
+
+        result = {}
+        for symbol, bars in grouped.items():
+            times = np.array([bar[0] for bar in bars], dtype=object)
+            values = np.array([bar[1:] for bar in bars], dtype=np.float32)
+            result[symbol] = (times, values)
+        return result
+
+    def load(self, symbols: List[str], length: Optional[int] = None) -> int:
+        """Carrega/recarrega os símbolos indicados; devolve quantos têm dados"""
+        if not symbols:
+            return 0
+
+        length = max(length or 0, self.length)
+        loaded = self._query(symbols, length)
+        now = time.monotonic()
+
+        with self._lock:
+            for symbol, (times, values) in loaded.items():
+                self._entries[symbol] = (now, times, values)
+            self.loads += len(loaded)
+        return len(loaded)
+
+    def watchlist_symbols(self) -> List[str]:
+        """Símbolos em alguma watchlist de utilizador"""
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text("SELECT DISTINCT symbol FROM user_watchlist ORDER BY symbol")
+            ).scalars().all()
+
+    def preload(self, symbols: Optional[List[str]] = None, chunk_size: int = 100) -> int:
+        """Pré-carrega a watchlist (mais `symbols`) em blocos"""
+        try:
+            targets = sorted(set(self.watchlist_symbols()) | set(symbols or []))
+            total = 0
+            for i in range(0, len(targets), chunk_size):
+                total += self.load(targets[i:i + chunk_size])
+            logger.info(f"Sequence cache preloaded {total}/{len(targets)} symbols")
+            return total
+        except Exception as e:
+            logger.error(f"Error preloading sequence cache: {str(e)}")
+            return 0
+
+    def refresh(self, symbols: List[str], interval: str = "1d"):
+        """Hook pós-coleta: recarrega os símbolos já em cache que mudaram"""
+        if interval != "1d":
+            return
+
+        with self._lock:
+            cached = [symbol for symbol in symbols if symbol in self._entries]
+        self.load(cached)
+
+    def _stale(self, entry, length: int, now: float) -> bool:
+        return entry is None or now - entry[0] > self.ttl or len(entry[2]) < length
+
+    def missing(self, symbols: List[str], length: int) -> List[str]:
+        """Símbolos sem entrada válida para `length` (em falta, expirada ou curta)"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                symbol for symbol in dict.fromkeys(symbols)
+                if self._stale(self._entries.get(symbol), length, now)
+            ]
+
+    def get(self, symbol: str, length: int, reload: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Últimas `length` barras de um símbolo (times, values)
+
+        Args:
+            reload: Ir à BD se a entrada não servir; False quando o lote já
+                    foi carregado com load() (um símbolo sem dados não
+                    repete a query)
+
+        Raises:
+            LookupError: Sem barras suficientes para a janela pedida
+        """
+        with self._lock:
+            entry = self._entries.get(symbol)
+
+        if self._stale(entry, length, time.monotonic()):
+            if reload:
+                self.load([symbol], length)
+                with self._lock:
+                    entry = self._entries.get(symbol)
+        else:
+            with self._lock:
+                self.hits += 1
+
+        if entry is None or len(entry[2]) < length:
+            available = 0 if entry is None else len(entry[2])
+            raise LookupError(
+                f"Not enough data for {symbol}: {available} bars, {length} required"
+            )
+
+        _, times, values = entry
+        return times[-length:], values[-length:]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'symbols': len(self._entries),
+                'length': self.length,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'loads': self.loads,
+                'bytes': int(sum(entry[2].nbytes for entry in self._entries.values()))
+            }
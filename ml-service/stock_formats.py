@@ -0,0 +1,148 @@
+# ml-service/stock_formats.py
+# Serialização de barras OHLCV: NDJSON, JSON colunar, Arrow IPC e Parquet
+import io
+import json
+from typing import Dict, Iterable, Iterator, List
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - dependência opcional
+    pa = None
+    pq = None
+
+FIELDS = ['time', 'open', 'high', 'low', 'close', 'volume']
+
+MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+def _columns(batch: List[tuple]) -> Dict[str, list]:
+    """Converte um lote de tuplos em listas por coluna"""
+    times, opens, highs, lows, closes, volumes = zip(*batch)
+    return {
+        'time': list(times),
+        'open': [float(v) for v in opens],
+        'high': [float(v) for v in highs],
+        'low': [float(v) for v in lows],
+        'close': [float(v) for v in closes],
+        'volume': [int(v) for v in volumes]
+    }
+
+
+def ndjson_stream(symbol: str, batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """Uma linha JSON por barra, emitida lote a lote"""
+    for batch in batches:
+        lines = [
+            json.dumps({
+                'time': row[0].isoformat(),
+                'symbol': symbol,
+                'open': float(row[1]),
+                'high': float(row[2]),
+                'low': float(row[3]),
+                'close': float(row[4]),
+                'volume': int(row[5])
+            })
+            for row in batch
+        ]
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+def columnar(symbol: str, batches: Iterable[List[tuple]]) -> Dict:
+    """JSON compacto com um array por campo"""
+    columns = {field: [] for field in FIELDS}
+    for batch in batches:
+        for field, values in _columns(batch).items():
+            columns[field].extend(values)
+
+    columns['time'] = [t.isoformat() for t in columns['time']]
+    return {
+        'symbol': symbol,
+        'count': len(columns['time']),
+        'columns': columns
+    }
+
+
+def _record_batch(batch: List[tuple]):
+    columns = _columns(batch)
+    return pa.record_batch(
+        [
+            pa.array(columns['time'], type=pa.timestamp('us', tz='UTC')),
+            pa.array(columns['open'], type=pa.float64()),
+            pa.array(columns['high'], type=pa.float64()),
+            pa.array(columns['low'], type=pa.float64()),
+            pa.array(columns['close'], type=pa.float64()),
+            pa.array(columns['volume'], type=pa.int64())
+        ],
+        names=FIELDS
+    )
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Destino de escrita que acumula bytes até serem drenados
+
+    Mantém a posição absoluta em tell() (o Parquet usa-a para os offsets
+    do footer) mesmo depois de os bytes já terem sido enviados.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def arrow_stream(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """Arrow IPC (streaming format), um record batch por lote"""
+    sink = _ChunkSink()
+    writer = None
+    for batch in batches:
+        record_batch = _record_batch(batch)
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, record_batch.schema)
+        writer.write_batch(record_batch)
+        yield sink.drain()
+
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+def parquet_stream(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    """Parquet com um row group por lote (o footer sai no fim)"""
+    sink = _ChunkSink()
+    writer = None
+    for batch in batches:
+        table = pa.Table.from_batches([_record_batch(batch)])
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema, compression='snappy')
+        writer.write_table(table)
+        yield sink.drain()
+
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
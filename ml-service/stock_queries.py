@@ -0,0 +1,420 @@
+# ml-service/stock_queries.py
+# Camada de acesso a dados (síncrona) usada pelos endpoints de leitura
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import text
+
+from database import get_engine
+from market_calendar import interval_length
+from rolling_stats import get_rolling_stats
+
+
+def check_connection():
+    """Testa a conexão com o banco"""
+    with get_engine().connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+def list_stocks() -> List[Dict]:
+    """Todas as ações registadas em stock_symbols"""
+    with get_engine().connect() as conn:
+        result = conn.execute(text("""
+            SELECT symbol, name, exchange, sector, created_at
+            FROM stock_symbols
+            ORDER BY symbol
+        """))
+
+        return [
+            {
+                'symbol': row[0],
+                'name': row[1],
+                'exchange': row[2],
+                'sector': row[3],
+                'created_at': row[4].isoformat() if row[4] else None
+            }
+            for row in result
+        ]
+
+
+def get_stock_data(
+    symbol: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: int = 100,
+    interval: str = '1d'
+) -> List[Dict]:
+    """
+    Dados históricos de uma ação em ordem cronológica
+
+    Devolve as `limit` barras mais recentes de `interval` dentro do intervalo
+    de datas.
+    """
+    query_str = """
+        SELECT time, symbol, open, high, low, close, volume
+        FROM stock_data
+        WHERE symbol = :symbol
+        AND interval = :interval
+    """
+
+    params = {'symbol': symbol, 'interval': interval}
+
+    if start_date:
+        query_str += " AND time >= :start_date"
+        params['start_date'] = start_date
+
+    if end_date:
+        query_str += " AND time <= :end_date"
+        params['end_date'] = end_date
+
+    query_str += " ORDER BY time DESC LIMIT :limit"
+    params['limit'] = limit
+
+    with get_engine().connect() as conn:
+        result = conn.execute(text(query_str), params)
+
+        data = [
+            {
+                'time': row[0].isoformat(),
+                'symbol': row[1],
+                'open': float(row[2]),
+                'high': float(row[3]),
+                'low': float(row[4]),
+                'close': float(row[5]),
+                'volume': int(row[6])
+            }
+            for row in result
+        ]
+
+    data.reverse()  # Ordem cronológica
+    return data
+
+
+def iter_stock_data_batches(
+    symbol: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: int = 100,
+    batch_size: int = 5000,
+    interval: str = '1d'
+) -> Iterator[List[tuple]]:
+    """
+    Itera as barras em ordem cronológica, em lotes, com cursor no servidor
+
+    Cada lote é uma lista de tuplos (time, open, high, low, close, volume).
+    A memória usada é proporcional a `batch_size`, não ao intervalo pedido.
+    """
+    query_str = """
+        SELECT time, open, high, low, close, volume
+        FROM stock_data
+        WHERE symbol = :symbol
+        AND interval = :interval
+    """
+
+    params = {'symbol': symbol, 'interval': interval, 'limit': limit}
+
+    if start_date:
+        query_str += " AND time >= :start_date"
+        params['start_date'] = start_date
+
+    if end_date:
+        query_str += " AND time <= :end_date"
+        params['end_date'] = end_date
+
+    # As `limit` barras mais recentes, devolvidas em ordem cronológica
+    query_str = f"""
+        SELECT * FROM (
+            {query_str}
+            ORDER BY time DESC
+            LIMIT :limit
+        ) recent
+        ORDER BY time
+    """
+
+    with get_engine().connect() as conn:
+        result = conn.execution_options(
+            stream_results=True,
+            yield_per=batch_size
+        ).execute(text(query_str), params)
+
+        for partition in result.partitions():
+            yield [tuple(row) for row in partition]
+
+
+def get_latest_price(symbol: str, interval: str = '1d') -> Optional[Dict]:
+    """Última barra disponível de uma ação no intervalo pedido"""
+    with get_engine().connect() as conn:
+        result = conn.execute(
+            text("""
+                SELECT time, open, high, low, close, volume
+                FROM stock_data
+                WHERE symbol = :symbol
+                AND interval = :interval
+                ORDER BY time DESC
+                LIMIT 1
+            """),
+            {'symbol': symbol, 'interval': interval}
+        ).fetchone()
+
+    if not result:
+        return None
+
+    return {
+        'symbol': symbol,
+        'interval': interval,
+        'time': result[0].isoformat(),
+        'open': float(result[1]),
+        'high': float(result[2]),
+        'low': float(result[3]),
+        'close': float(result[4]),
+        'volume': int(result[5])
+    }
+
+
+def get_intervals(symbol: str) -> List[Dict]:
+    """Intervalos com barras de uma ação (contagem, extremos e origem)"""
+    with get_engine().connect() as conn:
+        rows = conn.execute(
+            text("""
+                SELECT interval,
+                       COUNT(*) AS bars,
+                       MIN(time) AS first_time,
+                       MAX(time) AS last_time,
+                       COUNT(*) FILTER (WHERE source = 'rollup') AS rollup_bars
+                FROM stock_data
+                WHERE symbol = :symbol
+                GROUP BY interval
+            """),
+            {'symbol': symbol}
+        ).mappings().all()
+
+    return [
+        {
+            'interval': row['interval'],
+            'bars': row['bars'],
+            'rollup_bars': row['rollup_bars'],
+            'first_time': row['first_time'].isoformat(),
+            'last_time': row['last_time'].isoformat()
+        }
+        # Do mais fino para o mais largo (1m, 1h, 1d...)
+        for row in sorted(
+            rows, key=lambda row: interval_length(row['interval']) or timedelta(days=1)
+        )
+    ]
+
+
+def get_stock_statistics(symbol: str, days: int = 30) -> Optional[Dict]:
+    """
+    Estatísticas dos últimos `days` dias (None se não houver dados)
+
+    Para as janelas mantidas em rolling_stats (7/30/90/365) é um lookup por
+    chave primária; outros valores de `days` fazem o agregado sobre stock_data.
+    """
+    rolling = get_rolling_stats(get_engine(), symbol, days)
+    if rolling:
+        return rolling
+
+    start_date = datetime.now() - timedelta(days=days)
+
+    with get_engine().connect() as conn:
+        result = conn.execute(
+            text("""
+                SELECT
+                    COUNT(*) as count,
+                    AVG(close) as avg_price,
+                    MIN(low) as min_price,
+                    MAX(high) as max_price,
+                    AVG(volume) as avg_volume,
+                    STDDEV(close) as volatility
+                FROM stock_data
+                WHERE symbol = :symbol
+                AND interval = '1d'
+                AND time >= :start_date
+            """),
+            {'symbol': symbol, 'start_date': start_date}
+        ).fetchone()
+
+    if not result or result[0] == 0:
+        return None
+
+    return {
+        'symbol': symbol,
+        'period_days': days,
+        'data_points': result[0],
+        'average_price': float(result[1]) if result[1] else None,
+        'min_price': float(result[2]) if result[2] else None,
+        'max_price': float(result[3]) if result[3] else None,
+        'average_volume': int(result[4]) if result[4] else None,
+        'volatility': float(result[5]) if result[5] else None
+    }
+
+
+# Colunas aceites para ordenação no resumo em batch
+SUMMARY_SORT_COLUMNS = {
+    'change_percent': 'change_percent',
+    'change': 'change',
+    'volume': 'volume',
+    'close': 'close',
+    'volatility': 'volatility',
+    'symbol': 'symbol'
+}
+
+
+def _float(value) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+def get_market_summary(
+    symbols: Optional[List[str]] = None,
+    days: int = 30,
+    sort_by: str = 'symbol',
+    descending: bool = False,
+    top: Optional[int] = None
+) -> List[Dict]:
+    """
+    Último preço, variação e estatísticas de N dias para vários símbolos
+
+    Tudo numa única query: a última barra e a anterior de cada símbolo vêm
+    de subqueries LATERAL (usam o índice symbol, time) e as estatísticas de
+    um GROUP BY sobre a janela de `days` dias.
+
+    Args:
+        symbols: Lista de símbolos (None = todos os de stock_symbols)
+        days: Janela das estatísticas
+        sort_by: Coluna de ordenação (ver SUMMARY_SORT_COLUMNS)
+        descending: Ordem decrescente
+        top: Devolver só os primeiros N
+    """
+    if sort_by not in SUMMARY_SORT_COLUMNS:
+        raise ValueError(f"Unsupported sort column: {sort_by}")
+
+    params = {'start_date': datetime.now() - timedelta(days=days)}
+
+    if symbols is None:
+        targets = "SELECT symbol FROM stock_symbols"
+        stats_filter = ""
+    else:
+        targets = "SELECT unnest(CAST(:symbols AS text[])) AS symbol"
+        stats_filter = "AND symbol = ANY(:symbols)"
+        params['symbols'] = list(symbols)
+
+    query_str = f"""
+        WITH targets AS (
+            {targets}
+        ),
+        stats AS (
+            SELECT
+                symbol,
+                COUNT(*) AS data_points,
+                AVG(close) AS avg_price,
+                MIN(low) AS min_price,
+                MAX(high) AS max_price,
+                AVG(volume) AS avg_volume,
+                STDDEV(close) AS volatility
+            FROM stock_data
+            WHERE interval = '1d'
+            AND time >= :start_date
+            {stats_filter}
+            GROUP BY symbol
+        ),
+        summary AS (
+            SELECT
+                t.symbol,
+                l.time, l.open, l.high, l.low, l.close, l.volume,
+                p.close AS prev_close,
+                l.close - p.close AS change,
+                (l.close - p.close) / NULLIF(p.close, 0) * 100 AS change_percent,
+                s.data_points, s.avg_price, s.min_price, s.max_price,
+                s.avg_volume, s.volatility
+            FROM targets t
+            CROSS JOIN LATERAL (
+                SELECT time, open, high, low, close, volume
+                FROM stock_data d
+                WHERE d.symbol = t.symbol
+                AND d.interval = '1d'
+                ORDER BY d.time DESC
+                LIMIT 1
+            ) l
+            LEFT JOIN LATERAL (
+                SELECT close
+                FROM stock_data d
+                WHERE d.symbol = t.symbol
+                AND d.interval = '1d'
+                AND d.time < l.time
+                ORDER BY d.time DESC
+                LIMIT 1
+            ) p ON TRUE
+            LEFT JOIN stats s ON s.symbol = t.symbol
+        )
+        SELECT * FROM summary
+        ORDER BY {SUMMARY_SORT_COLUMNS[sort_by]} {'DESC' if descending else 'ASC'} NULLS LAST
+    """
+
+    if top:
+        query_str += " LIMIT :top"
+        params['top'] = top
+
+    with get_engine().connect() as conn:
+        rows = conn.execute(text(query_str), params).mappings().all()
+
+    return [
+        {
+            'symbol': row['symbol'],
+            'time': row['time'].isoformat(),
+            'open': float(row['open']),
+            'high': float(row['high']),
+            'low': float(row['low']),
+            'close': float(row['close']),
+            'volume': int(row['volume']),
+            'prev_close': _float(row['prev_close']),
+            'change': _float(row['change']),
+            'change_percent': _float(row['change_percent']),
+            'stats': {
+                'period_days': days,
+                'data_points': row['data_points'] or 0,
+                'average_price': _float(row['avg_price']),
+                'min_price': _float(row['min_price']),
+                'max_price': _float(row['max_price']),
+                'average_volume': int(row['avg_volume']) if row['avg_volume'] else None,
+                'volatility': _float(row['volatility'])
+            }
+        }
+        for row in rows
+    ]
+
+
+def get_model_performance(symbol: str, limit: int = 10) -> List[Dict]:
+    """Avaliações mais recentes dos modelos de um símbolo (model_performance)"""
+    with get_engine().connect() as conn:
+        rows = conn.execute(
+            text("""
+                SELECT model_name, model_version, evaluation_date, mse, rmse,
+                       mae, mape, r2_score, directional_accuracy,
+                       total_predictions, training_samples,
+                       training_time_seconds, created_at
+                FROM model_performance
+                WHERE symbol = :symbol
+                ORDER BY evaluation_date DESC, created_at DESC
+                LIMIT :limit
+            """),
+            {'symbol': symbol, 'limit': limit}
+        ).mappings().all()
+
+    return [
+        {
+            'model_name': row['model_name'],
+            'model_version': row['model_version'],
+            'evaluation_date': row['evaluation_date'].isoformat(),
+            'mse': _float(row['mse']),
+            'rmse': _float(row['rmse']),
+            'mae': _float(row['mae']),
+            'mape': _float(row['mape']),
+            'r2_score': _float(row['r2_score']),
+            'directional_accuracy': _float(row['directional_accuracy']),
+            'total_predictions': row['total_predictions'],
+            'training_samples': row['training_samples'],
+            'training_time_seconds': row['training_time_seconds'],
+            'created_at': row['created_at'].isoformat() if row['created_at'] else None
+        }
+        for row in rows
+    ]
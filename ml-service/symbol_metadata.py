@@ -0,0 +1,146 @@
+# ml-service/symbol_metadata.py
+# Metadados dos símbolos (stock_symbols) com TTL longo e escrita em lote só do que mudou
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+METADATA_FIELDS = ['name', 'exchange', 'currency', 'sector', 'industry', 'market_cap']
+
+
+class SymbolMetadataCache:
+    """
+    Decide que símbolos precisam de novo ticker.info e grava-os em lote
+
+    stock_symbols.last_updated marca a última confirmação dos metadados;
+    símbolos confirmados há menos de SYMBOL_METADATA_TTL_DAYS não voltam
+    ao provider. As datas ficam em memória, pelo que a BD só é lida para
+    símbolos ainda não vistos pelo processo.
+    """
+
+    def __init__(self, engine, ttl: Optional[timedelta] = None):
+        self.engine = engine
+        self.ttl = ttl or timedelta(days=float(os.getenv('SYMBOL_METADATA_TTL_DAYS', '7')))
+        self._refreshed: Dict[str, Optional[datetime]] = {}
+        self._lock = threading.Lock()
+        self.skipped = 0
+        self.refreshed = 0
+
+    def _load(self, symbols: List[str]):
+        with self._lock:
+            missing = [s for s in symbols if s not in self._refreshed]
+        if not missing:
+            return
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("""
+                    SELECT symbol, last_updated
+                    FROM stock_symbols
+                    WHERE symbol = ANY(:symbols)
+                """),
+                {'symbols': missing}
+            )
+            found = {row[0]: row[1] for row in rows}
+
+        with self._lock:
+            for symbol in missing:
+                self._refreshed.setdefault(symbol, found.get(symbol))
+
+    def stale(self, symbols: List[str], now: Optional[datetime] = None) -> List[str]:
+        """Símbolos sem metadados ou com metadados mais antigos que o TTL"""
+        now = now or datetime.now(timezone.utc)
+        try:
+            self._load(symbols)
+        except Exception as e:
+            # Sem BD não há como saber: tratar todos como desatualizados
+            logger.error(f"Error loading symbol metadata ages: {str(e)}")
+            return list(symbols)
+
+        with self._lock:
+            stale = [
+                s for s in symbols
+                if self._refreshed.get(s) is None or now - self._refreshed[s] >= self.ttl
+            ]
+            self.skipped += len(symbols) - len(stale)
+        return stale
+
+    def save_many(self, infos: List[Dict]) -> Dict[str, int]:
+        """
+        Upsert de todos os metadados num único INSERT ... ON CONFLICT
+
+        Linhas existentes só são reescritas quando algum campo mudou ou
+        quando a confirmação anterior já expirou (avança last_updated).
+
+        Returns:
+            Dicionário com linhas written e unchanged
+        """
+        infos = list({info['symbol']: info for info in infos}.values())
+        if not infos:
+            return {'written': 0, 'unchanged': 0}
+
+        columns = {field: [info.get(field) for info in infos] for field in METADATA_FIELDS}
+        target = ', '.join(f"s.{field}" for field in METADATA_FIELDS)
+        excluded = ', '.join(f"EXCLUDED.{field}" for field in METADATA_FIELDS)
+
+        with self.engine.begin() as conn:
+            written = conn.execute(
+                text(f"""
+                    INSERT INTO stock_symbols AS s (
+                        symbol, {', '.join(METADATA_FIELDS)}, last_updated
+                    )
+                    SELECT u.symbol, u.name, u.exchange, u.currency, u.sector,
+                           u.industry, u.market_cap, NOW()
+                    FROM unnest(
+                        CAST(:symbols AS TEXT[]),
+                        CAST(:name AS TEXT[]),
+                        CAST(:exchange AS TEXT[]),
+                        CAST(:currency AS TEXT[]),
+                        CAST(:sector AS TEXT[]),
+                        CAST(:industry AS TEXT[]),
+                        CAST(:market_cap AS BIGINT[])
+                    ) AS u(symbol, name, exchange, currency, sector, industry, market_cap)
+                    ON CONFLICT (symbol) DO UPDATE SET
+                        {', '.join(f"{field} = EXCLUDED.{field}" for field in METADATA_FIELDS)},
+                        last_updated = NOW()
+                    WHERE ({target}) IS DISTINCT FROM ({excluded})
+                       OR s.last_updated < NOW() - CAST(:ttl AS INTERVAL)
+                    RETURNING s.symbol
+                """),
+                {
+                    'symbols': [info['symbol'] for info in infos],
+                    **columns,
+                    'ttl': f"{self.ttl.total_seconds()} seconds"
+                }
+            ).rowcount
+
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            for info in infos:
+                self._refreshed[info['symbol']] = now
+            self.refreshed += len(infos)
+
+        logger.info(
+            f"Saved metadata for {len(infos)} symbols "
+            f"({written} written, {len(infos) - written} unchanged)"
+        )
+        return {'written': written, 'unchanged': len(infos) - written}
+
+    def invalidate(self, symbol: str):
+        """Força novo ticker.info na próxima coleta do símbolo"""
+        with self._lock:
+            self._refreshed[symbol] = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'ttl_days': self.ttl.total_seconds() / 86400,
+                'known_symbols': len(self._refreshed),
+                'skipped_fetches': self.skipped,
+                'refreshed': self.refreshed
+            }
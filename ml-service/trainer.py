@@ -0,0 +1,243 @@
+# ml-service/trainer.py
+# Treino do modelo LSTM de um símbolo (corre nos processos do training worker)
+import json
+import logging
+import os
+import time
+from datetime import date, datetime
+from typing import Callable, Dict, Optional
+
+import numpy as np
+from sqlalchemy import text
+
+from database import get_engine
+from dataset import TARGET, DatasetStore, MinMaxScaler, WindowDataset
+from model_registry import models_dir
+from sequence_cache import FEATURE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'lstm'
+
+
+class TrainingCancelled(Exception):
+    """Treino interrompido a pedido (DELETE /api/train/{job_id})"""
+
+
+def build_model(sequence_length: int, n_features: int):
+    import tensorflow as tf
+
+    model = tf.keras.Sequential([
+        tf.keras.layers.Input(shape=(sequence_length, n_features)),
+        tf.keras.layers.LSTM(64, return_sequences=True),
+        tf.keras.layers.Dropout(0.2),
+        tf.keras.layers.LSTM(32),
+        tf.keras.layers.Dense(1)
+    ])
+    model.compile(optimizer='adam', loss='mse')
+    return model
+
+
+def evaluate(y_true: np.ndarray, y_pred: np.ndarray, reference: np.ndarray) -> Dict:
+    """Métricas na escala de preço (reference = último fecho de cada janela)"""
+    error = y_pred - y_true
+    mse = float(np.mean(error ** 2))
+    total = float(np.sum((y_true - y_true.mean()) ** 2))
+
+    return {
+        'mse': mse,
+        'rmse': float(np.sqrt(mse)),
+        'mae': float(np.mean(np.abs(error))),
+        'mape': float(np.mean(np.abs(error / np.where(y_true == 0, np.nan, y_true))) * 100),
+        'r2_score': 1.0 - float(np.sum(error ** 2)) / total if total else None,
+        'directional_accuracy': float(np.mean(
+            np.sign(y_pred - reference) == np.sign(y_true - reference)
+        ))
+    }
+
+
+def _save(symbol: str, model, metadata: Dict, directory: str):
+    """
+    Grava modelo e metadados sem expor ficheiros incompletos
+
+    Os metadados são trocados antes do modelo: a registry recarrega quando
+    o mtime de model.keras muda e lê nesse momento os metadados novos.
+    """
+    path = os.path.join(directory, symbol)
+    os.makedirs(path, exist_ok=True)
+
+    metadata_tmp = os.path.join(path, 'metadata.json.tmp')
+    with open(metadata_tmp, 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    model_tmp = os.path.join(path, 'model.tmp.keras')
+    model.save(model_tmp)
+
+    os.replace(metadata_tmp, os.path.join(path, 'metadata.json'))
+    os.replace(model_tmp, os.path.join(path, 'model.keras'))
+
+
+def _record_performance(symbol: str, version: str, metrics: Dict, samples: int,
+                        evaluated: int, seconds: float, engine=None):
+    with (engine or get_engine()).begin() as conn:
+        conn.execute(
+            text("""
+                INSERT INTO model_performance (
+                    model_name, model_version, evaluation_date, symbol,
+                    mse, rmse, mae, mape, r2_score, directional_accuracy,
+                    total_predictions, training_samples, training_time_seconds
+                )
+                VALUES (
+                    :model_name, :model_version, :evaluation_date, :symbol,
+                    :mse, :rmse, :mae, :mape, :r2_score, :directional_accuracy,
+                    :total_predictions, :training_samples, :training_time_seconds
+                )
+                ON CONFLICT (model_name, model_version, evaluation_date, symbol)
+                DO UPDATE SET
+                    mse = EXCLUDED.mse,
+                    rmse = EXCLUDED.rmse,
+                    mae = EXCLUDED.mae,
+                    mape = EXCLUDED.mape,
+                    r2_score = EXCLUDED.r2_score,
+                    directional_accuracy = EXCLUDED.directional_accuracy,
+                    total_predictions = EXCLUDED.total_predictions,
+                    training_samples = EXCLUDED.training_samples,
+                    training_time_seconds = EXCLUDED.training_time_seconds
+            """),
+            {
+                'model_name': MODEL_NAME,
+                'model_version': version,
+                'evaluation_date': date.today(),
+                'symbol': symbol,
+                **metrics,
+                'total_predictions': evaluated,
+                'training_samples': samples,
+                'training_time_seconds': int(seconds)
+            }
+        )
+
+
+def train_model(
+    symbol: str,
+    sequence_length: int = 60,
+    prediction_horizon: int = 1,
+    epochs: int = 100,
+    validation_split: float = 0.2,
+    progress: Optional[Callable[[Dict], None]] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    directory: Optional[str] = None,
+    engine=None
+) -> Dict:
+    """
+    Treina e grava o modelo de um símbolo
+
+    Args:
+        progress: Chamado no fim de cada época com epoch/loss/val_loss
+        should_stop: Consultado no fim de cada época; True cancela o treino
+
+    Returns:
+        Versão, métricas de validação e tamanhos do treino
+
+    Raises:
+        TrainingCancelled: should_stop devolveu True
+    """
+    import tensorflow as tf
+
+    start = time.perf_counter()
+
+    # Export incremental para o memmap do símbolo (só barras novas vão à BD)
+    store = DatasetStore(engine=engine)
+    store.export(symbol)
+    values = store.open(symbol)
+
+    # Split cronológico; o scaler só vê a parte de treino
+    split = int(len(values) * (1.0 - validation_split))
+    if split <= sequence_length + prediction_horizon:
+        raise ValueError(f"Not enough data to train {symbol}: {len(values)} bars")
+    scaler = MinMaxScaler.fit(values[:split])
+
+    data = WindowDataset(values, sequence_length, prediction_horizon, scaler)
+    train_count = split - sequence_length - prediction_horizon + 1
+    if train_count >= len(data):
+        raise ValueError(f"Not enough data to split {symbol} for validation")
+
+    batch_size = int(os.getenv('TRAINING_BATCH_SIZE', '32'))
+
+    class JobCallback(tf.keras.callbacks.Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            logs = logs or {}
+            if progress:
+                progress({
+                    'epoch': epoch + 1,
+                    'epochs': epochs,
+                    'loss': float(logs.get('loss', 0.0)),
+                    'val_loss': float(logs['val_loss']) if 'val_loss' in logs else None
+                })
+            if should_stop and should_stop():
+                self.model.stop_training = True
+
+    model = build_model(sequence_length, len(FEATURE_COLUMNS))
+    history = model.fit(
+        data.tf_dataset(0, train_count, batch_size, shuffle=True),
+        validation_data=data.tf_dataset(train_count, None, batch_size),
+        epochs=epochs,
+        callbacks=[
+            JobCallback(),
+            tf.keras.callbacks.EarlyStopping(
+                monitor='val_loss', patience=10, restore_best_weights=True
+            )
+        ],
+        verbose=0
+    )
+
+    if should_stop and should_stop():
+        raise TrainingCancelled(f"Training cancelled for {symbol}")
+
+    # Avaliação na escala original, lote a lote
+    target = FEATURE_COLUMNS.index(TARGET)
+    y_pred, y_true, reference = [], [], []
+    for x, y in data.batches(train_count, None, batch_size):
+        y_pred.append(np.asarray(model.predict_on_batch(x)).reshape(-1))
+        y_true.append(y)
+        reference.append(x[:, -1, target])
+
+    metrics = evaluate(
+        scaler.inverse_target(np.concatenate(y_true)),
+        scaler.inverse_target(np.concatenate(y_pred)),
+        scaler.inverse_target(np.concatenate(reference))
+    )
+
+    seconds = time.perf_counter() - start
+    version = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+
+    _save(symbol, model, {
+        'symbol': symbol,
+        'version': version,
+        'model_name': MODEL_NAME,
+        'features': FEATURE_COLUMNS,
+        'target': TARGET,
+        'sequence_length': sequence_length,
+        'prediction_horizon': prediction_horizon,
+        'scaling': 'minmax',
+        'scaler': scaler.to_dict(),
+        'trained_at': datetime.utcnow().isoformat(),
+        'epochs_run': len(history.history['loss']),
+        'metrics': metrics
+    }, directory or models_dir())
+
+    _record_performance(
+        symbol, version, metrics, train_count,
+        len(data) - train_count, seconds, engine
+    )
+
+    logger.info(f"Trained {symbol} model {version} in {seconds:.1f}s: {metrics}")
+
+    return {
+        'symbol': symbol,
+        'model_version': version,
+        'epochs_run': len(history.history['loss']),
+        'training_samples': train_count,
+        'validation_samples': len(data) - train_count,
+        'training_time_seconds': round(seconds, 2),
+        'metrics': metrics
+    }
@@ -0,0 +1,539 @@
+# ml-service/training_jobs.py
+# Fila de jobs de treino (SQLite ou Redis) e worker com um processo por job
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from multiprocessing.connection import wait
+from typing import Dict, List, Optional
+
+import redis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Estados finais de um job
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+TRAINING_CONFIG_KEYS = ('sequence_length', 'prediction_horizon', 'epochs', 'validation_split')
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SQLiteJobStore:
+    """
+    Fila de jobs num ficheiro SQLite partilhado entre a API e o worker
+
+    Cada operação abre a sua conexão (seguro entre threads e processos);
+    o claim usa BEGIN IMMEDIATE para que dois workers nunca peguem no
+    mesmo job.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv(
+            'TRAINING_QUEUE_PATH',
+            os.path.join(os.path.dirname(__file__), 'data', 'training_jobs.sqlite')
+        )
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS training_jobs (
+                    id TEXT PRIMARY KEY,
+                    symbol TEXT NOT NULL,
+                    config TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    worker_pid INTEGER,
+                    worker_host TEXT,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_training_jobs_status
+                ON training_jobs (status, created_at)
+            """)
+            # Ficheiros criados antes da coluna worker_host
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(training_jobs)")}
+            if 'worker_host' not in columns:
+                conn.execute("ALTER TABLE training_jobs ADD COLUMN worker_host TEXT")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _decode(row) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        for field in ('config', 'progress', 'result'):
+            job[field] = json.loads(job[field]) if job[field] else None
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        return job
+
+    def enqueue(self, symbol: str, config: Dict) -> Dict:
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO training_jobs (id, symbol, config, status, created_at)
+                VALUES (?, ?, ?, 'queued', ?)
+                """,
+                (job_id, symbol, json.dumps(config), _now())
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM training_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._decode(row)
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        query = "SELECT * FROM training_jobs"
+        params: tuple = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        query += " ORDER BY created_at DESC LIMIT ?"
+
+        with self._connect() as conn:
+            rows = conn.execute(query, params + (limit,)).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def claim(self) -> Optional[Dict]:
+        """Passa o job mais antigo em fila para running (atómico)"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("""
+                    SELECT id FROM training_jobs
+                    WHERE status = 'queued'
+                    ORDER BY created_at
+                    LIMIT 1
+                """).fetchone()
+                if row is not None:
+                    conn.execute(
+                        """
+                        UPDATE training_jobs
+                        SET status = 'running', started_at = ?, worker_pid = ?, worker_host = ?
+                        WHERE id = ?
+                        """,
+                        (_now(), os.getpid(), socket.gethostname(), row['id'])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+
+        return self.get(row['id'])
+
+    def requeue(self, job_id: str):
+        """Devolve à fila um job interrompido (só se ainda estiver em running)"""
+        with self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE training_jobs
+                SET status = CASE WHEN cancel_requested = 1 THEN 'cancelled' ELSE 'queued' END,
+                    finished_at = CASE WHEN cancel_requested = 1 THEN ? ELSE NULL END,
+                    started_at = NULL, worker_pid = NULL, worker_host = NULL, progress = NULL
+                WHERE id = ? AND status = 'running'
+                """,
+                (_now(), job_id)
+            )
+
+    def update_progress(self, job_id: str, progress: Dict):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE training_jobs SET progress = ? WHERE id = ?",
+                (json.dumps(progress), job_id)
+            )
+
+    def finish(self, job_id: str, status: str, result: Optional[Dict] = None,
+               error: Optional[str] = None):
+        with self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE training_jobs
+                SET status = ?, result = ?, error = ?, finished_at = ?
+                WHERE id = ?
+                """,
+                (status, json.dumps(result) if result else None, error, _now(), job_id)
+            )
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """Jobs em fila são cancelados já; os em execução param na próxima época"""
+        with self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE training_jobs
+                SET cancel_requested = 1,
+                    status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                    finished_at = CASE WHEN status = 'queued' THEN ? ELSE finished_at END
+                WHERE id = ?
+                """,
+                (_now(), job_id)
+            )
+        return self.get(job_id)
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT cancel_requested FROM training_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return bool(row and row['cancel_requested'])
+
+
+# Pop da fila + passagem a running numa só operação (um crash entre as duas
+# perdia o job); jobs cancelados em fila são descartados
+CLAIM_SCRIPT = """
+while true do
+    local job_id = redis.call('RPOP', KEYS[1])
+    if not job_id then
+        return false
+    end
+    local key = ARGV[1] .. job_id
+    if redis.call('HGET', key, 'status') == 'queued' then
+        redis.call('HSET', key, 'status', 'running', 'started_at', ARGV[2],
+                   'worker_pid', ARGV[3], 'worker_host', ARGV[4])
+        return job_id
+    end
+end
+"""
+
+# Job interrompido de volta à frente da fila (ou cancelado, se pedido)
+REQUEUE_SCRIPT = """
+local key = ARGV[1] .. ARGV[2]
+if redis.call('HGET', key, 'status') ~= 'running' then
+    return 0
+end
+redis.call('HDEL', key, 'started_at', 'worker_pid', 'worker_host', 'progress')
+if redis.call('HGET', key, 'cancel_requested') == '1' then
+    redis.call('HSET', key, 'status', 'cancelled', 'finished_at', ARGV[3])
+else
+    redis.call('HSET', key, 'status', 'queued')
+    redis.call('RPUSH', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+
+class RedisJobStore:
+    """
+    Mesma interface sobre Redis (hash por job + lista como fila)
+
+    Útil quando API e worker correm em máquinas diferentes.
+    """
+
+    PREFIX = 'bulleye:train:'
+
+    def __init__(self, client: Optional[redis.Redis] = None):
+        self.redis = client or redis.Redis.from_url(
+            os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+            decode_responses=True
+        )
+        self.queue_key = self.PREFIX + 'queue'
+        self.index_key = self.PREFIX + 'jobs'
+        self._claim = self.redis.register_script(CLAIM_SCRIPT)
+        self._requeue = self.redis.register_script(REQUEUE_SCRIPT)
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.PREFIX}job:{job_id}"
+
+    @staticmethod
+    def _decode(data: Dict) -> Optional[Dict]:
+        if not data:
+            return None
+        job = {field: data.get(field) or None for field in (
+            'id', 'symbol', 'status', 'error', 'worker_host',
+            'created_at', 'started_at', 'finished_at'
+        )}
+        for field in ('config', 'progress', 'result'):
+            job[field] = json.loads(data[field]) if data.get(field) else None
+        job['cancel_requested'] = data.get('cancel_requested') == '1'
+        job['worker_pid'] = int(data['worker_pid']) if data.get('worker_pid') else None
+        return job
+
+    def enqueue(self, symbol: str, config: Dict) -> Dict:
+        job_id = uuid.uuid4().hex
+        created_at = _now()
+        pipe = self.redis.pipeline()
+        pipe.hset(self._key(job_id), mapping={
+            'id': job_id,
+            'symbol': symbol,
+            'config': json.dumps(config),
+            'status': 'queued',
+            'cancel_requested': '0',
+            'created_at': created_at
+        })
+        pipe.zadd(self.index_key, {job_id: time.time()})
+        pipe.lpush(self.queue_key, job_id)
+        pipe.execute()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self._decode(self.redis.hgetall(self._key(job_id)))
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        jobs = []
+        for job_id in self.redis.zrevrange(self.index_key, 0, -1):
+            job = self.get(job_id)
+            if job and (status is None or job['status'] == status):
+                jobs.append(job)
+                if len(jobs) >= limit:
+                    break
+        return jobs
+
+    def claim(self) -> Optional[Dict]:
+        job_id = self._claim(
+            keys=[self.queue_key],
+            args=[self._key(''), _now(), os.getpid(), socket.gethostname()]
+        )
+        return self.get(job_id) if job_id else None
+
+    def requeue(self, job_id: str):
+        self._requeue(keys=[self.queue_key], args=[self._key(''), job_id, _now()])
+
+    def update_progress(self, job_id: str, progress: Dict):
+        self.redis.hset(self._key(job_id), 'progress', json.dumps(progress))
+
+    def finish(self, job_id: str, status: str, result: Optional[Dict] = None,
+               error: Optional[str] = None):
+        self.redis.hset(self._key(job_id), mapping={
+            'status': status,
+            'result': json.dumps(result) if result else '',
+            'error': error or '',
+            'finished_at': _now()
+        })
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        key = self._key(job_id)
+        if not self.redis.exists(key):
+            return None
+        self.redis.hset(key, 'cancel_requested', '1')
+        if self.redis.hget(key, 'status') == 'queued':
+            self.redis.hset(key, mapping={'status': 'cancelled', 'finished_at': _now()})
+        return self.get(job_id)
+
+    def cancel_requested(self, job_id: str) -> bool:
+        return self.redis.hget(self._key(job_id), 'cancel_requested') == '1'
+
+
+def get_job_store():
+    """Store configurado por TRAINING_QUEUE (sqlite|redis)"""
+    backend = os.getenv('TRAINING_QUEUE', 'sqlite').lower()
+    if backend == 'redis':
+        return RedisJobStore()
+    if backend == 'sqlite':
+        return SQLiteJobStore()
+    raise ValueError(f"Unsupported training queue: {backend}")
+
+
+def _limit_threads(threads: int):
+    """Orçamento de threads do job (antes de o TensorFlow ser importado)"""
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                'TF_NUM_INTRAOP_THREADS'):
+        os.environ[var] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def run_job(job_id: str, threads: int):
+    """Executa um job num processo do pool (um processo novo por job)"""
+    logging.basicConfig(level=logging.INFO)
+    _limit_threads(threads)
+
+    from trainer import TrainingCancelled, train_model
+
+    store = get_job_store()
+    job = store.get(job_id)
+    config = {k: v for k, v in job['config'].items() if k in TRAINING_CONFIG_KEYS}
+
+    try:
+        result = train_model(
+            job['symbol'],
+            progress=lambda info: store.update_progress(job_id, info),
+            should_stop=lambda: store.cancel_requested(job_id),
+            **config
+        )
+        store.finish(job_id, 'completed', result=result)
+    except TrainingCancelled:
+        store.finish(job_id, 'cancelled')
+        logger.info(f"Training job {job_id} cancelled")
+    except Exception as e:
+        store.finish(job_id, 'failed', error=str(e))
+        logger.error(f"Training job {job_id} failed: {str(e)}")
+
+
+def _stop(signum, frame):
+    # docker stop (SIGTERM) segue o mesmo caminho que Ctrl+C
+    raise KeyboardInterrupt
+
+
+class TrainingWorker:
+    """
+    Consome a fila e treina até `processes` símbolos em paralelo
+
+    Cada job corre num processo próprio (spawn) limitado a `threads_per_job`
+    threads, para que vários treinos partilhem os cores sem sobre-subscrição.
+    Um processo que morre (OOM, segfault) só falha o seu job; ao parar
+    (SIGTERM/Ctrl+C) ou ao arrancar depois de um crash do worker, os jobs
+    interrompidos voltam à fila.
+    """
+
+    def __init__(
+        self,
+        store=None,
+        processes: Optional[int] = None,
+        threads_per_job: Optional[int] = None,
+        poll_interval: float = 2.0
+    ):
+        self.store = store or get_job_store()
+        self.threads_per_job = threads_per_job or int(
+            os.getenv('TRAINING_THREADS_PER_JOB', '2')
+        )
+        self.processes = processes or int(os.getenv(
+            'TRAINING_WORKER_PROCESSES',
+            str(max(1, (os.cpu_count() or 1) // self.threads_per_job))
+        ))
+        self.poll_interval = poll_interval
+        self.context = multiprocessing.get_context('spawn')
+
+    def recover(self) -> List[str]:
+        """
+        Devolve à fila os jobs em running deste host cujo worker já não existe
+
+        O próprio PID também conta como morto: num container o worker
+        reiniciado costuma ter o mesmo PID que o anterior.
+        """
+        host = socket.gethostname()
+        recovered = []
+        for job in self.store.list('running', limit=1000):
+            if job.get('worker_host') not in (None, host):
+                continue
+            if job['worker_pid'] == os.getpid() or not _pid_alive(job['worker_pid']):
+                self.store.requeue(job['id'])
+                recovered.append(job['id'])
+
+        if recovered:
+            logger.warning(f"Requeued {len(recovered)} interrupted training jobs")
+        return recovered
+
+    def _reap(self, job_id: str, exitcode: Optional[int]):
+        """Falha o job se o processo saiu sem o terminar"""
+        job = self.store.get(job_id)
+        if job and job['status'] == 'running':
+            self.store.finish(job_id, 'failed', error=f"Worker process died (exit code {exitcode})")
+            logger.error(f"Training job {job_id} crashed (exit code {exitcode})")
+
+    def run(self):
+        logger.info(
+            f"Training worker started: {self.processes} processes x "
+            f"{self.threads_per_job} threads"
+        )
+        signal.signal(signal.SIGTERM, _stop)
+        self.recover()
+
+        # sentinel do processo -> (processo, job)
+        running = {}
+
+        try:
+            while True:
+                while len(running) < self.processes:
+                    job = self.store.claim()
+                    if job is None:
+                        break
+                    logger.info(f"Starting training job {job['id']} ({job['symbol']})")
+                    process = self.context.Process(
+                        target=run_job,
+                        args=(job['id'], self.threads_per_job),
+                        name=f"train-{job['symbol']}"
+                    )
+                    try:
+                        process.start()
+                    except Exception:
+                        self.store.requeue(job['id'])
+                        raise
+                    running[process.sentinel] = (process, job['id'])
+
+                if not running:
+                    time.sleep(self.poll_interval)
+                    continue
+
+                for sentinel in wait(list(running), timeout=self.poll_interval):
+                    process, job_id = running.pop(sentinel)
+                    process.join()
+                    self._reap(job_id, process.exitcode)
+        except KeyboardInterrupt:
+            logger.info("Training worker stopped")
+        finally:
+            for process, _ in running.values():
+                process.terminate()
+            for process, job_id in running.values():
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+                # Interrompido a meio: volta à fila para o próximo arranque
+                self.store.requeue(job_id)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="BullEye training worker")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="Jobs em paralelo (default: cores / threads por job)")
+    parser.add_argument('--threads-per-job', type=int, default=None,
+                        help="Threads do TensorFlow por job")
+    parser.add_argument('--poll-interval', type=float, default=2.0)
+    args = parser.parse_args()
+
+    TrainingWorker(
+        processes=args.processes,
+        threads_per_job=args.threads_per_job,
+        poll_interval=args.poll_interval
+    ).run()
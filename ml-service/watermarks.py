@@ -0,0 +1,93 @@
+# ml-service/watermarks.py
+# High-water marks por (símbolo, intervalo) para coleta incremental
+import logging
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS collection_watermarks (
+        symbol VARCHAR(20) NOT NULL,
+        interval VARCHAR(8) NOT NULL,
+        last_time TIMESTAMPTZ NOT NULL,
+        updated_at TIMESTAMPTZ DEFAULT NOW(),
+        PRIMARY KEY (symbol, interval)
+    )
+"""
+
+
+class WatermarkStore:
+    """Guarda a última barra coletada por (símbolo, intervalo)"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._table_ready = False
+
+    def _ensure_table(self):
+        if self._table_ready:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text(CREATE_TABLE))
+        self._table_ready = True
+
+    def get_many(self, symbols: List[str], interval: str) -> Dict[str, datetime]:
+        """
+        Devolve {símbolo: última barra} para os símbolos com watermark
+
+        Símbolos sem watermark não aparecem no resultado.
+        """
+        if not symbols:
+            return {}
+
+        self._ensure_table()
+        with self.engine.connect() as conn:
+            result = conn.execute(
+                text("""
+                    SELECT symbol, last_time
+                    FROM collection_watermarks
+                    WHERE interval = :interval
+                    AND symbol = ANY(:symbols)
+                """),
+                {'interval': interval, 'symbols': list(symbols)}
+            )
+            return {row[0]: row[1] for row in result}
+
+    def get_details(self, symbols: List[str], interval: str) -> Dict[str, Tuple[datetime, datetime]]:
+        """{símbolo: (última barra, quando foi gravada)} para o planeamento de coletas"""
+        if not symbols:
+            return {}
+
+        self._ensure_table()
+        with self.engine.connect() as conn:
+            result = conn.execute(
+                text("""
+                    SELECT symbol, last_time, updated_at
+                    FROM collection_watermarks
+                    WHERE interval = :interval
+                    AND symbol = ANY(:symbols)
+                """),
+                {'interval': interval, 'symbols': list(symbols)}
+            )
+            return {row[0]: (row[1], row[2]) for row in result}
+
+    def update(self, symbol: str, interval: str, last_time: datetime):
+        """Avança a watermark (nunca recua)"""
+        self._ensure_table()
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO collection_watermarks (symbol, interval, last_time)
+                    VALUES (:symbol, :interval, :last_time)
+                    ON CONFLICT (symbol, interval) DO UPDATE
+                    SET last_time = GREATEST(
+                            collection_watermarks.last_time,
+                            EXCLUDED.last_time
+                        ),
+                        updated_at = NOW()
+                """),
+                {'symbol': symbol, 'interval': interval, 'last_time': last_time}
+            )
+        logger.debug(f"Watermark {symbol}/{interval} -> {last_time}")